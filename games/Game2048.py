@@ -1,20 +1,33 @@
 import pygame
 import random
 import sys
-import math
 
-# Initialize pygame
-pygame.init()
+import ai2048
+import replay
+import scores
+import spectate
+import startup
+from loop import GameLoop
+from profiler import PROFILER, profile_path, start_export
+from game2048_logic import Game2048Logic, GRID_SIZE
+from text_cache import render_text
 
 # Constants
 WIDTH, HEIGHT = 500, 600
-GRID_SIZE = 4
 CELL_SIZE = 100
 CELL_PADDING = 10
 GRID_WIDTH = GRID_SIZE * CELL_SIZE + (GRID_SIZE + 1) * CELL_PADDING
 GRID_HEIGHT = GRID_WIDTH
 GRID_X = (WIDTH - GRID_WIDTH) // 2
 GRID_Y = 100
+GRID_AREA = GRID_WIDTH  # Every board size is scaled into the 4x4 board's space
+AUTOPLAY_BUDGET_MS = 50  # Thinking time per move when the AI plays
+
+# Font sizes (pygame's default font)
+FONT_TITLE = 72
+FONT_LARGE = 48
+FONT_MEDIUM = 36
+FONT_SMALL = 24
 
 # Colors
 BACKGROUND = (187, 173, 160)
@@ -48,205 +61,143 @@ TEXT_COLORS = {
     4096: WHITE, 8192: WHITE
 }
 
-class Game2048:
-    def __init__(self):
-        self.board = [[0 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-        self.score = 0
-        self.best_score = 0
-        self.game_won = False
-        self.game_over = False
-        self.font_large = pygame.font.Font(None, 48)
-        self.font_medium = pygame.font.Font(None, 36)
-        self.font_small = pygame.font.Font(None, 24)
-        self.font_title = pygame.font.Font(None, 72)
-        
-        # Add two initial tiles
-        self.add_random_tile()
-        self.add_random_tile()
+# Instructions shown under the board
+INSTRUCTIONS = [
+    "Use arrow keys to move tiles",
+    "When two tiles with the same number touch,",
+    "they merge into one!",
+    "Press R to restart at any time, A to toggle autoplay"
+]
 
-    def add_random_tile(self):
-        """Add a random tile (2 or 4) to an empty cell"""
-        empty_cells = []
-        for i in range(GRID_SIZE):
-            for j in range(GRID_SIZE):
-                if self.board[i][j] == 0:
-                    empty_cells.append((i, j))
-        
-        if empty_cells:
-            i, j = random.choice(empty_cells)
-            self.board[i][j] = 2 if random.random() < 0.9 else 4
+def board_layout(size):
+    """Return (cell size, cell padding, grid width) fitting a size x size board in the 4x4 board's space"""
+    if size == GRID_SIZE:
+        return CELL_SIZE, CELL_PADDING, GRID_WIDTH
+    padding = max(2, CELL_PADDING * GRID_SIZE // size)
+    cell_size = (GRID_AREA - (size + 1) * padding) // size
+    return cell_size, padding, size * cell_size + (size + 1) * padding
 
-    def move_left(self):
-        """Move and merge tiles to the left"""
-        moved = False
-        for i in range(GRID_SIZE):
-            # Extract non-zero values
-            row = [self.board[i][j] for j in range(GRID_SIZE) if self.board[i][j] != 0]
-            
-            # Merge adjacent equal values
-            merged_row = []
-            j = 0
-            while j < len(row):
-                if j < len(row) - 1 and row[j] == row[j + 1]:
-                    # Merge tiles
-                    merged_value = row[j] * 2
-                    merged_row.append(merged_value)
-                    self.score += merged_value
-                    if merged_value == 2048 and not self.game_won:
-                        self.game_won = True
-                    j += 2
-                else:
-                    merged_row.append(row[j])
-                    j += 1
-            
-            # Pad with zeros
-            merged_row.extend([0] * (GRID_SIZE - len(merged_row)))
-            
-            # Check if row changed
-            if merged_row != [self.board[i][j] for j in range(GRID_SIZE)]:
-                moved = True
-            
-            # Update board
-            for j in range(GRID_SIZE):
-                self.board[i][j] = merged_row[j]
+def draw_tile(surface, value, x, y, cell_size=CELL_SIZE):
+    """Draw a single tile from scratch"""
+    # Get colors
+    bg_color = TILE_COLORS.get(value, TILE_COLORS[8192]) if value != 0 else EMPTY_CELL
+    text_color = TEXT_COLORS.get(value, WHITE) if value != 0 else DARK_GRAY
+    
+    # Draw cell background
+    cell_rect = pygame.Rect(x, y, cell_size, cell_size)
+    pygame.draw.rect(surface, bg_color, cell_rect, border_radius=6 * cell_size // CELL_SIZE)
+    
+    # Draw text if cell has value
+    if value != 0:
+        # Choose font size based on number of digits
+        if value < 100:
+            size = FONT_LARGE
+        elif value < 1000:
+            size = FONT_MEDIUM
+        else:
+            size = FONT_SMALL
+        if cell_size != CELL_SIZE:
+            size = max(8, size * cell_size // CELL_SIZE)
         
-        return moved
+        text = render_text(None, size, str(value), text_color)
+        text_rect = text.get_rect(center=cell_rect.center)
+        surface.blit(text, text_rect)
 
-    def move_right(self):
-        """Move and merge tiles to the right"""
-        # Reverse each row, move left, then reverse again
-        for i in range(GRID_SIZE):
-            self.board[i].reverse()
-        
-        moved = self.move_left()
-        
-        for i in range(GRID_SIZE):
-            self.board[i].reverse()
-        
-        return moved
+class TileAtlas:
+    """Pre-composited tile surfaces, one per value
 
-    def move_up(self):
-        """Move and merge tiles up"""
-        # Transpose, move left, transpose back
-        self.transpose()
-        moved = self.move_left()
-        self.transpose()
-        return moved
+    Tiles up to 8192 are built up front from TILE_COLORS/TEXT_COLORS; larger
+    values are built the first time they appear. Each tile includes the grid
+    color behind its rounded corners, so drawing it is a single opaque blit.
+    """
 
-    def move_down(self):
-        """Move and merge tiles down"""
-        # Transpose, move right, transpose back
-        self.transpose()
-        moved = self.move_right()
-        self.transpose()
-        return moved
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.tiles = {}
+        for value in [0] + list(TILE_COLORS):
+            self.tiles[value] = self.build(value)
 
-    def transpose(self):
-        """Transpose the board matrix"""
-        self.board = [[self.board[j][i] for j in range(GRID_SIZE)] for i in range(GRID_SIZE)]
+    def build(self, value):
+        tile = pygame.Surface((self.cell_size, self.cell_size)).convert()
+        tile.fill(DARK_GRAY)
+        draw_tile(tile, value, 0, 0, self.cell_size)
+        return tile
 
-    def can_move(self):
-        """Check if any move is possible"""
-        # Check for empty cells
-        for i in range(GRID_SIZE):
-            for j in range(GRID_SIZE):
-                if self.board[i][j] == 0:
-                    return True
-        
-        # Check for possible merges
-        for i in range(GRID_SIZE):
-            for j in range(GRID_SIZE):
-                current = self.board[i][j]
-                # Check right neighbor
-                if j < GRID_SIZE - 1 and self.board[i][j + 1] == current:
-                    return True
-                # Check bottom neighbor
-                if i < GRID_SIZE - 1 and self.board[i + 1][j] == current:
-                    return True
-        
-        return False
+    def get(self, value):
+        tile = self.tiles.get(value)
+        if tile is None:
+            tile = self.tiles[value] = self.build(value)
+        return tile
 
-    def make_move(self, direction):
-        """Make a move in the specified direction"""
-        if self.game_over:
-            return
+class Game2048(Game2048Logic):
+    def __init__(self, seed=None, size=GRID_SIZE):
+        super().__init__(seed, size)
+        self.cell_size, self.cell_padding, self.grid_width = board_layout(size)
+        self.grid_x = (WIDTH - self.grid_width) // 2
+        # Cached drawing layers, built on the first draw
+        self.atlas = None
+        self.background = None
+        self.instructions = None
+        self.dimmer = None
+        self.drawn_state = None
+
+    def build_layers(self):
+        """Build the tile atlas and the static background, instructions and overlay layers"""
+        self.atlas = TileAtlas(self.cell_size)
         
-        moved = False
-        if direction == 'left':
-            moved = self.move_left()
-        elif direction == 'right':
-            moved = self.move_right()
-        elif direction == 'up':
-            moved = self.move_up()
-        elif direction == 'down':
-            moved = self.move_down()
+        # Background with title and empty grid
+        self.background = pygame.Surface((WIDTH, HEIGHT)).convert()
+        self.background.fill(BACKGROUND)
+        title_text = render_text(None, FONT_TITLE, "2048", DARK_GRAY)
+        self.background.blit(title_text, (50, 20))
+        grid_rect = pygame.Rect(self.grid_x, GRID_Y, self.grid_width, self.grid_width)
+        pygame.draw.rect(self.background, DARK_GRAY, grid_rect, border_radius=6)
         
-        if moved:
-            self.add_random_tile()
-            if not self.can_move():
-                self.game_over = True
+        # Instructions are drawn last, over the board and any overlay
+        labels = [render_text(None, FONT_SMALL, instruction, DARK_GRAY) for instruction in INSTRUCTIONS]
+        width = max(label.get_width() for label in labels)
+        self.instructions = pygame.Surface((width, 20 * len(labels) + 4), pygame.SRCALPHA)
+        for i, label in enumerate(labels):
+            self.instructions.blit(label, (0, i * 20))
         
-        # Update best score
-        if self.score > self.best_score:
-            self.best_score = self.score
+        # Half-transparent black for the game over and win overlays
+        self.dimmer = pygame.Surface((WIDTH, HEIGHT))
+        self.dimmer.set_alpha(128)
+        self.dimmer.fill(BLACK)
 
-    def reset(self):
-        """Reset the game"""
-        self.board = [[0 for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-        self.score = 0
-        self.game_won = False
-        self.game_over = False
-        self.add_random_tile()
-        self.add_random_tile()
+    def invalidate(self):
+        """Force the next draw to repaint even if the game has not changed"""
+        self.drawn_state = None
 
     def draw_cell(self, surface, value, x, y):
         """Draw a single cell"""
-        # Get colors
-        bg_color = TILE_COLORS.get(value, TILE_COLORS[8192]) if value != 0 else EMPTY_CELL
-        text_color = TEXT_COLORS.get(value, WHITE) if value != 0 else DARK_GRAY
-        
-        # Draw cell background
-        cell_rect = pygame.Rect(x, y, CELL_SIZE, CELL_SIZE)
-        pygame.draw.rect(surface, bg_color, cell_rect, border_radius=6)
-        
-        # Draw text if cell has value
-        if value != 0:
-            # Choose font size based on number of digits
-            if value < 100:
-                font = self.font_large
-            elif value < 1000:
-                font = self.font_medium
-            else:
-                font = self.font_small
-            
-            text = font.render(str(value), True, text_color)
-            text_rect = text.get_rect(center=cell_rect.center)
-            surface.blit(text, text_rect)
+        surface.blit(self.atlas.get(value), (x, y))
 
     def draw(self, surface):
-        """Draw the entire game"""
-        surface.fill(BACKGROUND)
+        """Draw the entire game, returning False if nothing changed since the last draw"""
+        state = (self.bits, self.score, self.best_score, self.game_won, self.game_over)
+        if state == self.drawn_state:
+            return False
+        self.drawn_state = state
+        if self.atlas is None:
+            self.build_layers()
         
-        # Draw title
-        title_text = self.font_title.render("2048", True, DARK_GRAY)
-        surface.blit(title_text, (50, 20))
+        surface.blit(self.background, (0, 0))
         
         # Draw scores
-        score_text = self.font_medium.render(f"Score: {self.score}", True, DARK_GRAY)
-        best_text = self.font_medium.render(f"Best: {self.best_score}", True, DARK_GRAY)
+        score_text = render_text(None, FONT_MEDIUM, f"Score: {self.score}", DARK_GRAY)
+        best_text = render_text(None, FONT_MEDIUM, f"Best: {self.best_score}", DARK_GRAY)
         surface.blit(score_text, (250, 30))
         surface.blit(best_text, (250, 60))
         
-        # Draw grid background
-        grid_rect = pygame.Rect(GRID_X, GRID_Y, GRID_WIDTH, GRID_HEIGHT)
-        pygame.draw.rect(surface, DARK_GRAY, grid_rect, border_radius=6)
-        
         # Draw cells
-        for i in range(GRID_SIZE):
-            for j in range(GRID_SIZE):
-                x = GRID_X + CELL_PADDING + j * (CELL_SIZE + CELL_PADDING)
-                y = GRID_Y + CELL_PADDING + i * (CELL_SIZE + CELL_PADDING)
-                self.draw_cell(surface, self.board[i][j], x, y)
+        size = self.size
+        step = self.cell_size + self.cell_padding
+        for index, exponent in enumerate(self.backend.exponents(self.bits)):
+            i, j = divmod(index, size)
+            x = self.grid_x + self.cell_padding + j * step
+            y = GRID_Y + self.cell_padding + i * step
+            self.draw_cell(surface, 1 << exponent if exponent else 0, x, y)
         
         # Draw game over or win message
         if self.game_over:
@@ -255,26 +206,15 @@ class Game2048:
             self.draw_overlay(surface, "You Win!", "Press C to continue or R to restart")
         
         # Draw instructions
-        instructions = [
-            "Use arrow keys to move tiles",
-            "When two tiles with the same number touch,",
-            "they merge into one!",
-            "Press R to restart at any time"
-        ]
-        
-        for i, instruction in enumerate(instructions):
-            text = self.font_small.render(instruction, True, DARK_GRAY)
-            surface.blit(text, (20, HEIGHT - 80 + i * 20))
+        surface.blit(self.instructions, (20, HEIGHT - 80))
+        return True
 
     def draw_overlay(self, surface, title, subtitle):
         """Draw game over or win overlay"""
-        overlay = pygame.Surface((WIDTH, HEIGHT))
-        overlay.set_alpha(128)
-        overlay.fill(BLACK)
-        surface.blit(overlay, (0, 0))
+        surface.blit(self.dimmer, (0, 0))
         
-        title_text = self.font_title.render(title, True, WHITE)
-        subtitle_text = self.font_medium.render(subtitle, True, WHITE)
+        title_text = render_text(None, FONT_TITLE, title, WHITE)
+        subtitle_text = render_text(None, FONT_MEDIUM, subtitle, WHITE)
         
         title_rect = title_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
         subtitle_rect = subtitle_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 20))
@@ -282,40 +222,98 @@ class Game2048:
         surface.blit(title_text, title_rect)
         surface.blit(subtitle_text, subtitle_rect)
 
-def main():
+# Timed while the profiler is on
+PROFILER.watch(Game2048Logic, 'make_move')
+PROFILER.watch(Game2048Logic, 'apply_move')
+for name in ('draw', 'draw_cell', 'draw_overlay'):
+    PROFILER.watch(Game2048, name, f'Game2048.{name}')
+PROFILER.watch(sys.modules[__name__], 'draw_tile')
+
+def main(record=None, profile=None, size=GRID_SIZE, spectate_port=None):
+    # Plays on a size x size board, recording a replay and exporting profiler
+    # metrics to the given files if any, and serving a spectator feed on the
+    # given port if any
+    startup.init_pygame()
+    if profile:
+        start_export(profile)
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("2048")
-    clock = pygame.time.Clock()
     
-    game = Game2048()
+    seed = random.getrandbits(64)
+    game = Game2048(seed, size)
+    recorder = replay.recorder(record, '2048', game, seed, 60)
+    feed = spectate.broadcaster(spectate_port, '2048', game)
+    sessions = scores.SessionTracker(scores.open_store(), '2048', game)
+    game.best_score = sessions.store.best('2048', sessions.variant)
+    autoplay = False
+    # Nothing changes between key presses, so the loop sleeps until the next one
+    loop = GameLoop(render_rate=60)
     
     running = True
     while running:
-        for event in pygame.event.get():
+        recorder.tick()
+        feed.publish()
+        PROFILER.frame()
+        for event in loop.events():
             if event.type == pygame.QUIT:
                 running = False
             
+            elif event.type == pygame.VIDEOEXPOSE:
+                game.invalidate()
+            
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r:
-                    game.reset()
+                    sessions.finish()
+                    recorder.apply('reset')
+                    sessions.start()
+                elif event.key == pygame.K_F3:
+                    # Toggle the profiler overlay
+                    PROFILER.toggle()
+                    game.invalidate()
+                elif event.key == pygame.K_a and size == GRID_SIZE:
+                    # Toggle the AI autoplayer (it only plays 4x4 boards)
+                    autoplay = not autoplay
+                    if not autoplay:
+                        pygame.display.set_caption("2048")
                 elif event.key == pygame.K_c and game.game_won:
-                    game.game_won = False  # Continue playing after winning
+                    recorder.apply('continue')  # Continue playing after winning
                 elif not game.game_over and not game.game_won:
                     if event.key == pygame.K_LEFT:
-                        game.make_move('left')
+                        recorder.apply('left')
                     elif event.key == pygame.K_RIGHT:
-                        game.make_move('right')
+                        recorder.apply('right')
                     elif event.key == pygame.K_UP:
-                        game.make_move('up')
+                        recorder.apply('up')
                     elif event.key == pygame.K_DOWN:
-                        game.make_move('down')
+                        recorder.apply('down')
+        PROFILER.lap('events')
+        
+        if autoplay and not game.game_over and not game.game_won:
+            move = ai2048.best_move(game.bits, AUTOPLAY_BUDGET_MS)
+            if move is not None:
+                recorder.apply(move)
+            stats = ai2048.report()
+            pygame.display.set_caption(
+                f"2048 - autoplay: depth {stats['depth']}, "
+                f"{stats['nodes_per_sec'] / 1000:.0f}k nodes/s, "
+                f"{stats['cache_hit_rate']:.0%} cache hits"
+            )
+        sessions.update()
+        PROFILER.lap('simulation')
         
-        game.draw(screen)
-        pygame.display.flip()
-        clock.tick(60)
+        if loop.render_due():
+            if game.draw(screen):
+                PROFILER.draw_overlay(screen)
+                pygame.display.flip()
+            else:
+                PROFILER.show_overlay(screen)
+            PROFILER.lap('draw')
+        loop.wait(idle=not autoplay and not PROFILER.overlay)
     
+    recorder.close()
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    size = replay.size_option()
+    main(replay.record_path(), profile_path(), size[0] if size else GRID_SIZE, spectate.spectate_port())
\ No newline at end of file
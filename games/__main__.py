@@ -0,0 +1,58 @@
+import time
+
+STARTED = time.perf_counter()
+
+import os
+import runpy
+import sys
+
+# Single entry point for the games and tools:
+#
+#   python -m games tetris --size 12x24
+#   python -m games 2048 --startup-timing
+#
+# Only the chosen module is imported, and run as if started directly, so
+# the launcher adds nothing to any game's cold start. --startup-timing
+# prints how long the imports, pygame's init and the first frame took.
+
+COMMANDS = {
+    '2048': 'Game2048',
+    'tetris': 'tetris',
+    'snake': 'snake_game',
+    'replay': 'replay',
+    'server': 'tetris_server',
+    'spectate': 'spectate',
+    'scores': 'scores',
+    'tournament': 'tournament',
+    'benchmark': 'benchmark',
+}
+
+
+def usage():
+    print("usage: python -m games COMMAND [--startup-timing] [ARGS...]\n\ncommands: "
+          + ", ".join(COMMANDS), file=sys.stderr)
+    return 2
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in COMMANDS:
+        return usage()
+    module = COMMANDS[args[0]]
+    args = args[1:]
+
+    # The modules import each other by their plain names
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if '--startup-timing' in args:
+        args.remove('--startup-timing')
+        from startup import STARTUP
+        STARTUP.restart(STARTED)
+        STARTUP.on_first_frame = lambda timer: print(timer.report(), file=sys.stderr)
+
+    sys.argv = [module] + args
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
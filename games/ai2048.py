@@ -0,0 +1,223 @@
+import time
+
+import bitboard2048
+from bitboard2048 import ROW_MASK, CELL_MASK, transpose
+
+# Expectimax autoplayer for 2048 on top of the bitboard2048 move tables.
+# Max nodes try every move, chance nodes average over every empty cell
+# getting a 2 (probability 0.9) or a 4 (probability 0.1), exactly as
+# add_random_tile places them. Leaves are scored by a heuristic summed over
+# rows and columns from a precomputed 65,536-entry table.
+
+# Heuristic weights
+SCORE_LOST_PENALTY = 200000.0
+SCORE_MONOTONICITY_POWER = 4.0
+SCORE_MONOTONICITY_WEIGHT = 47.0
+SCORE_SUM_POWER = 3.5
+SCORE_SUM_WEIGHT = 11.0
+SCORE_MERGES_WEIGHT = 700.0
+SCORE_EMPTY_WEIGHT = 270.0
+
+# Moves in the order they are tried, so ties prefer the earlier one
+MOVE_ORDER = ('left', 'up', 'right', 'down')
+
+_HEURISTIC_TABLE = None
+
+
+def _row_heuristic(row):
+    cells = [(row >> (4 * j)) & CELL_MASK for j in range(bitboard2048.BOARD_SIZE)]
+    total = 0.0
+    empty = 0
+    merges = 0
+    previous = 0
+    counter = 0
+    for rank in cells:
+        total += rank ** SCORE_SUM_POWER
+        if rank == 0:
+            empty += 1
+        elif previous == rank:
+            counter += 1
+        else:
+            if counter > 0:
+                merges += 1 + counter
+            counter = 0
+            previous = rank
+    if counter > 0:
+        merges += 1 + counter
+
+    monotonicity_left = 0.0
+    monotonicity_right = 0.0
+    for j in range(1, len(cells)):
+        a = cells[j - 1] ** SCORE_MONOTONICITY_POWER
+        b = cells[j] ** SCORE_MONOTONICITY_POWER
+        if cells[j - 1] > cells[j]:
+            monotonicity_left += a - b
+        else:
+            monotonicity_right += b - a
+
+    return (
+        SCORE_LOST_PENALTY
+        + SCORE_EMPTY_WEIGHT * empty
+        + SCORE_MERGES_WEIGHT * merges
+        - SCORE_MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right)
+        - SCORE_SUM_WEIGHT * total
+    )
+
+
+def heuristic_table():
+    """Return the per-row heuristic table, building it on first use"""
+    global _HEURISTIC_TABLE
+    if _HEURISTIC_TABLE is None:
+        _HEURISTIC_TABLE = [_row_heuristic(row) for row in range(ROW_MASK + 1)]
+    return _HEURISTIC_TABLE
+
+
+def evaluate(bits):
+    """Heuristic value of a board: the row table applied to every row and column"""
+    table = heuristic_table()
+    columns = transpose(bits)
+    return (
+        table[bits & ROW_MASK] + table[(bits >> 16) & ROW_MASK]
+        + table[(bits >> 32) & ROW_MASK] + table[bits >> 48]
+        + table[columns & ROW_MASK] + table[(columns >> 16) & ROW_MASK]
+        + table[(columns >> 32) & ROW_MASK] + table[columns >> 48]
+    )
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class Expectimax:
+    """Depth-limited expectimax search with a transposition table
+
+    Searches deepen one move at a time until the time budget runs out, and
+    the deepest completed search decides the move. Chance branches whose
+    probability falls below min_probability are cut off and scored by the
+    heuristic. The table maps a board to its (depth, value) and evicts the
+    oldest entries once it holds table_size boards.
+    """
+
+    def __init__(self, max_depth=6, min_probability=0.0001, table_size=1 << 20):
+        heuristic_table()
+        self.max_depth = max_depth
+        self.min_probability = min_probability
+        self.table_size = table_size
+        self.table = {}
+        self.moves = [bitboard2048.MOVES[name] for name in MOVE_ORDER]
+        self.nodes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.elapsed = 0.0
+        self.depth_reached = 0
+        self.deadline = None
+
+    def best_move(self, board, time_budget_ms=100):
+        """Return the best direction for a board ('left', 'up', ...), or None if no move is possible
+
+        The board may be a bitboard2048 integer or a list-of-lists of tile values.
+        """
+        if not isinstance(board, int):
+            board = bitboard2048.pack(board)
+        start = time.perf_counter()
+        self.nodes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.depth_reached = 0
+
+        children = []
+        for name, move in zip(MOVE_ORDER, self.moves):
+            moved = move(board)[0]
+            if moved != board:
+                children.append((name, moved))
+        if not children:
+            self.elapsed = time.perf_counter() - start
+            return None
+
+        best = children[0][0]
+        self.deadline = start + time_budget_ms / 1000.0
+        for depth in range(1, self.max_depth + 1):
+            try:
+                values = [(self.chance_node(moved, depth, 1.0), name) for name, moved in children]
+            except _OutOfTime:
+                break
+            best = max(values, key=lambda item: item[0])[1]
+            self.depth_reached = depth
+            # Only the first depth is allowed to run over the budget
+            if time.perf_counter() >= self.deadline:
+                break
+        self.deadline = None
+        self.elapsed = time.perf_counter() - start
+        return best
+
+    def max_node(self, board, depth, probability):
+        best = 0.0
+        for move in self.moves:
+            moved = move(board)[0]
+            if moved != board:
+                value = self.chance_node(moved, depth, probability)
+                if value > best:
+                    best = value
+        return best
+
+    def chance_node(self, board, depth, probability):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and self.deadline is not None and self.depth_reached:
+            if time.perf_counter() >= self.deadline:
+                raise _OutOfTime
+        if depth == 0 or probability < self.min_probability:
+            return evaluate(board)
+
+        table = self.table
+        self.lookups += 1
+        entry = table.get(board)
+        if entry is not None and entry[0] >= depth:
+            self.hits += 1
+            return entry[1]
+
+        empty = []
+        bits = board
+        for shift in range(0, 64, 4):
+            if not bits & CELL_MASK:
+                empty.append(shift)
+            bits >>= 4
+        count = len(empty)
+        total = 0.0
+        two = probability * 0.9 / count
+        four = probability * 0.1 / count
+        for shift in empty:
+            total += 0.9 * self.max_node(board | (1 << shift), depth - 1, two)
+            total += 0.1 * self.max_node(board | (2 << shift), depth - 1, four)
+        value = total / count
+
+        if len(table) >= self.table_size:
+            del table[next(iter(table))]
+        table[board] = (depth, value)
+        return value
+
+    def report(self):
+        """Statistics of the last best_move call"""
+        return {
+            'nodes': self.nodes,
+            'seconds': self.elapsed,
+            'nodes_per_sec': self.nodes / self.elapsed if self.elapsed else 0.0,
+            'cache_hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+            'depth': self.depth_reached,
+            'table_size': len(self.table),
+        }
+
+
+_SOLVER = None
+
+
+def best_move(board, time_budget_ms=100):
+    """Return the best direction for a board using a shared Expectimax solver"""
+    global _SOLVER
+    if _SOLVER is None:
+        _SOLVER = Expectimax()
+    return _SOLVER.best_move(board, time_budget_ms)
+
+
+def report():
+    """Statistics of the last best_move call on the shared solver"""
+    return _SOLVER.report() if _SOLVER is not None else {}
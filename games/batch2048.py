@@ -0,0 +1,142 @@
+import numpy as np
+
+import bitboard2048
+from game2048_logic import ACTIONS, WIN_MASK
+
+# Many independent 2048 games stepped at once with NumPy.
+# Boards are an (N, 4, 4) uint8 array of log2 exponents (0 = empty). Rows are
+# packed into 16-bit indices and moved with the same lookup tables as
+# bitboard2048, so results match Game2048Logic.make_move exactly.
+
+LEFT, RIGHT, UP, DOWN = range(len(ACTIONS))
+
+# Row lookup tables, indexed first by table (0 = left, 1 = right)
+_ROW_TABLES = np.array([bitboard2048.ROW_LEFT, bitboard2048.ROW_RIGHT], dtype=np.uint16)
+_ROW_SCORE = np.array(bitboard2048.ROW_SCORE, dtype=np.int64)
+_ROW_MERGED = np.array(bitboard2048.ROW_MERGED, dtype=np.uint16)
+_NIBBLE_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+_ROW_SHIFTS = np.array([0, 16, 32, 48], dtype=np.uint64)
+
+
+def rows_to_index(rows):
+    """Pack the last axis (4 exponents) into a 16-bit row index"""
+    rows = rows.astype(np.uint16)
+    return rows[..., 0] | (rows[..., 1] << 4) | (rows[..., 2] << 8) | (rows[..., 3] << 12)
+
+
+def index_to_rows(index):
+    """Unpack 16-bit row indices into a trailing axis of 4 exponents"""
+    return ((index[..., None] >> _NIBBLE_SHIFTS) & 0xF).astype(np.uint8)
+
+
+def to_bitboards(boards):
+    """Pack (N, 4, 4) exponent boards into an array of bitboard2048 integers"""
+    rows = rows_to_index(boards).astype(np.uint64)
+    return np.bitwise_or.reduce(rows << _ROW_SHIFTS, axis=1)
+
+
+def from_bitboards(bits):
+    """Unpack an array of bitboard2048 integers into (N, 4, 4) exponent boards"""
+    bits = np.asarray(bits, dtype=np.uint64)
+    rows = ((bits[:, None] >> _ROW_SHIFTS) & np.uint64(0xFFFF)).astype(np.uint16)
+    return index_to_rows(rows)
+
+
+def move_boards(boards, actions):
+    """Move every board in its action's direction, returning (boards, score, merged)"""
+    vertical = (actions == UP) | (actions == DOWN)
+    table = ((actions == RIGHT) | (actions == DOWN)).astype(np.intp)
+
+    # Turn columns into rows for up/down so every move slides rows
+    oriented = np.where(vertical[:, None, None], boards.transpose(0, 2, 1), boards)
+    index = rows_to_index(oriented)
+    moved = index_to_rows(_ROW_TABLES[table[:, None], index])
+    moved = np.where(vertical[:, None, None], moved.transpose(0, 2, 1), moved)
+
+    score = _ROW_SCORE[index].sum(axis=1)
+    merged = np.bitwise_or.reduce(_ROW_MERGED[index], axis=1)
+    return moved, score, merged
+
+
+def can_move(boards):
+    """Check which boards have any move left"""
+    if not len(boards):
+        return np.zeros(0, dtype=bool)
+    rows = rows_to_index(boards)
+    cols = rows_to_index(boards.transpose(0, 2, 1))
+    has_empty = (boards == 0).any(axis=(1, 2))
+    rows_slide = (_ROW_TABLES[0][rows] != rows).any(axis=1)
+    cols_slide = (_ROW_TABLES[0][cols] != cols).any(axis=1)
+    return has_empty | rows_slide | cols_slide
+
+
+def add_random_tiles(boards, rng, mask=None):
+    """Add a random tile (2 or 4) to an empty cell of each selected board, in place"""
+    flat = boards.reshape(len(boards), -1)
+    empty = flat == 0
+    counts = empty.sum(axis=1)
+    selected = counts > 0
+    if mask is not None:
+        selected &= mask
+    rows = np.flatnonzero(selected)
+    if not len(rows):
+        return
+
+    # Pick the k-th empty cell of each board uniformly at random
+    k = (rng.random(len(rows)) * counts[rows]).astype(np.int64)
+    cells = np.argmax(empty[rows].cumsum(axis=1) > k[:, None], axis=1)
+    values = np.where(rng.random(len(rows)) < 0.9, 1, 2).astype(np.uint8)
+    flat[rows, cells] = values
+
+
+class Batch2048:
+    def __init__(self, num_boards, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((num_boards, bitboard2048.BOARD_SIZE, bitboard2048.BOARD_SIZE), dtype=np.uint8)
+        self.scores = np.zeros(num_boards, dtype=np.int64)
+        self.game_won = np.zeros(num_boards, dtype=bool)
+        self.game_over = np.zeros(num_boards, dtype=bool)
+        self.reset()
+
+    def __len__(self):
+        return len(self.boards)
+
+    def reset(self, seed=None, mask=None):
+        """Reset all boards, or only those selected by a boolean mask"""
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        if mask is None:
+            mask = np.ones(len(self.boards), dtype=bool)
+        self.boards[mask] = 0
+        self.scores[mask] = 0
+        self.game_won[mask] = False
+        self.game_over[mask] = False
+
+        # Add two initial tiles
+        add_random_tiles(self.boards, self.rng, mask)
+        add_random_tiles(self.boards, self.rng, mask)
+        return self.boards
+
+    def can_move(self):
+        """Check which boards have any move left"""
+        return can_move(self.boards)
+
+    def step(self, actions):
+        """Make one move on every board and return (boards, rewards, done)
+
+        Finished boards are left untouched and score nothing.
+        """
+        actions = np.broadcast_to(np.asarray(actions, dtype=np.intp), self.scores.shape)
+        boards, rewards, merged = move_boards(self.boards, actions)
+
+        active = ~self.game_over
+        moved = active & (boards != self.boards).any(axis=(1, 2))
+        rewards = np.where(active, rewards, 0)
+        self.boards[active] = boards[active]
+        self.scores += rewards
+        self.game_won |= active & ((merged & WIN_MASK) != 0)
+
+        add_random_tiles(self.boards, self.rng, moved)
+        moved_rows = np.flatnonzero(moved)
+        self.game_over[moved_rows] = ~can_move(self.boards[moved_rows])
+        return self.boards, rewards, self.game_over
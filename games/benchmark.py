@@ -0,0 +1,535 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+# Benchmarks for the game logic and rendering hot paths.
+# Each benchmark builds its state once and returns a function that runs a
+# batch of operations. Batches are timed repeatedly and reported as
+# operations per second with a 95% confidence interval, as JSON. Results can
+# be saved as a baseline and later runs compared against it:
+#
+#   python benchmark.py --output baseline.json
+#   python benchmark.py --baseline baseline.json
+#
+# Rendering runs offscreen on SDL's dummy video driver.
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+REPEAT = 10  # Timed samples per benchmark
+SAMPLE_TIME = 0.05  # Seconds each sample should take
+TOLERANCE = 0.10  # Slowdown below the baseline reported as a regression
+
+# Two-sided 95% Student's t values by degrees of freedom (30+ uses the normal value)
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365,
+        8: 2.306, 9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060}
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a setup function returning (run, operations per run)"""
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+def t_value(degrees):
+    if degrees >= 30:
+        return 1.960
+    return T_95[max(d for d in T_95 if d <= degrees)]
+
+
+def random_bitboards(count, seed=0):
+    """Boards reached by random play, so they look like real games"""
+    from game2048_logic import Game2048Logic, ACTIONS
+    rng = random.Random(seed)
+    game = Game2048Logic(seed)
+    boards = []
+    while len(boards) < count:
+        if game.game_over:
+            game.reset()
+        game.make_move(rng.choice(ACTIONS))
+        boards.append(game.bits)
+    return boards
+
+
+@benchmark('2048.move_left')
+def bench_2048_move_left():
+    return _bench_2048_move('move_left')
+
+
+@benchmark('2048.move_right')
+def bench_2048_move_right():
+    return _bench_2048_move('move_right')
+
+
+@benchmark('2048.move_up')
+def bench_2048_move_up():
+    return _bench_2048_move('move_up')
+
+
+@benchmark('2048.move_down')
+def bench_2048_move_down():
+    return _bench_2048_move('move_down')
+
+
+def _bench_2048_move(name):
+    from game2048_logic import Game2048Logic
+    game = Game2048Logic(0)
+    boards = random_bitboards(1000)
+    move = getattr(game, name)
+
+    def run():
+        for bits in boards:
+            game.bits = bits
+            move()
+    return run, len(boards)
+
+
+@benchmark('2048.can_move')
+def bench_2048_can_move():
+    from game2048_logic import Game2048Logic
+    game = Game2048Logic(0)
+    boards = random_bitboards(1000)
+
+    def run():
+        for bits in boards:
+            game.bits = bits
+            game.can_move()
+    return run, len(boards)
+
+
+def random_tetris_grid(rng, filled_rows=8):
+    """A BitGrid with its bottom rows randomly filled, leaving a gap in each"""
+    from tetris_logic import BitGrid
+    grid = BitGrid()
+    for i in range(grid.height - filled_rows, grid.height):
+        colors = bytearray(grid.width)
+        for j in range(grid.width):
+            if rng.random() < 0.7:
+                grid.rows[i] |= 1 << j
+                colors[j] = rng.randint(1, 7)
+        if grid.rows[i] == grid.full_row:
+            grid.rows[i] &= ~1
+            colors[0] = 0
+        grid.colors[i] = bytes(colors)
+    grid.forget_columns()
+    return grid
+
+
+@benchmark('tetris.is_valid_position')
+def bench_tetris_is_valid_position():
+    from tetris_logic import Tetromino, SHAPES
+    rng = random.Random(0)
+    grid = random_tetris_grid(rng)
+    checks = []
+    for _ in range(1000):
+        piece = Tetromino(0, 0, rng.randrange(len(SHAPES)))
+        checks.append((piece, rng.randint(-2, grid.width), rng.randint(-2, grid.height), rng.randrange(4)))
+
+    def run():
+        for piece, x, y, rotation in checks:
+            piece.is_valid_position(x, y, rotation, grid)
+    return run, len(checks)
+
+
+@benchmark('tetris.rotate')
+def bench_tetris_rotate():
+    from tetris_logic import Tetromino, SHAPES
+    rng = random.Random(0)
+    grid = random_tetris_grid(rng)
+    # Pieces resting just above the stack, where kicks get exercised
+    pieces = [Tetromino(rng.randint(0, grid.width - 4), grid.height - 11, rng.randrange(len(SHAPES)))
+              for _ in range(1000)]
+
+    def run():
+        for piece in pieces:
+            piece.rotate(grid)
+    return run, len(pieces)
+
+
+def _bench_clear_rows(lines):
+    from tetris_logic import column_profile
+    rng = random.Random(lines)
+    grid = random_tetris_grid(rng)
+    for i in range(grid.height - lines, grid.height):
+        grid.rows[i] = grid.full_row
+        grid.colors[i] = bytes(color or 1 for color in grid.colors[i])
+    rows = list(grid.rows)
+    colors = list(grid.colors)
+    heights, filled = column_profile(rows, grid.width)
+    # The rows a vertical I piece dropped into the bottom would touch
+    touched = (grid.height - 4, grid.height)
+    count = 1000
+
+    def run():
+        # Restoring the two lists and the column profile is part of the measured cost
+        for _ in range(count):
+            grid.rows = rows[:]
+            grid.colors = colors[:]
+            grid.heights = heights[:]
+            grid.filled = filled[:]
+            grid.touched = touched
+            grid.clear_rows()
+    return run, count
+
+
+@benchmark('tetris.clear_rows.1')
+def bench_tetris_clear_rows_1():
+    return _bench_clear_rows(1)
+
+
+@benchmark('tetris.clear_rows.2')
+def bench_tetris_clear_rows_2():
+    return _bench_clear_rows(2)
+
+
+@benchmark('tetris.clear_rows.3')
+def bench_tetris_clear_rows_3():
+    return _bench_clear_rows(3)
+
+
+@benchmark('tetris.clear_rows.4')
+def bench_tetris_clear_rows_4():
+    return _bench_clear_rows(4)
+
+
+@benchmark('tetris.hard_drop_cycle')
+def bench_tetris_hard_drop_cycle():
+    from tetris_logic import TetrisLogic
+    rng = random.Random(0)
+    game = TetrisLogic(0)
+    shifts = [rng.randint(-5, 5) for _ in range(1000)]
+
+    def run():
+        for dx in shifts:
+            step = 1 if dx > 0 else -1
+            for _ in range(abs(dx)):
+                game.move(step, 0)
+            game.hard_drop()
+            if game.game_over:
+                game.reset()
+    return run, len(shifts)
+
+
+def _bench_snake_update(length):
+    from snake_logic import Snake, RIGHT
+    # A straight snake on a one-lane ring never runs into itself
+    snake = Snake(random.Random(0), length + 10, 3)
+    snake.direction = RIGHT
+    snake.length = length
+    for _ in range(length):
+        snake.update()
+    count = 1000
+
+    def run():
+        for _ in range(count):
+            snake.update()
+    return run, count
+
+
+@benchmark('snake.update.10')
+def bench_snake_update_10():
+    return _bench_snake_update(10)
+
+
+@benchmark('snake.update.100')
+def bench_snake_update_100():
+    return _bench_snake_update(100)
+
+
+@benchmark('snake.update.1000')
+def bench_snake_update_1000():
+    return _bench_snake_update(1000)
+
+
+@benchmark('snake.update.10000')
+def bench_snake_update_10000():
+    return _bench_snake_update(10000)
+
+
+def _bench_snapshot_restore(game, play):
+    # Branch from one state over and over, as a search would
+    game.step(play)
+    state = game.snapshot()
+    count = 1000
+
+    def run():
+        for _ in range(count):
+            game.restore(state)
+            game.step(play)
+            game.snapshot()
+    return run, count
+
+
+@benchmark('state.branch.2048')
+def bench_state_branch_2048():
+    from game2048_logic import Game2048Logic
+    return _bench_snapshot_restore(Game2048Logic(0), 'left')
+
+
+@benchmark('state.branch.tetris')
+def bench_state_branch_tetris():
+    from tetris_logic import TetrisLogic
+    return _bench_snapshot_restore(TetrisLogic(0), 'drop')
+
+
+@benchmark('state.branch.snake')
+def bench_state_branch_snake():
+    from snake_logic import SnakeLogic, RIGHT
+    # Long enough to have a body to share, on a ring it can't run into itself on
+    game = SnakeLogic(0, 120, 3)
+    game.snake.direction = RIGHT
+    game.snake.length = 100
+    for _ in range(100):
+        game.step(None)
+    assert not game.game_over
+    return _bench_snapshot_restore(game, None)
+
+
+@benchmark('state.to_bytes.tetris')
+def bench_state_to_bytes_tetris():
+    from tetris_logic import TetrisLogic, TetrisState
+    game = TetrisLogic(0)
+    game.grid = random_tetris_grid(random.Random(0))
+    state = game.snapshot()
+    count = 100
+
+    def run():
+        for _ in range(count):
+            TetrisState.from_bytes(state.to_bytes())
+    return run, count
+
+
+def _bench_env_step(name):
+    # Batched steps with observations, counted per environment step
+    import envs
+    vector = envs.SyncVectorEnv([lambda: envs.make(name)] * 16, copy=False)
+    vector.reset(seed=0)
+    rng = random.Random(0)
+    count = 16
+    actions = [[rng.randrange(vector.single_action_space.n) for _ in range(16)] for _ in range(count)]
+
+    def run():
+        for batch in actions:
+            vector.step(batch)
+    return run, count * 16
+
+
+@benchmark('env.step.2048')
+def bench_env_step_2048():
+    return _bench_env_step('2048')
+
+
+@benchmark('env.step.tetris')
+def bench_env_step_tetris():
+    return _bench_env_step('tetris')
+
+
+@benchmark('env.step.snake')
+def bench_env_step_snake():
+    return _bench_env_step('snake')
+
+
+@benchmark('server.room_tick')
+def bench_server_room_tick():
+    # Loopback rooms pressing random keys, counted per room tick
+    from tetris_server import simulate
+    server, _ = simulate(100, 0)
+    rng = random.Random(0)
+    players = [player for room in server.rooms.values() for player in room.players]
+    actions = [rng.choice(('left', 'right', 'rotate', 'drop', 'down')) for _ in range(4096)]
+    count = 4
+
+    def run():
+        for k in range(count):
+            for i, player in enumerate(players[k::5]):
+                player.queue_input(actions[(i + k) % len(actions)])
+            server.tick()
+    return run, count * len(server.rooms)
+
+
+def _display(width, height):
+    import pygame
+    pygame.init()
+    return pygame.display.set_mode((width, height))
+
+
+@benchmark('render.2048.full')
+def bench_render_2048():
+    import Game2048
+    screen = _display(Game2048.WIDTH, Game2048.HEIGHT)
+    game = Game2048.Game2048(0)
+    game.bits = random_bitboards(1)[0]
+
+    def run():
+        game.invalidate()
+        game.draw(screen)
+    return run, 1
+
+
+@benchmark('render.tetris.full')
+def bench_render_tetris_full():
+    import tetris
+    screen = _display(tetris.WIDTH, tetris.HEIGHT)
+    game = tetris.TetrisLogic(0)
+    game.grid = random_tetris_grid(random.Random(0))
+    renderer = tetris.TetrisRenderer(screen)
+
+    def run():
+        renderer.invalidate()
+        renderer.draw(game)
+    return run, 1
+
+
+@benchmark('render.tetris.move')
+def bench_render_tetris_move():
+    import tetris
+    screen = _display(tetris.WIDTH, tetris.HEIGHT)
+    game = tetris.TetrisLogic(0)
+    game.grid = random_tetris_grid(random.Random(0))
+    renderer = tetris.TetrisRenderer(screen)
+    renderer.draw(game)
+    direction = [1]
+
+    def run():
+        # The falling piece moving one column, as on most frames
+        if not game.move(direction[0], 0):
+            direction[0] = -direction[0]
+            game.move(direction[0], 0)
+        renderer.draw(game)
+    return run, 1
+
+
+@benchmark('render.snake.frame')
+def bench_render_snake():
+    import snake_game
+    screen = _display(snake_game.WIDTH, snake_game.HEIGHT)
+    game = snake_game.SnakeLogic(0)
+    game.snake.length = 50
+    for _ in range(50):
+        game.snake.update()
+
+    def run():
+        snake_game.draw_frame(screen, game)
+    return run, 1
+
+
+def measure(run, operations, repeat=REPEAT, sample_time=SAMPLE_TIME):
+    """Time run() and return ops/sec statistics"""
+    # Calibrate how many runs make up one sample
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= sample_time / 10 or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(number * sample_time / max(elapsed, 1e-9)))
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append(number * operations / (time.perf_counter() - start))
+
+    mean = sum(samples) / len(samples)
+    if len(samples) > 1:
+        deviation = math.sqrt(sum((s - mean) ** 2 for s in samples) / (len(samples) - 1))
+        ci95 = t_value(len(samples) - 1) * deviation / math.sqrt(len(samples))
+    else:
+        ci95 = 0.0
+    return {
+        'ops_per_sec': mean,
+        'ci95': ci95,
+        'min': min(samples),
+        'max': max(samples),
+        'samples': len(samples),
+    }
+
+
+def run_benchmarks(pattern=None, repeat=REPEAT, sample_time=SAMPLE_TIME):
+    """Run every benchmark whose name contains pattern, returning the results document"""
+    results = {}
+    for name, setup in BENCHMARKS:
+        if pattern and pattern not in name:
+            continue
+        run, operations = setup()
+        results[name] = measure(run, operations, repeat, sample_time)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Return (name, change, regressed) for benchmarks in both result documents
+
+    A benchmark regresses when even the top of its confidence interval is
+    more than tolerance below the baseline's mean.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        regressed = result['ops_per_sec'] + result['ci95'] < before['ops_per_sec'] * (1 - tolerance)
+        rows.append((name, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the games' logic and rendering hot paths")
+    parser.add_argument('--filter', help="only run benchmarks whose name contains this")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="timed samples per benchmark")
+    parser.add_argument('--time', type=float, default=SAMPLE_TIME, help="seconds per sample")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against results saved with --output")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="slowdown that counts as a regression (default 0.10)")
+    parser.add_argument('--list', action='store_true', help="list the benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, _ in BENCHMARKS:
+            print(name)
+        return 0
+
+    current = run_benchmarks(args.filter, args.repeat, args.time)
+    for name, result in current['results'].items():
+        print(f"{name:28} {result['ops_per_sec']:14,.0f} ops/s  +/- {result['ci95'] / result['ops_per_sec']:.1%}",
+              file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = 0
+        for name, change, regressed in compare(current, baseline, args.tolerance):
+            regressions += regressed
+            print(f"{name:28} {change:+8.1%}{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import random
+
+# A 4x4 board packed into one 64-bit integer.
+# Each cell is a 4-bit nibble holding the log2 exponent of the tile (0 = empty,
+# 1 = 2, 2 = 4, ... 15 = 32768). Row i lives in bits 16*i .. 16*i + 15 and
+# column j of that row in nibble j, so "left" means towards nibble 0.
+BOARD_SIZE = 4
+ROW_MASK = 0xFFFF
+CELL_MASK = 0xF
+MAX_EXPONENT = 15  # Tiles of 32768 no longer merge (no room in a nibble)
+
+# Masks for the nibble transpose
+_TRANSPOSE_KEEP = 0xF0F00F0FF0F00F0F
+_TRANSPOSE_SHIFT_12_LEFT = 0x0000F0F00000F0F0
+_TRANSPOSE_SHIFT_12_RIGHT = 0x0F0F00000F0F0000
+_TRANSPOSE_KEEP_2 = 0xFF00FF0000FF00FF
+_TRANSPOSE_SHIFT_24_LEFT = 0x00000000FF00FF00
+_TRANSPOSE_SHIFT_24_RIGHT = 0x00FF00FF00000000
+
+
+def _build_tables():
+    """Precompute the result of a left and right move for every possible row
+
+    Rows are built in increasing order from smaller ones already done: a row
+    is its first cell followed by the row of its other three. A leading
+    empty cell slides away; otherwise the first cell either merges with the
+    first tile of the rest, which then slides on its own, or stays put in
+    front of the rest moved left. Tiles merge once per move, pairing from
+    the left, and tiles of MAX_EXPONENT never merge.
+    """
+    size = ROW_MASK + 1
+    left = [0] * size
+    score = [0] * size
+    merged = [0] * size
+    first = [0] * size  # The row's first tile, 0 if it has none
+    after = [0] * size  # The cells after its first tile
+    for row in range(1, size):
+        cell = row & CELL_MASK
+        rest = row >> 4
+        if not cell:
+            first[row] = first[rest]
+            after[row] = after[rest]
+            left[row] = left[rest]
+            score[row] = score[rest]
+            merged[row] = merged[rest]
+            continue
+        first[row] = cell
+        after[row] = rest
+        if cell == first[rest] and cell < MAX_EXPONENT:
+            remainder = after[rest]
+            left[row] = (cell + 1) | left[remainder] << 4
+            score[row] = (1 << (cell + 1)) + score[remainder]
+            merged[row] = (1 << (cell + 1)) | merged[remainder]
+        else:
+            left[row] = cell | left[rest] << 4
+            score[row] = score[rest]
+            merged[row] = merged[rest]
+    # Moving right is moving the mirrored row left. A run of equal tiles yields
+    # the same merges in either direction, so score and merged are shared.
+    mirror = [((row >> 12) & 0xF) | ((row >> 4) & 0xF0) | ((row << 4) & 0xF00) | ((row << 12) & 0xF000)
+              for row in range(size)]
+    right = [mirror[left[mirror[row]]] for row in range(size)]
+    return left, right, score, merged
+
+
+# ROW_LEFT[row] / ROW_RIGHT[row] give the moved row, ROW_SCORE[row] the points
+# scored and ROW_MERGED[row] a bitmask of the exponents created by merges.
+ROW_LEFT, ROW_RIGHT, ROW_SCORE, ROW_MERGED = _build_tables()
+
+
+def pack(board):
+    """Pack a list-of-lists board of tile values into a bitboard"""
+    bits = 0
+    for i in range(BOARD_SIZE):
+        for j in range(BOARD_SIZE):
+            value = board[i][j]
+            if value:
+                bits |= (value.bit_length() - 1) << (16 * i + 4 * j)
+    return bits
+
+
+def unpack(bits):
+    """Unpack a bitboard into a list-of-lists board of tile values"""
+    board = []
+    for i in range(BOARD_SIZE):
+        row = []
+        for j in range(BOARD_SIZE):
+            exponent = (bits >> (16 * i + 4 * j)) & CELL_MASK
+            row.append(1 << exponent if exponent else 0)
+        board.append(row)
+    return board
+
+
+def empty_board():
+    """Return a board with no tiles"""
+    return 0
+
+
+def exponents(bits):
+    """Return every cell's exponent in row-major order"""
+    return [(bits >> shift) & CELL_MASK for shift in range(0, 64, 4)]
+
+
+def get_cell(bits, i, j):
+    """Return the exponent stored at row i, column j"""
+    return (bits >> (16 * i + 4 * j)) & CELL_MASK
+
+
+def set_cell(bits, i, j, exponent):
+    """Return a new bitboard with the exponent at row i, column j replaced"""
+    shift = 16 * i + 4 * j
+    return (bits & ~(CELL_MASK << shift)) | (exponent << shift)
+
+
+def transpose(bits):
+    """Transpose the board (rows become columns)"""
+    a1 = bits & _TRANSPOSE_KEEP
+    a2 = bits & _TRANSPOSE_SHIFT_12_LEFT
+    a3 = bits & _TRANSPOSE_SHIFT_12_RIGHT
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & _TRANSPOSE_KEEP_2
+    b2 = a & _TRANSPOSE_SHIFT_24_LEFT
+    b3 = a & _TRANSPOSE_SHIFT_24_RIGHT
+    return b1 | (b2 << 24) | (b3 >> 24)
+
+
+def _move_rows(bits, table):
+    r0 = bits & ROW_MASK
+    r1 = (bits >> 16) & ROW_MASK
+    r2 = (bits >> 32) & ROW_MASK
+    r3 = bits >> 48
+    moved = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+    score = ROW_SCORE[r0] + ROW_SCORE[r1] + ROW_SCORE[r2] + ROW_SCORE[r3]
+    merged = ROW_MERGED[r0] | ROW_MERGED[r1] | ROW_MERGED[r2] | ROW_MERGED[r3]
+    return moved, score, merged
+
+
+def move_left(bits):
+    """Move and merge tiles to the left, returning (bits, score, merged)"""
+    return _move_rows(bits, ROW_LEFT)
+
+
+def move_right(bits):
+    """Move and merge tiles to the right, returning (bits, score, merged)"""
+    return _move_rows(bits, ROW_RIGHT)
+
+
+def move_up(bits):
+    """Move and merge tiles up, returning (bits, score, merged)"""
+    moved, score, merged = _move_rows(transpose(bits), ROW_LEFT)
+    return transpose(moved), score, merged
+
+
+def move_down(bits):
+    """Move and merge tiles down, returning (bits, score, merged)"""
+    moved, score, merged = _move_rows(transpose(bits), ROW_RIGHT)
+    return transpose(moved), score, merged
+
+
+MOVES = {
+    'left': move_left,
+    'right': move_right,
+    'up': move_up,
+    'down': move_down,
+}
+
+
+def empty_cells(bits):
+    """Return the (row, column) of every empty cell in row-major order"""
+    cells = []
+    for i in range(BOARD_SIZE):
+        for j in range(BOARD_SIZE):
+            if not (bits >> (16 * i + 4 * j)) & CELL_MASK:
+                cells.append((i, j))
+    return cells
+
+
+def count_empty(bits):
+    """Count the empty cells on the board"""
+    # Fold each nibble down to a single "non-zero" bit, then count them
+    bits |= bits >> 2
+    bits |= bits >> 1
+    return BOARD_SIZE * BOARD_SIZE - bin(bits & 0x1111111111111111).count('1')
+
+
+def max_exponent(bits):
+    """Return the largest exponent on the board"""
+    best = 0
+    while bits:
+        cell = bits & CELL_MASK
+        if cell > best:
+            best = cell
+        bits >>= 4
+    return best
+
+
+def can_move(bits):
+    """Check if any move is possible"""
+    if count_empty(bits):
+        return True
+    # A full board can move iff some row or column slides
+    return _rows_slide(bits) or _rows_slide(transpose(bits))
+
+
+def _rows_slide(bits):
+    # True if moving left would change at least one row
+    return (
+        ROW_LEFT[bits & ROW_MASK] != bits & ROW_MASK
+        or ROW_LEFT[(bits >> 16) & ROW_MASK] != (bits >> 16) & ROW_MASK
+        or ROW_LEFT[(bits >> 32) & ROW_MASK] != (bits >> 32) & ROW_MASK
+        or ROW_LEFT[bits >> 48] != bits >> 48
+    )
+
+
+def add_random_tile(bits, rng=random):
+    """Add a random tile (2 or 4) to an empty cell"""
+    cells = empty_cells(bits)
+    if not cells:
+        return bits
+    i, j = rng.choice(cells)
+    return set_cell(bits, i, j, 1 if rng.random() < 0.9 else 2)
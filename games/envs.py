@@ -0,0 +1,414 @@
+import multiprocessing
+import os
+import traceback
+
+import numpy as np
+
+from game2048_logic import Game2048Logic, ACTIONS as ACTIONS_2048, GRID_SIZE as SIZE_2048
+from snake_logic import SnakeLogic, ACTIONS as SNAKE_ACTIONS, GRID_WIDTH as SNAKE_WIDTH, GRID_HEIGHT as SNAKE_HEIGHT
+from tetris_logic import TetrisLogic, ACTIONS as TETRIS_ACTIONS, GRID_WIDTH as TETRIS_WIDTH, GRID_HEIGHT as TETRIS_HEIGHT
+
+# Gymnasium-style environments for training agents on the games.
+# Each environment wraps a logic class and encodes its state as a stack of
+# 0/1 uint8 planes: one per tile exponent for 2048, locked cells and the
+# falling piece for Tetris, and body, head and food for Snake. When
+# gymnasium is installed the environments are real gymnasium.Env instances
+# with gymnasium spaces; otherwise minimal stand-ins with the same
+# attributes are used, so nothing else depends on it.
+#
+# SyncVectorEnv steps a batch of environments in this process and
+# AsyncVectorEnv spreads them over worker processes. Both reset finished
+# environments automatically and write observations straight into one
+# batch buffer, which for AsyncVectorEnv lives in shared memory, so only a
+# short command crosses the process boundary on each step.
+
+EXPONENT_PLANES = 16  # 2048 planes: empty, 2, 4, ... 2**15 (bigger tiles share the last)
+
+try:
+    import gymnasium
+    from gymnasium.spaces import Box, Discrete, MultiDiscrete
+    Env = gymnasium.Env
+except ImportError:
+    gymnasium = None
+
+    class Env:
+        """Stand-in for gymnasium.Env"""
+        metadata = {'render_modes': []}
+        render_mode = None
+
+        def close(self):
+            pass
+
+    class Box:
+        """Stand-in for gymnasium.spaces.Box, for integer arrays"""
+
+        def __init__(self, low, high, shape, dtype, seed=None):
+            self.low = low
+            self.high = high
+            self.shape = tuple(shape)
+            self.dtype = np.dtype(dtype)
+            self.np_random = np.random.default_rng(seed)
+
+        def sample(self):
+            return self.np_random.integers(self.low, self.high, self.shape, self.dtype, endpoint=True)
+
+        def contains(self, x):
+            x = np.asarray(x)
+            return x.shape == self.shape and bool(((x >= self.low) & (x <= self.high)).all())
+
+    class Discrete:
+        """Stand-in for gymnasium.spaces.Discrete"""
+
+        def __init__(self, n, seed=None):
+            self.n = n
+            self.shape = ()
+            self.dtype = np.dtype(np.int64)
+            self.np_random = np.random.default_rng(seed)
+
+        def sample(self):
+            return int(self.np_random.integers(self.n))
+
+        def contains(self, x):
+            return 0 <= int(x) < self.n
+
+    class MultiDiscrete:
+        """Stand-in for gymnasium.spaces.MultiDiscrete"""
+
+        def __init__(self, nvec, seed=None):
+            self.nvec = np.asarray(nvec, dtype=np.int64)
+            self.shape = self.nvec.shape
+            self.dtype = np.dtype(np.int64)
+            self.np_random = np.random.default_rng(seed)
+
+        def sample(self):
+            return self.np_random.integers(self.nvec)
+
+        def contains(self, x):
+            x = np.asarray(x)
+            return x.shape == self.shape and bool(((x >= 0) & (x < self.nvec)).all())
+
+
+class GameEnv(Env):
+    """Base class of the game environments
+
+    Subclasses create the game, set observation_space and action_space and
+    write observations with observe(out), which fills a preallocated array
+    in place. max_steps, if given, truncates episodes after that many
+    steps.
+    """
+
+    metadata = {'render_modes': []}
+
+    def __init__(self, game, max_steps=None):
+        self.game = game
+        self.max_steps = max_steps
+        self.steps = 0
+
+    def reset(self, *, seed=None, options=None):
+        """Start a new game, reseeding it if a seed is given, and return (observation, info)"""
+        if gymnasium is not None:
+            super().reset(seed=seed)
+        self.game.reset(seed)
+        self.steps = 0
+        return self.observation(), self.info()
+
+    def advance(self, action):
+        """Apply an action, returning (reward, terminated, truncated) without building an observation"""
+        _, reward, terminated = self.game.step(int(action))
+        self.steps += 1
+        truncated = not terminated and self.max_steps is not None and self.steps >= self.max_steps
+        return float(reward), terminated, truncated
+
+    def step(self, action):
+        """Apply an action and return (observation, reward, terminated, truncated, info)"""
+        reward, terminated, truncated = self.advance(action)
+        return self.observation(), reward, terminated, truncated, self.info()
+
+    def observation(self):
+        out = np.empty(self.observation_space.shape, dtype=np.uint8)
+        self.observe(out)
+        return out
+
+    def observe(self, out):
+        raise NotImplementedError
+
+    def info(self):
+        return {'score': self.game.score}
+
+
+class Game2048Env(GameEnv):
+    # Observation: EXPONENT_PLANES planes of size x size, plane k marking
+    # the cells holding 2**k (plane 0 the empty cells). Actions: ACTIONS.
+
+    def __init__(self, size=SIZE_2048, seed=None, max_steps=None):
+        super().__init__(Game2048Logic(seed, size), max_steps)
+        self.observation_space = Box(0, 1, (EXPONENT_PLANES, size, size), np.uint8)
+        self.action_space = Discrete(len(ACTIONS_2048))
+        self.rows, self.columns = np.divmod(np.arange(size * size), size)
+
+    def observe(self, out):
+        game = self.game
+        exponents = np.fromiter(game.backend.exponents(game.bits), np.intp, len(self.rows))
+        out.fill(0)
+        out[np.minimum(exponents, EXPONENT_PLANES - 1), self.rows, self.columns] = 1
+
+
+class TetrisEnv(GameEnv):
+    # Observation: two height x width planes, the locked cells and the
+    # falling piece. Actions: ACTIONS, each followed by a gravity tick.
+
+    def __init__(self, width=TETRIS_WIDTH, height=TETRIS_HEIGHT, seed=None, max_steps=None,
+                 generator='random'):
+        super().__init__(TetrisLogic(seed, width, height, generator=generator), max_steps)
+        self.observation_space = Box(0, 1, (2, height, width), np.uint8)
+        self.action_space = Discrete(len(TETRIS_ACTIONS))
+        self.row_bytes = (width + 7) // 8
+
+    def observe(self, out):
+        game = self.game
+        width = game.width
+        # Row bitmasks to cells: bit j of a row is column j
+        packed = b''.join(row.to_bytes(self.row_bytes, 'little') for row in game.grid.rows)
+        cells = np.unpackbits(np.frombuffer(packed, np.uint8), bitorder='little')
+        out[0] = cells.reshape(game.height, -1)[:, :width]
+        out[1].fill(0)
+        if not game.game_over:
+            for i, j in game.current_piece.get_positions():
+                if i >= 0:
+                    out[1, i, j] = 1
+
+
+class SnakeEnv(GameEnv):
+    # Observation: three height x width planes, the body, the head and the
+    # food. Actions: ACTIONS (0 keeps going, then up, down, left, right).
+
+    def __init__(self, width=SNAKE_WIDTH, height=SNAKE_HEIGHT, seed=None, max_steps=None):
+        super().__init__(SnakeLogic(seed, width, height), max_steps)
+        self.observation_space = Box(0, 1, (3, height, width), np.uint8)
+        self.action_space = Discrete(len(SNAKE_ACTIONS))
+
+    def observe(self, out):
+        game = self.game
+        snake = game.snake
+        occupancy = np.frombuffer(snake.occupancy, np.uint8).reshape(game.height, game.width)
+        np.minimum(occupancy, 1, out=out[0])
+        out[1:].fill(0)
+        x, y = snake.get_head_position()
+        out[1, y, x] = 1
+        x, y = game.food.position
+        out[2, y, x] = 1
+
+
+ENVS = {'2048': Game2048Env, 'tetris': TetrisEnv, 'snake': SnakeEnv}
+
+
+def make(name, **kwargs):
+    """Create the environment of a game by name"""
+    return ENVS[name](**kwargs)
+
+
+def _step_envs(envs, start, buffers):
+    # Step envs[k] with actions[start + k], resetting the ones that finish
+    observations, final, actions, rewards, terminated, truncated, scores = buffers
+    for k, env in enumerate(envs):
+        i = start + k
+        reward, done, cut = env.advance(actions[i])
+        rewards[i] = reward
+        terminated[i] = done
+        truncated[i] = cut
+        scores[i] = env.game.score
+        if done or cut:
+            env.observe(final[i])
+            env.reset()
+        env.observe(observations[i])
+
+
+def _reset_envs(envs, start, buffers, seeds):
+    observations = buffers[0]
+    for k, env in enumerate(envs):
+        env.reset(seed=seeds[k])
+        env.observe(observations[start + k])
+
+
+def _seeds(seed, count):
+    if seed is None or isinstance(seed, int):
+        return [None if seed is None else seed + i for i in range(count)]
+    return list(seed)
+
+
+class VectorEnv:
+    """Base class of the batched environments
+
+    step(actions) takes one action per environment and returns
+    (observations, rewards, terminated, truncated, infos) as arrays. An
+    environment whose episode ends is reset on the spot: its row of
+    observations is the first of the new episode, while infos holds the
+    last one in 'final_observation' (rows flagged by '_final_observation')
+    and the score each step reached in 'score'. Observations are written
+    into one buffer; with copy=False they are returned as that buffer
+    itself, which the next step overwrites.
+    """
+
+    def __init__(self, env_fns, copy=True):
+        self.num_envs = len(env_fns)
+        env = env_fns[0]()
+        self.single_observation_space = env.observation_space
+        self.single_action_space = env.action_space
+        env.close()
+        shape = self.single_observation_space.shape
+        self.observation_space = Box(0, 1, (self.num_envs,) + shape, np.uint8)
+        self.action_space = MultiDiscrete([self.single_action_space.n] * self.num_envs)
+        self.copy = copy
+
+        # observations, final observations, actions, rewards, terminated, truncated, scores
+        self.buffers = (
+            self.allocate((self.num_envs,) + shape, np.uint8),
+            self.allocate((self.num_envs,) + shape, np.uint8),
+            self.allocate((self.num_envs,), np.int64),
+            self.allocate((self.num_envs,), np.float64),
+            self.allocate((self.num_envs,), np.bool_),
+            self.allocate((self.num_envs,), np.bool_),
+            self.allocate((self.num_envs,), np.int64),
+        )
+
+    def allocate(self, shape, dtype):
+        return np.zeros(shape, dtype)
+
+    def results(self):
+        observations, final, _, rewards, terminated, truncated, scores = self.buffers
+        done = terminated | truncated
+        infos = {
+            'final_observation': final.copy() if self.copy else final,
+            '_final_observation': done,
+            'score': scores.copy(),
+        }
+        if self.copy:
+            observations = observations.copy()
+        return observations, rewards.copy(), terminated.copy(), truncated.copy(), infos
+
+    def step(self, actions):
+        self.buffers[2][:] = actions
+        self.step_envs()
+        return self.results()
+
+    def reset(self, *, seed=None, options=None):
+        """Reset every environment (environment i gets seed + i for an int seed) and return (observations, infos)"""
+        self.reset_envs(_seeds(seed, self.num_envs))
+        observations = self.buffers[0]
+        return (observations.copy() if self.copy else observations), {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class SyncVectorEnv(VectorEnv):
+    """Steps a batch of environments one after another in this process"""
+
+    def __init__(self, env_fns, copy=True):
+        super().__init__(env_fns, copy)
+        self.envs = [env_fn() for env_fn in env_fns]
+
+    def step_envs(self):
+        _step_envs(self.envs, 0, self.buffers)
+
+    def reset_envs(self, seeds):
+        _reset_envs(self.envs, 0, self.buffers, seeds)
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+def _worker(pipe, env_fns, start, shared, shapes):
+    try:
+        envs = [env_fn() for env_fn in env_fns]
+        buffers = tuple(np.frombuffer(raw, dtype).reshape(shape)
+                        for raw, (shape, dtype) in zip(shared, shapes))
+        while True:
+            command, data = pipe.recv()
+            if command == 'step':
+                _step_envs(envs, start, buffers)
+            elif command == 'reset':
+                _reset_envs(envs, start, buffers, data)
+            elif command == 'close':
+                for env in envs:
+                    env.close()
+                pipe.send(None)
+                break
+            pipe.send(None)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        pipe.send(traceback.format_exc())
+    finally:
+        pipe.close()
+
+
+class AsyncVectorEnv(VectorEnv):
+    """Steps a batch of environments across worker processes
+
+    The environments are split evenly over worker processes (one per
+    core by default). Observations, actions and results are exchanged
+    through shared memory, so each step only sends a command to every
+    worker and waits for it to answer. env_fns must be picklable unless
+    the start method is fork.
+    """
+
+    def __init__(self, env_fns, workers=None, context=None, copy=True):
+        self.context = multiprocessing.get_context(context)
+        self.shared = []
+        super().__init__(env_fns, copy)
+        workers = max(1, min(workers or os.cpu_count() or 1, self.num_envs))
+        shapes = [(buffer.shape, buffer.dtype) for buffer in self.buffers]
+        self.pipes = []
+        self.processes = []
+        bounds = [self.num_envs * k // workers for k in range(workers + 1)]
+        self.slices = list(zip(bounds[:-1], bounds[1:]))
+        for start, stop in self.slices:
+            parent, child = self.context.Pipe()
+            process = self.context.Process(
+                target=_worker, args=(child, env_fns[start:stop], start, self.shared, shapes),
+                daemon=True)
+            process.start()
+            child.close()
+            self.pipes.append(parent)
+            self.processes.append(process)
+        self.closed = False
+
+    def allocate(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        raw = self.context.RawArray('b', max(1, int(np.prod(shape)) * dtype.itemsize))
+        self.shared.append(raw)
+        return np.frombuffer(raw, dtype, int(np.prod(shape))).reshape(shape)
+
+    def call(self, command, data=None):
+        for pipe, (start, stop) in zip(self.pipes, self.slices):
+            pipe.send((command, data if data is None else data[start:stop]))
+        errors = [error for error in (pipe.recv() for pipe in self.pipes) if error is not None]
+        if errors:
+            raise RuntimeError("Environment worker failed:\n" + errors[0])
+
+    def step_envs(self):
+        self.call('step')
+
+    def reset_envs(self, seeds):
+        self.call('reset', seeds)
+
+    def close(self):
+        """Stop the workers"""
+        if self.closed:
+            return
+        self.closed = True
+        for pipe in self.pipes:
+            try:
+                pipe.send(('close', None))
+                pipe.recv()
+            except (BrokenPipeError, EOFError):
+                pass
+            pipe.close()
+        for process in self.processes:
+            process.join()
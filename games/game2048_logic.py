@@ -0,0 +1,194 @@
+import struct
+from collections import namedtuple
+
+import bitboard2048
+from gamestate import SnapshotRandom, pack_rng, unpack_rng
+from gridboard2048 import GridBoard
+
+# Game logic for 2048 without any pygame dependency, so games can be stepped
+# headless as fast as the CPU allows. Game2048.py draws on top of this.
+# 4x4 games run on bitboard2048; any other size uses a GridBoard, which has
+# the same functions, so the board in self.bits is whatever the backend uses.
+
+GRID_SIZE = bitboard2048.BOARD_SIZE
+
+# Actions accepted by step(), either by name or by index
+ACTIONS = ('left', 'right', 'up', 'down')
+
+# Bit set in a move's merged mask when a 2048 tile is created
+WIN_MASK = 1 << 11
+
+_STATE_HEADER = struct.Struct('<HQQB')  # size, score, best score, won | over << 1
+_BITBOARD = struct.Struct('<Q')
+
+
+def board_backend(size):
+    """Return the module or object implementing boards of a size"""
+    if size == bitboard2048.BOARD_SIZE:
+        return bitboard2048
+    return GridBoard(size)
+
+
+class Game2048State(namedtuple('Game2048State', [
+        'size', 'bits', 'score', 'best_score', 'game_won', 'game_over', 'rng'])):
+    """A snapshot of a 2048 game; boards are immutable, so nothing is copied
+
+    rng is the tile generator's state, or None when it was left out.
+    """
+
+    __slots__ = ()
+
+    def to_bytes(self):
+        """Encode the state: a header, the board and the generator state"""
+        header = _STATE_HEADER.pack(self.size, self.score, self.best_score,
+                                    self.game_won | self.game_over << 1)
+        if self.size == bitboard2048.BOARD_SIZE:
+            board = _BITBOARD.pack(self.bits)
+        else:
+            board = bytes(exponent for row in self.bits for exponent in row)
+        return header + board + pack_rng(self.rng)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decode a state encoded by to_bytes"""
+        size, score, best_score, flags = _STATE_HEADER.unpack_from(data)
+        offset = _STATE_HEADER.size
+        if size == bitboard2048.BOARD_SIZE:
+            bits = _BITBOARD.unpack_from(data, offset)[0]
+            offset += _BITBOARD.size
+        else:
+            bits = tuple(tuple(data[offset + i * size:offset + (i + 1) * size]) for i in range(size))
+            offset += size * size
+        rng, _ = unpack_rng(data, offset)
+        return cls(size, bits, score, best_score, bool(flags & 1), bool(flags & 2), rng)
+
+
+class Game2048Logic:
+    def __init__(self, seed=None, size=GRID_SIZE):
+        self.rng = SnapshotRandom(seed)
+        self.size = size
+        self.backend = board_backend(size)
+        self.bits = self.backend.empty_board()  # Packed board, see bitboard2048
+        self.score = 0
+        self.best_score = 0
+        self.game_won = False
+        self.game_over = False
+
+        # Add two initial tiles
+        self.add_random_tile()
+        self.add_random_tile()
+
+    def __getstate__(self):
+        # The backend may be a module, which can't be pickled; it is rebuilt from the size
+        state = self.__dict__.copy()
+        del state['backend']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.backend = board_backend(self.size)
+
+    def snapshot(self, rng=True):
+        """Return the game state as a Game2048State, leaving out the tile generator if rng is False"""
+        return Game2048State(self.size, self.bits, self.score, self.best_score,
+                             self.game_won, self.game_over, self.rng.getstate() if rng else None)
+
+    def restore(self, state):
+        """Put the game back in a snapshotted state (the generator too, if it was saved)"""
+        if state.size != self.size:
+            self.size = state.size
+            self.backend = board_backend(state.size)
+        self.bits = state.bits
+        self.score = state.score
+        self.best_score = state.best_score
+        self.game_won = state.game_won
+        self.game_over = state.game_over
+        if state.rng is not None:
+            self.rng.setstate(state.rng)
+        return self
+
+    @property
+    def board(self):
+        """The board as a list of rows of tile values (0 = empty)"""
+        return self.backend.unpack(self.bits)
+
+    @board.setter
+    def board(self, board):
+        self.bits = self.backend.pack(board)
+
+    def add_random_tile(self):
+        """Add a random tile (2 or 4) to an empty cell"""
+        self.bits = self.backend.add_random_tile(self.bits, self.rng)
+
+    def apply_move(self, move):
+        """Apply a bitboard move function, updating score and win state"""
+        bits, score, merged = move(self.bits)
+        self.score += score
+        if merged & WIN_MASK and not self.game_won:
+            self.game_won = True
+        moved = bits != self.bits
+        self.bits = bits
+        return moved
+
+    def move_left(self):
+        """Move and merge tiles to the left"""
+        return self.apply_move(self.backend.move_left)
+
+    def move_right(self):
+        """Move and merge tiles to the right"""
+        return self.apply_move(self.backend.move_right)
+
+    def move_up(self):
+        """Move and merge tiles up"""
+        return self.apply_move(self.backend.move_up)
+
+    def move_down(self):
+        """Move and merge tiles down"""
+        return self.apply_move(self.backend.move_down)
+
+    def transpose(self):
+        """Transpose the board matrix"""
+        self.bits = self.backend.transpose(self.bits)
+
+    def can_move(self):
+        """Check if any move is possible"""
+        return self.backend.can_move(self.bits)
+
+    def make_move(self, direction):
+        """Make a move in the specified direction"""
+        if self.game_over:
+            return
+
+        moved = False
+        move = self.backend.MOVES.get(direction)
+        if move is not None:
+            moved = self.apply_move(move)
+
+        if moved:
+            self.add_random_tile()
+            if not self.can_move():
+                self.game_over = True
+
+        # Update best score
+        if self.score > self.best_score:
+            self.best_score = self.score
+
+    def reset(self, seed=None):
+        """Reset the game, reseeding the tile generator if a seed is given"""
+        if seed is not None:
+            self.rng.seed(seed)
+        self.bits = self.backend.empty_board()
+        self.score = 0
+        self.game_won = False
+        self.game_over = False
+        self.add_random_tile()
+        self.add_random_tile()
+        return self
+
+    def step(self, action):
+        """Make one move and return (state, reward, done)"""
+        if isinstance(action, int):
+            action = ACTIONS[action]
+        score = self.score
+        self.make_move(action)
+        return self, self.score - score, self.game_over
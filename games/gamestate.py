@@ -0,0 +1,77 @@
+import random
+import struct
+
+# Shared pieces of the games' snapshot() / restore() support.
+# A snapshot is an immutable state tuple that shares its board with the live
+# game until the game next changes, so search code can branch a game in
+# O(1) and only pay for the parts a move actually touches. Every state can
+# be turned into a compact byte string with to_bytes() and back with
+# from_bytes(), to be kept in bulk or sent to worker processes.
+#
+# Byte layouts are little-endian. The random generator's state is written
+# last: a flag byte (0 = not saved, 1 = saved, 2 = saved with a pending
+# Gaussian), the 624 Mersenne Twister words and position, then the
+# Gaussian as a double if there is one.
+
+_RNG_WORDS = struct.Struct('<625I')
+_F64 = struct.Struct('<d')
+
+
+class SnapshotRandom(random.Random):
+    """random.Random whose getstate() is computed once between draws
+
+    Snapshots taken without a draw in between then share a single state
+    tuple instead of each copying the generator's 625 words, and restoring
+    the state the generator is already in is free. The numbers drawn are
+    exactly those of random.Random.
+    """
+
+    _state = None
+
+    def seed(self, *args, **kwargs):
+        self._state = None
+        super().seed(*args, **kwargs)
+
+    def random(self):
+        self._state = None
+        return super().random()
+
+    def getrandbits(self, k):
+        self._state = None
+        return super().getrandbits(k)
+
+    def getstate(self):
+        if self._state is None:
+            self._state = super().getstate()
+        return self._state
+
+    def setstate(self, state):
+        # Nothing to do when the generator hasn't drawn since it was in this state
+        if state is not self._state:
+            super().setstate(state)
+            self._state = state
+
+
+def pack_rng(state):
+    """Encode a random.Random state (or None) as bytes"""
+    if state is None:
+        return b'\x00'
+    _, words, gauss = state
+    if gauss is None:
+        return b'\x01' + _RNG_WORDS.pack(*words)
+    return b'\x02' + _RNG_WORDS.pack(*words) + _F64.pack(gauss)
+
+
+def unpack_rng(data, offset):
+    """Decode a state written by pack_rng, returning (state, offset after it)"""
+    flag = data[offset]
+    offset += 1
+    if not flag:
+        return None, offset
+    words = _RNG_WORDS.unpack_from(data, offset)
+    offset += _RNG_WORDS.size
+    gauss = None
+    if flag == 2:
+        gauss = _F64.unpack_from(data, offset)[0]
+        offset += _F64.size
+    return (random.Random.VERSION, words, gauss), offset
@@ -0,0 +1,141 @@
+import random
+
+# 2048 boards of any size, for when the 4x4 bitboard does not fit.
+# A board is a tuple of row tuples of log2 exponents (0 = empty), so it is
+# hashable and compares by value like a bitboard. GridBoard offers the same
+# functions as the bitboard2048 module, and Game2048Logic uses whichever of
+# the two matches its size. Row slides are memoized, since the same rows come
+# up over and over during a game.
+
+ROW_CACHE_SIZE = 1 << 16  # Memoized rows kept before the cache is cleared
+
+
+class GridBoard:
+    def __init__(self, size):
+        self.BOARD_SIZE = size
+        self.row_cache = {}
+        self.MOVES = {
+            'left': self.move_left,
+            'right': self.move_right,
+            'up': self.move_up,
+            'down': self.move_down,
+        }
+
+    def pack(self, board):
+        """Convert a list-of-lists board of tile values into a board of exponents"""
+        return tuple(tuple(value.bit_length() - 1 if value else 0 for value in row) for row in board)
+
+    def unpack(self, bits):
+        """Convert a board of exponents into a list-of-lists board of tile values"""
+        return [[1 << exponent if exponent else 0 for exponent in row] for row in bits]
+
+    def exponents(self, bits):
+        """Return every cell's exponent in row-major order"""
+        return [exponent for row in bits for exponent in row]
+
+    def empty_board(self):
+        return ((0,) * self.BOARD_SIZE,) * self.BOARD_SIZE
+
+    def get_cell(self, bits, i, j):
+        """Return the exponent stored at row i, column j"""
+        return bits[i][j]
+
+    def set_cell(self, bits, i, j, exponent):
+        """Return a new board with the exponent at row i, column j replaced"""
+        row = bits[i]
+        return bits[:i] + (row[:j] + (exponent,) + row[j + 1:],) + bits[i + 1:]
+
+    def transpose(self, bits):
+        """Transpose the board (rows become columns)"""
+        return tuple(zip(*bits))
+
+    def slide_row(self, row):
+        """Slide and merge one row of exponents to the left, returning (row, score, merged)"""
+        result = self.row_cache.get(row)
+        if result is not None:
+            return result
+        cells = [c for c in row if c != 0]
+        slid = []
+        score = 0
+        merged = 0
+        j = 0
+        while j < len(cells):
+            if j < len(cells) - 1 and cells[j] == cells[j + 1]:
+                exponent = cells[j] + 1
+                slid.append(exponent)
+                score += 1 << exponent
+                merged |= 1 << exponent
+                j += 2
+            else:
+                slid.append(cells[j])
+                j += 1
+        slid.extend([0] * (len(row) - len(slid)))
+        result = (tuple(slid), score, merged)
+        if len(self.row_cache) >= ROW_CACHE_SIZE:
+            self.row_cache.clear()
+        self.row_cache[row] = result
+        return result
+
+    def _move_rows(self, bits, reverse):
+        rows = []
+        score = 0
+        merged = 0
+        for row in bits:
+            if reverse:
+                row = row[::-1]
+            row, row_score, row_merged = self.slide_row(row)
+            rows.append(row[::-1] if reverse else row)
+            score += row_score
+            merged |= row_merged
+        return tuple(rows), score, merged
+
+    def move_left(self, bits):
+        """Move and merge tiles to the left, returning (bits, score, merged)"""
+        return self._move_rows(bits, False)
+
+    def move_right(self, bits):
+        """Move and merge tiles to the right, returning (bits, score, merged)"""
+        return self._move_rows(bits, True)
+
+    def move_up(self, bits):
+        """Move and merge tiles up, returning (bits, score, merged)"""
+        moved, score, merged = self._move_rows(self.transpose(bits), False)
+        return self.transpose(moved), score, merged
+
+    def move_down(self, bits):
+        """Move and merge tiles down, returning (bits, score, merged)"""
+        moved, score, merged = self._move_rows(self.transpose(bits), True)
+        return self.transpose(moved), score, merged
+
+    def empty_cells(self, bits):
+        """Return the (row, column) of every empty cell in row-major order"""
+        return [(i, j) for i, row in enumerate(bits) for j, exponent in enumerate(row) if not exponent]
+
+    def count_empty(self, bits):
+        """Count the empty cells on the board"""
+        return sum(row.count(0) for row in bits)
+
+    def max_exponent(self, bits):
+        """Return the largest exponent on the board"""
+        return max(max(row) for row in bits)
+
+    def can_move(self, bits):
+        """Check if any move is possible"""
+        for i, row in enumerate(bits):
+            below = bits[i + 1] if i + 1 < len(bits) else None
+            for j, exponent in enumerate(row):
+                if not exponent:
+                    return True
+                if j + 1 < len(row) and row[j + 1] == exponent:
+                    return True
+                if below is not None and below[j] == exponent:
+                    return True
+        return False
+
+    def add_random_tile(self, bits, rng=random):
+        """Add a random tile (2 or 4) to an empty cell"""
+        cells = self.empty_cells(bits)
+        if not cells:
+            return bits
+        i, j = rng.choice(cells)
+        return self.set_cell(bits, i, j, 1 if rng.random() < 0.9 else 2)
@@ -0,0 +1,107 @@
+import time
+
+import pygame
+
+from startup import STARTUP
+
+# Shared main loop scheduler for the games.
+# The simulation runs in fixed steps of 1 / tick_rate seconds, counted with
+# an accumulator against time.perf_counter, so a slow frame runs the missed
+# steps late instead of losing them. Rendering is capped separately at
+# render_rate, and between frames the loop sleeps instead of spinning.
+# Events are always fetched in full and handed out in order, including one
+# caught while blocking in an idle wait. The first wait after a frame was
+# drawn marks the end of the startup (see startup.py).
+
+
+class GameLoop:
+    """Fixed-timestep scheduler with a capped render rate
+
+    Each pass of a main loop calls events(), runs advance() simulation
+    steps, draws when render_due() and ends with wait(). tick_rate may be
+    changed at any time (None for games without a timed simulation). At
+    most max_ticks steps run in one pass; any further backlog is dropped so
+    a stalled machine does not spiral.
+    """
+
+    def __init__(self, tick_rate=None, render_rate=60, max_ticks=8, idle_timeout=0.5):
+        self.tick_rate = tick_rate
+        self.render_rate = render_rate
+        self.max_ticks = max_ticks
+        self.idle_timeout = idle_timeout
+        self.pending = []
+        self.accumulator = 0.0
+        self.last = time.perf_counter()
+        self.next_render = self.last
+        self.render_pending = False
+        self.ticks = 0
+        self.frames = 0
+
+    def events(self):
+        """Return every event waiting, oldest first"""
+        events = pygame.event.get()
+        if self.pending:
+            events[:0] = self.pending
+            self.pending = []
+        return events
+
+    def advance(self, running=True):
+        """Return how many simulation steps are due since the last call
+
+        While not running (paused, game over) the elapsed time is discarded.
+        """
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        if not running or not self.tick_rate:
+            self.accumulator = 0.0
+            return 0
+
+        step = 1.0 / self.tick_rate
+        self.accumulator += elapsed
+        ticks = int(self.accumulator / step)
+        if ticks > self.max_ticks:
+            ticks = self.max_ticks
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= ticks * step
+        self.ticks += ticks
+        return ticks
+
+    def render_due(self):
+        """Check whether a frame may be drawn now without going over render_rate"""
+        now = time.perf_counter()
+        if now < self.next_render:
+            self.render_pending = True
+            return False
+        interval = 1.0 / self.render_rate
+        # Don't try to make up for frames that were never drawn
+        self.next_render = max(self.next_render + interval, now)
+        self.render_pending = False
+        self.frames += 1
+        return True
+
+    def wait(self, idle=False):
+        """Sleep until the next simulation step or frame is due
+
+        When idle, block until an event arrives instead (or idle_timeout
+        passes), unless a frame is still waiting to be drawn.
+        """
+        if self.frames and not STARTUP.done:
+            STARTUP.first_frame()
+        if idle and not self.render_pending:
+            event = pygame.event.wait(int(self.idle_timeout * 1000))
+            if event.type != pygame.NOEVENT:
+                self.pending.append(event)
+            return
+        # The held back frame gets drawn on the next pass, or is dropped
+        self.render_pending = False
+
+        # Without a frame scheduled, poll again one frame from now
+        now = time.perf_counter()
+        deadline = self.next_render if self.next_render > now else now + 1.0 / self.render_rate
+        if self.tick_rate:
+            deadline = min(deadline, self.last + 1.0 / self.tick_rate - self.accumulator)
+        delay = deadline - now
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,306 @@
+import csv
+import gc
+import json
+import sys
+import time
+from collections import deque
+
+import pygame
+
+from text_cache import get_font
+
+# Frame profiler and hot-path instrumentation shared by the games.
+# Functions and methods registered with watch() are only wrapped with timers
+# while the profiler is enabled and are put back untouched when it is
+# disabled, so a disabled profiler costs one flag check per frame. Main
+# loops call frame() at the top of every pass and lap(name) after each
+# phase; everything else is collected from the watched functions.
+#
+# Per frame it keeps the wall time between frames, the time of each phase,
+# the number of pygame.draw calls and the change in allocated memory blocks
+# (sys.getallocatedblocks), plus garbage collections. Every window seconds
+# the frames are summed up for the overlay and, if an export file is set,
+# appended to it as a JSON line (.json/.jsonl) or as metric,value CSV rows.
+
+OVERLAY_FONT_SIZE = 18
+OVERLAY_BACKGROUND = (0, 0, 0)
+OVERLAY_COLOR = (255, 255, 0)
+OVERLAY_SCOPES = 6  # Slowest scopes listed on the overlay
+
+# pygame.draw functions counted as draw calls
+DRAW_FUNCTIONS = ('rect', 'line', 'lines', 'circle', 'ellipse', 'polygon', 'arc', 'aaline', 'aalines')
+
+
+class _NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def percentile(ordered, fraction):
+    """Return the value at a fraction (0-1) of a sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Profiler:
+    def __init__(self, window=1.0, history=600):
+        self.window = window
+        self.enabled = False
+        self.overlay = False
+        self.export_path = None
+        self.targets = []  # (namespace, attribute, scope name)
+        self.originals = {}  # (id of namespace, attribute) -> (namespace, original)
+        self.frame_times = deque(maxlen=history)
+        self.summary = {}
+        self.overlay_surface = None
+        self.overlay_size = (0, 0)
+        self.reset()
+
+    def reset(self):
+        """Forget everything measured in the current window"""
+        self.scopes = {}  # name -> [calls, seconds]
+        self.frames = 0
+        self.draw_calls = 0
+        self.alloc_blocks = 0
+        self.collections = 0
+        self.window_start = time.perf_counter()
+        self.last_frame = None
+        self.lap_start = None
+        self.blocks = sys.getallocatedblocks()
+
+    def watch(self, namespace, attribute, name=None):
+        """Time every call of namespace.attribute (a module function or a method) while enabled"""
+        name = name or attribute
+        self.targets.append((namespace, attribute, name))
+        if self.enabled:
+            self.install(namespace, attribute, name)
+
+    def install(self, namespace, attribute, name, counter=False):
+        key = (id(namespace), attribute)
+        if key in self.originals:
+            return
+        original = vars(namespace)[attribute]
+        function = getattr(namespace, attribute)
+        profiler = self
+
+        if counter:
+            def wrapper(*args, **kwargs):
+                profiler.draw_calls += 1
+                return function(*args, **kwargs)
+        else:
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    profiler.add(name, time.perf_counter() - start)
+        wrapper.__wrapped__ = function
+        self.originals[key] = (namespace, original)
+        setattr(namespace, attribute, wrapper)
+
+    def enable(self):
+        """Start measuring, wrapping the watched functions"""
+        if self.enabled:
+            return
+        self.enabled = True
+        for namespace, attribute, name in self.targets:
+            self.install(namespace, attribute, name)
+        for attribute in DRAW_FUNCTIONS:
+            if hasattr(pygame.draw, attribute):
+                self.install(pygame.draw, attribute, None, counter=True)
+        gc.callbacks.append(self.on_gc)
+        self.reset()
+
+    def disable(self):
+        """Stop measuring and put the original functions back"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        for (_, attribute), (namespace, original) in self.originals.items():
+            setattr(namespace, attribute, original)
+        self.originals.clear()
+        gc.callbacks.remove(self.on_gc)
+
+    def toggle(self):
+        """Switch the profiler and its overlay on or off, returning the new state"""
+        if self.enabled and self.overlay:
+            self.overlay = False
+            if self.export_path is None:
+                self.disable()
+        else:
+            self.enable()
+            self.overlay = True
+            self.overlay_size = (0, 0)
+        return self.overlay
+
+    def on_gc(self, phase, info):
+        if phase == 'start':
+            self.collections += 1
+
+    def add(self, name, seconds):
+        stats = self.scopes.get(name)
+        if stats is None:
+            self.scopes[name] = [1, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+
+    def scope(self, name):
+        """Context manager timing a block under a name (free when disabled)"""
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def lap(self, name):
+        """Charge the time since the frame started or the last lap to a phase"""
+        if not self.enabled or self.lap_start is None:
+            return
+        now = time.perf_counter()
+        self.add(name, now - self.lap_start)
+        self.lap_start = now
+
+    def frame(self):
+        """Mark the start of a main loop pass"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frame_times.append(now - self.last_frame)
+            self.frames += 1
+        self.last_frame = now
+        self.lap_start = now
+        blocks = sys.getallocatedblocks()
+        self.alloc_blocks += blocks - self.blocks
+        self.blocks = blocks
+
+        if now - self.window_start >= self.window and self.frames:
+            self.summary = self.report(now)
+            self.overlay_surface = None
+            if self.export_path is not None:
+                self.export(self.export_path, self.summary)
+            self.reset()
+            self.last_frame = self.lap_start = now
+
+    def report(self, now=None):
+        """Summary of the current window: frame time percentiles and per-frame averages"""
+        now = time.perf_counter() if now is None else now
+        frames = max(self.frames, 1)
+        ordered = sorted(self.frame_times)
+        return {
+            'time': time.time(),
+            'frames': self.frames,
+            'fps': self.frames / (now - self.window_start),
+            'frame_ms_p50': percentile(ordered, 0.50) * 1000,
+            'frame_ms_p95': percentile(ordered, 0.95) * 1000,
+            'frame_ms_p99': percentile(ordered, 0.99) * 1000,
+            'frame_ms_max': (ordered[-1] if ordered else 0.0) * 1000,
+            'draw_calls_per_frame': self.draw_calls / frames,
+            'alloc_blocks_per_frame': self.alloc_blocks / frames,
+            'gc_collections': self.collections,
+            'scopes': {
+                name: {'calls_per_frame': calls / frames, 'ms_per_frame': seconds * 1000 / frames}
+                for name, (calls, seconds) in self.scopes.items()
+            },
+        }
+
+    def export(self, path, summary):
+        """Append a summary to a JSON lines or CSV file"""
+        if path.endswith('.csv'):
+            rows = [(name, value) for name, value in summary.items() if name not in ('time', 'scopes')]
+            for name, stats in summary['scopes'].items():
+                rows.append((f'{name}.calls_per_frame', stats['calls_per_frame']))
+                rows.append((f'{name}.ms_per_frame', stats['ms_per_frame']))
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if f.tell() == 0:
+                    writer.writerow(['time', 'metric', 'value'])
+                for name, value in rows:
+                    writer.writerow([summary['time'], name, value])
+        else:
+            with open(path, 'a') as f:
+                f.write(json.dumps(summary) + '\n')
+
+    def overlay_lines(self):
+        summary = self.summary
+        if not summary:
+            return ["Profiling..."]
+        lines = [
+            f"{summary['fps']:.0f} fps  frame ms p50 {summary['frame_ms_p50']:.1f}"
+            f"  p95 {summary['frame_ms_p95']:.1f}  p99 {summary['frame_ms_p99']:.1f}",
+            f"draw calls {summary['draw_calls_per_frame']:.0f}/frame"
+            f"  allocs {summary['alloc_blocks_per_frame']:+.0f} blocks/frame"
+            f"  gc {summary['gc_collections']}",
+        ]
+        scopes = sorted(summary['scopes'].items(), key=lambda item: item[1]['ms_per_frame'], reverse=True)
+        for name, stats in scopes[:OVERLAY_SCOPES]:
+            lines.append(f"{name}: {stats['ms_per_frame']:.2f} ms  x{stats['calls_per_frame']:.1f}")
+        return lines
+
+    def draw_overlay(self, surface, position=(0, 0)):
+        """Draw the overlay if it is on, returning the rect it covers (or None)"""
+        if not self.overlay:
+            return None
+        if self.overlay_surface is None:
+            # Rebuilt once per window; the numbers change too often for the text cache
+            font = get_font(None, OVERLAY_FONT_SIZE)
+            labels = [font.render(line, True, OVERLAY_COLOR) for line in self.overlay_lines()]
+            height = font.get_linesize()
+            # Never shrink, so no stale text is left around a smaller overlay
+            self.overlay_size = (
+                max(self.overlay_size[0], max(label.get_width() for label in labels) + 8),
+                max(self.overlay_size[1], height * len(labels) + 8),
+            )
+            self.overlay_surface = pygame.Surface(self.overlay_size)
+            self.overlay_surface.fill(OVERLAY_BACKGROUND)
+            for i, label in enumerate(labels):
+                self.overlay_surface.blit(label, (4, 4 + i * height))
+        return surface.blit(self.overlay_surface, position)
+
+    def show_overlay(self, surface):
+        """Draw the overlay on the display surface and update just its rect"""
+        rect = self.draw_overlay(surface)
+        if rect is not None:
+            pygame.display.update(rect)
+
+
+# The profiler used by all the games
+PROFILER = Profiler()
+
+
+def profile_path(argv=None):
+    """Return the file given as --profile PATH on the command line, or None"""
+    argv = sys.argv[1:] if argv is None else argv
+    if '--profile' in argv:
+        i = argv.index('--profile')
+        if i + 1 < len(argv):
+            return argv[i + 1]
+    return None
+
+
+def start_export(path):
+    """Enable the profiler and append a summary to path every window"""
+    PROFILER.export_path = path
+    PROFILER.enable()
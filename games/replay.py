@@ -0,0 +1,488 @@
+import atexit
+import importlib
+import struct
+import sys
+import time
+
+# Deterministic replays for all the games.
+# Every logic class draws its randomness (Tetris pieces, 2048 tiles, Snake
+# food) from its own generator, so a replay only needs the seed and the
+# commands the main loop applied, each stamped with the frame it happened on.
+# Frames are counted on a clock at the recorded frame rate rather than per
+# pass of the main loop, which may sit idle waiting for a key, so replays
+# play back at the pace they were played.
+#
+# File layout, all little-endian:
+#   header  b'RPLY', version (u8), game name (u8 length + ascii),
+#           seed (u64), snapshot interval (u32), frame rate (u16, 0 = the game's fps),
+#           board width and height (u16 each),
+#           variant (u8 length + ascii: the Tetris piece generator)
+#   chunks  tag (1 byte), payload length (u32), payload
+#     b'I'  base frame (u32), then records: frame delta (varint),
+#           command code (u8), one zigzag varint per command argument
+#     b'S'  frame (u32), the game's state record (its snapshot's to_bytes())
+#           taken before that frame's commands
+#     b'E'  last frame (u32)
+# Chunks are read one at a time, so replays of any length stream from disk,
+# and snapshots let playback seek without replaying from the start.
+
+MAGIC = b'RPLY'
+VERSION = 1
+SNAPSHOT_INTERVAL = 600  # Frames between state snapshots
+CHUNK_RECORDS = 4096  # Commands buffered before an input chunk is written
+
+INPUT, SNAPSHOT, END = b'I', b'S', b'E'
+_CHUNK = struct.Struct('<cI')
+_U32 = struct.Struct('<I')
+
+# Commands each game can record, by code
+COMMANDS = {
+    '2048': ('left', 'right', 'up', 'down', 'reset', 'continue'),
+    'tetris': ('noop', 'left', 'right', 'down', 'rotate', 'drop', 'fall', 'reset', 'place'),
+    'snake': ('up', 'down', 'left', 'right', 'update', 'reset'),
+}
+
+# Number of integer arguments of the commands that take any
+ARITY = {'place': 2}  # Rotations and column
+
+# Logic class each game is replayed with
+LOGIC = {
+    '2048': ('game2048_logic', 'Game2048Logic'),
+    'tetris': ('tetris_logic', 'TetrisLogic'),
+    'snake': ('snake_logic', 'SnakeLogic'),
+}
+
+# State record class of each game, which snapshots are decoded with
+STATE = {
+    '2048': ('game2048_logic', 'Game2048State'),
+    'tetris': ('tetris_logic', 'TetrisState'),
+    'snake': ('snake_logic', 'SnakeState'),
+}
+
+
+def _apply_2048(game, command, args):
+    if command == 'reset':
+        game.reset()
+    elif command == 'continue':
+        game.game_won = False  # Continue playing after winning
+    else:
+        game.make_move(command)
+
+
+def _apply_tetris(game, command, args):
+    if command == 'fall':
+        game.fall()
+    elif command == 'reset':
+        game.reset()
+    elif command == 'place':
+        # Imported here so 2048 and Snake never load the bot
+        from tetris_ai import play_move
+        play_move(game, *args)
+    else:
+        game.handle(command)
+
+
+def _apply_snake(game, command, args):
+    from snake_logic import UP, DOWN, LEFT, RIGHT
+    if command == 'update':
+        game.update()
+    elif command == 'reset':
+        game.reset()
+    else:
+        game.snake.turn({'up': UP, 'down': DOWN, 'left': LEFT, 'right': RIGHT}[command])
+
+
+APPLY = {'2048': _apply_2048, 'tetris': _apply_tetris, 'snake': _apply_snake}
+
+
+def logic_class(name):
+    """Return the pygame-free logic class a game is replayed with"""
+    module, cls = LOGIC[name]
+    return getattr(importlib.import_module(module), cls)
+
+
+def state_class(name):
+    """Return the class of a game's snapshots"""
+    module, cls = STATE[name]
+    return getattr(importlib.import_module(module), cls)
+
+
+def board_size(name, game):
+    """Return the (width, height) of a game's board"""
+    if name == '2048':
+        return game.size, game.size
+    return game.width, game.height
+
+
+def game_variant(name, game):
+    """Return the name of the rules a game plays by, beyond its board size"""
+    if name == 'tetris':
+        return game.generator.name
+    return ''
+
+
+def new_game(name, seed, size=None, cls=None, variant=''):
+    """Create a game of a logic class (by default the game's own) with a board size and variant"""
+    cls = cls or logic_class(name)
+    if size is None:
+        args = ()
+    elif name == '2048':
+        args = (size[0],)
+    else:
+        args = tuple(size)
+    if variant:
+        return cls(seed, *args, generator=variant)
+    return cls(seed, *args)
+
+
+def write_varint(buffer, value):
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def zigzag(value):
+    """Map a signed int to an unsigned one (0, -1, 1, -2, ... to 0, 1, 2, 3, ...)"""
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def read_varint(data, offset):
+    """Return (value, offset after it)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def option(name, argv=None):
+    """Return the value given as NAME VALUE on the command line, or None"""
+    argv = sys.argv[1:] if argv is None else argv
+    if name in argv:
+        i = argv.index(name)
+        if i + 1 < len(argv):
+            return argv[i + 1]
+    return None
+
+
+def record_path(argv=None):
+    """Return the file given as --record PATH on the command line, or None"""
+    return option('--record', argv)
+
+
+def size_option(argv=None):
+    """Return the board size given as --size WIDTHxHEIGHT on the command line, or None"""
+    size = option('--size', argv)
+    if size is None:
+        return None
+    width, _, height = size.lower().partition('x')
+    return int(width), int(height or width)
+
+
+class NullRecorder:
+    """Applies commands to a game without recording them"""
+
+    def __init__(self, name, game):
+        self.name = name
+        self.game = game
+        self.apply_command = APPLY[name]
+        self.frame = -1
+
+    def tick(self):
+        self.frame += 1
+
+    def apply(self, command, *args):
+        """Apply a command to the game"""
+        self.apply_command(self.game, command, args)
+
+    def close(self):
+        pass
+
+
+class Recorder(NullRecorder):
+    """Applies commands to a game and records them to a replay file
+
+    Call tick() at the start of every main loop pass and route every
+    command that changes the game through apply(). With a frame rate, a
+    pass is stamped with the number of frame periods since the first one
+    (passes within one period share a frame, an idle wait skips frames);
+    without one, every pass is a frame. The file is finished on close(),
+    which also runs at interpreter exit.
+    """
+
+    def __init__(self, path, name, game, seed, frame_rate=0,
+                 snapshot_interval=SNAPSHOT_INTERVAL, chunk_records=CHUNK_RECORDS):
+        super().__init__(name, game)
+        self.codes = {command: code for code, command in enumerate(COMMANDS[name])}
+        self.snapshot_interval = snapshot_interval
+        self.chunk_records = chunk_records
+        self.file = open(path, 'wb')
+        encoded = name.encode('ascii')
+        variant = game_variant(name, game).encode('ascii')
+        self.file.write(MAGIC + struct.pack('<BB', VERSION, len(encoded)) + encoded
+                        + struct.pack('<QIH', seed, snapshot_interval, frame_rate)
+                        + struct.pack('<HHB', *board_size(name, game), len(variant)) + variant)
+        self.buffer = bytearray()
+        self.records = 0
+        self.base_frame = 0
+        self.last_frame = 0
+        self.frame_rate = frame_rate
+        self.started = None  # Clock time of the first frame
+        self.next_snapshot = 0
+        atexit.register(self.close)
+
+    def tick(self):
+        """Start a new frame, writing a snapshot every snapshot_interval frames"""
+        if self.frame_rate:
+            now = time.perf_counter()
+            if self.started is None:
+                self.started = now
+            self.frame = max(self.frame, int((now - self.started) * self.frame_rate))
+        else:
+            self.frame += 1
+        if self.frame >= self.next_snapshot:
+            self.flush()
+            self.write_chunk(SNAPSHOT, _U32.pack(self.frame) + self.game.snapshot().to_bytes())
+            self.next_snapshot = (self.frame // self.snapshot_interval + 1) * self.snapshot_interval
+
+    def apply(self, command, *args):
+        """Record a command on the current frame and apply it to the game"""
+        if not self.records:
+            self.base_frame = self.last_frame = self.frame
+        buffer = self.buffer
+        write_varint(buffer, self.frame - self.last_frame)
+        buffer.append(self.codes[command])
+        for arg in args:
+            write_varint(buffer, zigzag(arg))
+        self.last_frame = self.frame
+        self.records += 1
+        if self.records >= self.chunk_records:
+            self.flush()
+        self.apply_command(self.game, command, args)
+
+    def flush(self):
+        """Write the buffered commands as an input chunk"""
+        if self.records:
+            self.write_chunk(INPUT, _U32.pack(self.base_frame) + bytes(self.buffer))
+            self.buffer.clear()
+            self.records = 0
+
+    def write_chunk(self, tag, payload):
+        self.file.write(_CHUNK.pack(tag, len(payload)))
+        self.file.write(payload)
+
+    def close(self):
+        """Write any buffered commands and the end marker, and close the file"""
+        if self.file is None:
+            return
+        self.flush()
+        self.write_chunk(END, _U32.pack(max(self.frame, 0)))
+        self.file.close()
+        self.file = None
+        atexit.unregister(self.close)
+
+
+def recorder(path, name, game, seed, frame_rate=0):
+    """Return a Recorder writing to path, or a NullRecorder when path is None"""
+    if path is None:
+        return NullRecorder(name, game)
+    return Recorder(path, name, game, seed, frame_rate)
+
+
+class Player:
+    """Plays a replay file back into a game
+
+    The game defaults to a new instance of the game's logic class, but any
+    subclass (such as a renderer) can be passed in. Only the chunk headers
+    are read up front; commands are decoded one chunk at a time.
+    """
+
+    def __init__(self, path, game=None):
+        self.file = open(path, 'rb')
+        header = self.file.read(6)
+        if header[:4] != MAGIC:
+            raise ValueError(f"{path} is not a replay file")
+        if header[4] != VERSION:
+            raise ValueError(f"Unsupported replay version {header[4]}")
+        self.name = self.file.read(header[5]).decode('ascii')
+        self.seed, self.snapshot_interval, self.frame_rate = struct.unpack('<QIH', self.file.read(14))
+        self.size = struct.unpack('<HH', self.file.read(4))
+        self.variant = self.file.read(self.file.read(1)[0]).decode('ascii')
+        self.state_class = state_class(self.name)
+        self.commands = COMMANDS[self.name]
+        self.apply_command = APPLY[self.name]
+        self.game = game if game is not None else new_game(self.name, self.seed, self.size, variant=self.variant)
+
+        # (tag, file offset of the payload, payload length, frame) of every chunk
+        self.chunks = []
+        self.last_frame = 0
+        while True:
+            header = self.file.read(_CHUNK.size)
+            if len(header) < _CHUNK.size:
+                break  # Recording was cut off; play what is there
+            tag, length = _CHUNK.unpack(header)
+            offset = self.file.tell()
+            data = self.file.read(4)
+            if len(data) < 4:
+                break
+            frame = _U32.unpack(data)[0]
+            self.chunks.append((tag, offset, length, frame))
+            self.last_frame = max(self.last_frame, frame)
+            if tag == END:
+                break
+            self.file.seek(offset + length)
+        self.rewind()
+
+    def rewind(self):
+        self.seek(0)
+
+    def events(self, start):
+        """Yield (frame, command, args) for every command from chunk index start on"""
+        commands = self.commands
+        for tag, offset, length, frame in self.chunks[start:]:
+            if tag != INPUT:
+                continue
+            self.file.seek(offset)
+            data = self.file.read(length)
+            position = 4
+            while position < length:
+                delta, position = read_varint(data, position)
+                frame += delta
+                command = commands[data[position]]
+                position += 1
+                args = []
+                for _ in range(ARITY.get(command, 0)):
+                    value, position = read_varint(data, position)
+                    args.append(unzigzag(value))
+                yield frame, command, args
+
+    def seek(self, frame):
+        """Put the game in its state at the start of a frame"""
+        start = None
+        for i, (tag, offset, length, chunk_frame) in enumerate(self.chunks):
+            if tag == SNAPSHOT and chunk_frame <= frame:
+                start = i
+        if start is None:
+            self.game.reset(self.seed)
+            start = 0
+            self.frame = 0
+        else:
+            _, offset, length, self.frame = self.chunks[start]
+            self.file.seek(offset + 4)
+            self.game.restore(self.state_class.from_bytes(self.file.read(length - 4)))
+        self.stream = self.events(start)
+        self.pending = next(self.stream, None)
+        while self.frame < frame and self.advance():
+            pass
+        self.frame = frame
+
+    def advance(self):
+        """Apply the current frame's commands and move to the next frame
+
+        Returns False once the replay has ended.
+        """
+        game = self.game
+        while self.pending is not None and self.pending[0] <= self.frame:
+            _, command, args = self.pending
+            self.apply_command(game, command, args)
+            self.pending = next(self.stream, None)
+        self.frame += 1
+        return self.pending is not None or self.frame <= self.last_frame
+
+    def play(self, realtime=False, draw=None):
+        """Play to the end, as fast as possible or at the recorded frame rate
+
+        draw, if given, is called with the game after every frame.
+        """
+        clock = None
+        if realtime:
+            import pygame
+            clock = pygame.time.Clock()
+        while self.advance():
+            if draw is not None:
+                draw(self.game)
+            if clock is not None:
+                clock.tick(self.frame_rate or getattr(self.game, 'fps', 60))
+        return self.game
+
+    def close(self):
+        self.file.close()
+
+
+def _view(name, seed, size=None, variant=''):
+    """Open a window for a game and return (game, draw) for watching a replay"""
+    import startup
+    import pygame
+    startup.init_pygame()
+    if name == '2048':
+        import Game2048
+        screen = pygame.display.set_mode((Game2048.WIDTH, Game2048.HEIGHT))
+        game = new_game(name, seed, size, Game2048.Game2048)
+
+        def draw(game):
+            if game.draw(screen):
+                pygame.display.flip()
+    elif name == 'tetris':
+        import tetris
+        screen = pygame.display.set_mode((tetris.WIDTH, tetris.HEIGHT))
+        game = new_game(name, seed, size, variant=variant)
+        renderer = tetris.TetrisRenderer(screen, tetris.play_layout(game.width, game.height))
+
+        def draw(game):
+            renderer.draw(game)
+    else:
+        import snake_game
+        game = new_game(name, seed, size)
+        view = snake_game.Viewport(game.width, game.height)
+        screen = pygame.display.set_mode(view.size)
+
+        def draw(game):
+            snake_game.draw_frame(screen, game, view)
+            pygame.display.update()
+    pygame.display.set_caption(f"Replay - {name}")
+
+    def draw_and_poll(game):
+        draw(game)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+    return game, draw_and_poll
+
+
+def main(argv=None):
+    """python replay.py FILE [--realtime] [--seek FRAME]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(main.__doc__)
+        return
+    path = argv[0]
+    seek = int(argv[argv.index('--seek') + 1]) if '--seek' in argv else 0
+
+    if '--realtime' in argv:
+        player = Player(path)
+        game, draw = _view(player.name, player.seed, player.size, player.variant)
+        player.game = game
+        player.seek(seek)
+        player.play(realtime=True, draw=draw)
+    else:
+        start = time.perf_counter()
+        player = Player(path)
+        player.seek(seek)
+        game = player.play()
+        elapsed = time.perf_counter() - start
+        print(f"{player.name}: {player.frame} frames in {elapsed:.3f}s, score {game.score}")
+    player.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import replay
+
+# Persistent scores for all the games.
+# Every finished game is stored as a session (score, duration and a few
+# game-specific stats) in one SQLite database in WAL mode. Main loops never
+# touch the disk: record() only queues the session, and a background writer
+# thread commits whatever has queued up in one transaction, at most
+# FLUSH_INTERVAL seconds later. WAL keeps the database intact if the game
+# crashes mid-write, losing at most the last unflushed batch, and lets the
+# leaderboard be read while the writer commits. A batch that fails to commit
+# (a locked or full database, a bad row) is retried one write at a time,
+# and only the writes that fail again are dropped, with a message on
+# stderr. Leaderboards are one index range scan on (game, variant, score).
+# compact() drops old sessions that are off the leaderboard.
+#
+#   python scores.py tetris            show the Tetris leaderboard
+#   python scores.py --compact 90      drop off-leaderboard sessions older than 90 days
+#
+# The database lives at $GAMES_SCORES, or ~/.games/scores.db; setting
+# GAMES_SCORES to an empty string turns scores off.
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.games', 'scores.db')
+FLUSH_INTERVAL = 0.5  # Seconds a recorded session may wait before it is committed
+BATCH_SIZE = 256  # Sessions committed per transaction at most
+LEADERBOARD_SIZE = 10
+KEEP_TOP = 100  # Sessions per leaderboard that compaction never drops
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    game TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    player TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    stats TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_leaderboard ON sessions (game, variant, score DESC);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+"""
+
+# One stored game. variant is the board size and rules (see game_variant),
+# started a Unix time, duration in seconds and stats a dict from game_stats.
+Session = namedtuple('Session', ['id', 'game', 'variant', 'player', 'score', 'started', 'duration', 'stats'])
+
+
+def game_stats(name, game):
+    """Game-specific measure of how far a game got"""
+    if name == '2048':
+        return {'max_tile': 1 << game.backend.max_exponent(game.bits)}
+    if name == 'tetris':
+        return {'lines': game.lines_cleared_total, 'level': game.level}
+    return {'length': game.snake.length}
+
+
+def game_variant(name, game):
+    """Board size and rules of a game, e.g. '4x4' or '10x20 bag'"""
+    variant = '%dx%d' % replay.board_size(name, game)
+    rules = replay.game_variant(name, game)
+    return f"{variant} {rules}" if rules else variant
+
+
+def connect(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10)
+    connection.execute('PRAGMA journal_mode=WAL')
+    # With WAL a commit is safe against crashes without a sync on every transaction
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class ScoreStore:
+    """Sessions in a SQLite database, written by a background thread
+
+    record() and compact() go through the writer's queue and return at
+    once; flush() waits until everything queued so far is committed.
+    Queries read the database directly and see committed sessions.
+    """
+
+    def __init__(self, path=None, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        self.path = path or DEFAULT_PATH
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        connection = connect(self.path)
+        with connection:
+            connection.executescript(SCHEMA)
+        self.reader = connection
+        self.reader_thread = threading.get_ident()
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name='scores-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def record(self, game, score, duration, stats=None, variant='', player='', started=None):
+        """Queue a finished game to be stored"""
+        if started is None:
+            started = time.time() - duration
+        self.queue.put(('insert', (game, variant, player, score, started, duration,
+                                   json.dumps(stats or {}, sort_keys=True))))
+
+    def compact(self, max_age_days, keep=KEEP_TOP):
+        """Queue the removal of sessions older than max_age_days, except each leaderboard's top keep"""
+        self.queue.put(('compact', (time.time() - max_age_days * 86400, keep)))
+
+    def flush(self):
+        """Wait for every queued write to be committed, or the writer to stop"""
+        done = self.queue.all_tasks_done
+        with done:
+            while self.queue.unfinished_tasks and self.writer is not None and self.writer.is_alive():
+                done.wait(0.1)
+
+    def close(self):
+        """Commit what is queued and stop the writer"""
+        if self.writer is None:
+            return
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        self.writer = None
+        if threading.get_ident() == self.reader_thread:
+            self.reader.close()
+        atexit.unregister(self.close)
+
+    def write_loop(self):
+        connection = connect(self.path)
+        jobs = self.queue
+        running = True
+        while running:
+            batch = [jobs.get()]
+            # Let a burst of sessions queue up, then write them together
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(jobs.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                running = False
+            try:
+                done = [job for job in batch if job is not None]
+                self.write_batch(connection, done)
+                if any(kind == 'compact' for kind, _ in done):
+                    self.reclaim(connection)
+            finally:
+                for _ in batch:
+                    jobs.task_done()
+        connection.close()
+
+    def write_batch(self, connection, jobs):
+        try:
+            self.write(connection, jobs)
+        except sqlite3.Error as error:
+            if len(jobs) == 1:
+                print(f"scores: could not {jobs[0][0]}: {error}", file=sys.stderr)
+                return
+            # The transaction was rolled back; keep every write that succeeds alone
+            for job in jobs:
+                self.write_batch(connection, [job])
+
+    def write(self, connection, jobs):
+        with connection:
+            inserts = [row for kind, row in jobs if kind == 'insert']
+            if inserts:
+                connection.executemany(
+                    'INSERT INTO sessions (game, variant, player, score, started, duration, stats) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', inserts)
+            for kind, args in jobs:
+                if kind == 'compact':
+                    connection.execute(
+                        'DELETE FROM sessions WHERE started < ? AND id NOT IN ('
+                        ' SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+                        '  PARTITION BY game, variant ORDER BY score DESC) AS rank FROM sessions)'
+                        ' WHERE rank <= ?)', args)
+
+    def reclaim(self, connection):
+        """Fold the WAL back into the database and give the space back"""
+        # Apart from write(): the sessions are committed by now, and a failure
+        # here must not make write_batch() insert them again
+        try:
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            connection.execute('VACUUM')
+        except sqlite3.Error as error:
+            print(f"scores: could not reclaim space: {error}", file=sys.stderr)
+
+    def leaderboard(self, game, variant=None, limit=LEADERBOARD_SIZE):
+        """The best sessions of a game, of one variant or of all of them"""
+        if variant is None:
+            rows = self.reader.execute(
+                'SELECT * FROM sessions WHERE game = ? ORDER BY score DESC LIMIT ?', (game, limit))
+        else:
+            rows = self.reader.execute(
+                'SELECT * FROM sessions WHERE game = ? AND variant = ? ORDER BY score DESC LIMIT ?',
+                (game, variant, limit))
+        return [Session(*row[:-1], json.loads(row[-1])) for row in rows]
+
+    def best(self, game, variant):
+        """The best score of a game variant, or 0"""
+        row = self.reader.execute(
+            'SELECT MAX(score) FROM sessions WHERE game = ? AND variant = ?', (game, variant)).fetchone()
+        return row[0] or 0
+
+    def recent(self, limit=LEADERBOARD_SIZE):
+        """The sessions started last, of any game"""
+        rows = self.reader.execute('SELECT * FROM sessions ORDER BY started DESC LIMIT ?', (limit,))
+        return [Session(*row[:-1], json.loads(row[-1])) for row in rows]
+
+
+class NullStore:
+    """Stands in for a ScoreStore when scores are off"""
+
+    def record(self, *args, **kwargs):
+        pass
+
+    def best(self, game, variant):
+        return 0
+
+    def close(self):
+        pass
+
+
+def open_store():
+    """Return the ScoreStore at $GAMES_SCORES or the default path, or a NullStore if scores are off"""
+    path = os.environ.get('GAMES_SCORES')
+    if path == '':
+        return NullStore()
+    try:
+        return ScoreStore(path)
+    except sqlite3.Error:
+        return NullStore()
+
+
+class SessionTracker:
+    """Records each game a main loop plays as a session
+
+    Call update() once per frame, which records a game as soon as it is
+    over, and finish() and start() around a restart. A game still going
+    at exit is recorded then.
+    """
+
+    def __init__(self, store, name, game):
+        self.store = store
+        self.name = name
+        self.game = game
+        self.variant = game_variant(name, game)
+        self.start()
+        atexit.register(self.finish)
+
+    def start(self):
+        self.started = time.time()
+        self.recorded = False
+
+    def update(self):
+        if self.game.game_over and not self.recorded:
+            self.finish()
+
+    def finish(self):
+        """Record the current game, unless it already was or never scored"""
+        if self.recorded:
+            return
+        self.recorded = True
+        game = self.game
+        if game.score or game.game_over:
+            self.store.record(self.name, game.score, time.time() - self.started,
+                              game_stats(self.name, game), self.variant, started=self.started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the leaderboards or compact the score database")
+    parser.add_argument('game', nargs='?', choices=('2048', 'tetris', 'snake'),
+                        help="game to show (default: the most recent sessions)")
+    parser.add_argument('--variant', help="board size and rules, e.g. 10x20 random")
+    parser.add_argument('--limit', type=int, default=LEADERBOARD_SIZE)
+    parser.add_argument('--compact', type=float, metavar='DAYS',
+                        help="drop sessions older than DAYS that are off the leaderboards")
+    parser.add_argument('--keep', type=int, default=KEEP_TOP, help="leaderboard places compaction keeps")
+    args = parser.parse_args(argv)
+
+    store = ScoreStore(os.environ.get('GAMES_SCORES') or None)
+    if args.compact is not None:
+        store.compact(args.compact, args.keep)
+        store.flush()
+    sessions = (store.leaderboard(args.game, args.variant, args.limit) if args.game
+                else store.recent(args.limit))
+    for rank, session in enumerate(sessions, 1):
+        when = time.strftime('%Y-%m-%d %H:%M', time.localtime(session.started))
+        stats = ', '.join(f"{key} {value}" for key, value in session.stats.items())
+        print(f"{rank:3}. {session.game:6} {session.variant:12} {session.score:>9}  "
+              f"{session.duration:7.1f}s  {when}  {stats}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
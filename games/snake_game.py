@@ -1,17 +1,23 @@
 import pygame
 import random
-import time
 import sys
+from collections import deque
 
-# Initialize pygame
-pygame.init()
+import replay
+import scores
+import spectate
+import startup
+from loop import GameLoop
+from profiler import PROFILER, profile_path, start_export
+from text_cache import render_text
+from snake_logic import GRID_WIDTH, GRID_HEIGHT, Snake, SnakeLogic
 
 # Constants
-WIDTH, HEIGHT = 600, 600
 GRID_SIZE = 20
-GRID_WIDTH = WIDTH // GRID_SIZE
-GRID_HEIGHT = HEIGHT // GRID_SIZE
-FPS = 10  # Start speed
+RENDER_FPS = 60  # Input is polled and the screen redrawn at this rate
+MAX_QUEUED_TURNS = 3  # Turns pressed faster than the snake moves wait their turn
+VIEW_CELLS = 30  # Larger boards scroll, showing at most this many cells each way
+WIDTH, HEIGHT = GRID_WIDTH * GRID_SIZE, GRID_HEIGHT * GRID_SIZE
 
 # Colors
 BLACK = (0, 0, 0)
@@ -20,157 +26,192 @@ GREEN = (0, 255, 0)
 RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 
-# Directions
-UP = (0, -1)
-DOWN = (0, 1)
-LEFT = (-1, 0)
-RIGHT = (1, 0)
-
-class Snake:
-    def __init__(self):
-        self.length = 1
-        self.positions = [((WIDTH // 2), (HEIGHT // 2))]
-        self.direction = random.choice([UP, DOWN, LEFT, RIGHT])
-        self.color = GREEN
-        self.score = 0
-
-    def get_head_position(self):
-        return self.positions[0]
-
-    def update(self):
-        current = self.get_head_position()
-        x, y = self.direction
-        new = (((current[0] + (x * GRID_SIZE)) % WIDTH), (current[1] + (y * GRID_SIZE)) % HEIGHT)
-        
-        if len(self.positions) > 1 and new in self.positions[2:]:
-            return False  # Game over
-        else:
-            self.positions.insert(0, new)
-            if len(self.positions) > self.length:
-                self.positions.pop()
-            return True
-
-    def reset(self):
-        self.length = 1
-        self.positions = [((WIDTH // 2), (HEIGHT // 2))]
-        self.direction = random.choice([UP, DOWN, LEFT, RIGHT])
-        self.score = 0
-
-    def render(self, surface):
-        for p in self.positions:
-            rect = pygame.Rect((p[0], p[1]), (GRID_SIZE, GRID_SIZE))
-            pygame.draw.rect(surface, self.color, rect)
-            pygame.draw.rect(surface, BLACK, rect, 1)
-
-    def handle_keys(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP and self.direction != DOWN:
-                    self.direction = UP
-                elif event.key == pygame.K_DOWN and self.direction != UP:
-                    self.direction = DOWN
-                elif event.key == pygame.K_LEFT and self.direction != RIGHT:
-                    self.direction = LEFT
-                elif event.key == pygame.K_RIGHT and self.direction != LEFT:
-                    self.direction = RIGHT
-
-class Food:
-    def __init__(self):
-        self.position = (0, 0)
-        self.color = RED
-        self.randomize_position()
-
-    def randomize_position(self):
-        self.position = (random.randint(0, GRID_WIDTH - 1) * GRID_SIZE,
-                        random.randint(0, GRID_HEIGHT - 1) * GRID_SIZE)
-
-    def render(self, surface):
-        rect = pygame.Rect((self.position[0], self.position[1]), (GRID_SIZE, GRID_SIZE))
-        pygame.draw.rect(surface, self.color, rect)
-        pygame.draw.rect(surface, BLACK, rect, 1)
+# Arrow keys and the command that turns the snake their way
+KEY_COMMANDS = {
+    pygame.K_UP: 'up',
+    pygame.K_DOWN: 'down',
+    pygame.K_LEFT: 'left',
+    pygame.K_RIGHT: 'right',
+}
+
+class Viewport:
+    # The cells of the board that are on screen. Boards up to VIEW_CELLS
+    # across are shown whole; bigger ones are shown through a window that
+    # follows the snake's head and wraps around the edges like the snake does.
+
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.columns = min(width, VIEW_CELLS)
+        self.rows = min(height, VIEW_CELLS)
+        self.left = 0
+        self.top = 0
+
+    @property
+    def size(self):
+        return self.columns * GRID_SIZE, self.rows * GRID_SIZE
+
+    def follow(self, position):
+        """Center the view on a board position, if the board doesn't fit anyway"""
+        if self.columns < self.width:
+            self.left = (position[0] - self.columns // 2) % self.width
+        if self.rows < self.height:
+            self.top = (position[1] - self.rows // 2) % self.height
+
+    def to_screen(self, position):
+        """Return the on-screen (column, row) of a board position, or None when out of view"""
+        column = (position[0] - self.left) % self.width
+        row = (position[1] - self.top) % self.height
+        if column >= self.columns or row >= self.rows:
+            return None
+        return column, row
+
+def draw_cell(surface, color, cell):
+    rect = pygame.Rect((cell[0] * GRID_SIZE, cell[1] * GRID_SIZE), (GRID_SIZE, GRID_SIZE))
+    pygame.draw.rect(surface, color, rect)
+    pygame.draw.rect(surface, BLACK, rect, 1)
+
+def draw_snake(surface, snake, view=None):
+    view = view or Viewport(snake.width, snake.height)
+    if len(snake.positions) <= view.columns * view.rows:
+        for p in snake.positions:
+            cell = view.to_screen(p)
+            if cell is not None:
+                draw_cell(surface, GREEN, cell)
+        return
+    # A body longer than the view has more segments off screen than cells on
+    # it, so look the visible cells up instead
+    occupancy = snake.occupancy
+    for row in range(view.rows):
+        base = (view.top + row) % snake.height * snake.width
+        for column in range(view.columns):
+            if occupancy[base + (view.left + column) % snake.width]:
+                draw_cell(surface, GREEN, (column, row))
+
+def draw_food(surface, food, view=None):
+    cell = food.position if view is None else view.to_screen(food.position)
+    if cell is not None:
+        draw_cell(surface, RED, cell)
+
+def handle_keys(loop, turns):
+    # Queue turns so that several keys pressed within one step all count
+    for event in loop.events():
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            PROFILER.toggle()  # Shows up on the next frame
+        elif event.type == pygame.KEYDOWN and event.key in KEY_COMMANDS:
+            if len(turns) < MAX_QUEUED_TURNS:
+                turns.append(KEY_COMMANDS[event.key])
+
+def draw_frame(surface, game, view=None):
+    view = view or Viewport(game.width, game.height)
+    view.follow(game.snake.get_head_position())
+    surface.fill(BLACK)
+    draw_grid(surface)
+    draw_snake(surface, game.snake, view)
+    draw_food(surface, game.food, view)
+    
+    # Display score
+    score_text = render_text('arial', 24, f"Score: {game.snake.score}", WHITE)
+    surface.blit(score_text, (5, 5))
 
 def draw_grid(surface):
-    for y in range(0, HEIGHT, GRID_SIZE):
-        for x in range(0, WIDTH, GRID_SIZE):
+    width, height = surface.get_size()
+    for y in range(0, height, GRID_SIZE):
+        for x in range(0, width, GRID_SIZE):
             rect = pygame.Rect((x, y), (GRID_SIZE, GRID_SIZE))
             pygame.draw.rect(surface, BLACK, rect, 1)
 
-def main():
-    clock = pygame.time.Clock()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+# Timed while the profiler is on
+PROFILER.watch(Snake, 'update', 'Snake.update')
+for name in ('draw_frame', 'draw_snake', 'draw_food', 'draw_cell', 'draw_grid'):
+    PROFILER.watch(sys.modules[__name__], name)
+
+def main(record=None, profile=None, size=(GRID_WIDTH, GRID_HEIGHT), spectate_port=None):
+    # Records a replay and exports profiler metrics to the given files if any,
+    # and serves a spectator feed on the given port if any
+    startup.init_pygame()
+    if profile:
+        start_export(profile)
+    view = Viewport(*size)
+    screen = pygame.display.set_mode(view.size)
+    width, height = view.size
     pygame.display.set_caption("Snake Game")
     surface = pygame.Surface(screen.get_size())
     surface = surface.convert()
     
-    snake = Snake()
-    food = Food()
-    
-    font = pygame.font.SysFont('arial', 24)
+    seed = random.getrandbits(64)
+    game = SnakeLogic(seed, *size)
+    snake = game.snake
+    recorder = replay.recorder(record, 'snake', game, seed, RENDER_FPS)
+    feed = spectate.broadcaster(spectate_port, 'snake', game)
+    sessions = scores.SessionTracker(scores.open_store(), 'snake', game)
     
-    game_over = False
-    current_fps = FPS
+    # The snake moves game.fps times a second, apart from input and drawing
+    loop = GameLoop(game.fps, RENDER_FPS)
+    turns = deque()
+    changed = True
     
-    while not game_over:
-        clock.tick(current_fps)
-        snake.handle_keys()
-        
-        if not snake.update():
-            game_over = True
-        
-        # Check if snake has eaten the food
-        if snake.get_head_position() == food.position:
-            snake.length += 1
-            snake.score += 10
-            food.randomize_position()
-            
-            # Increase speed every 5 score points
-            if snake.score % 50 == 0:
-                current_fps += 1
-        
-        surface.fill(BLACK)
-        draw_grid(surface)
-        snake.render(surface)
-        food.render(surface)
+    while not game.game_over:
+        recorder.tick()
+        feed.publish()
+        PROFILER.frame()
+        handle_keys(loop, turns)
+        PROFILER.lap('events')
+        loop.tick_rate = game.fps
+        for _ in range(loop.advance()):
+            if turns:
+                recorder.apply(turns.popleft())
+            recorder.apply('update')
+            changed = True
+            if game.game_over:
+                break
+        sessions.update()
+        PROFILER.lap('simulation')
         
-        # Display score
-        score_text = font.render(f"Score: {snake.score}", True, WHITE)
-        surface.blit(score_text, (5, 5))
+        if not changed or not loop.render_due():
+            loop.wait()
+            continue
+        changed = False
         
+        draw_frame(surface, game, view)
         screen.blit(surface, (0, 0))
+        PROFILER.draw_overlay(screen)
         pygame.display.update()
+        PROFILER.lap('draw')
+        loop.wait()
     
     # Game over screen
     surface.fill(BLACK)
-    game_over_font = pygame.font.SysFont('arial', 48)
-    game_over_text = game_over_font.render("Game Over", True, RED)
-    score_text = font.render(f"Final Score: {snake.score}", True, WHITE)
-    restart_text = font.render("Press R to restart or Q to quit", True, WHITE)
+    game_over_text = render_text('arial', 48, "Game Over", RED)
+    score_text = render_text('arial', 24, f"Final Score: {snake.score}", WHITE)
+    restart_text = render_text('arial', 24, "Press R to restart or Q to quit", WHITE)
     
-    surface.blit(game_over_text, (WIDTH // 2 - game_over_text.get_width() // 2, HEIGHT // 3))
-    surface.blit(score_text, (WIDTH // 2 - score_text.get_width() // 2, HEIGHT // 2))
-    surface.blit(restart_text, (WIDTH // 2 - restart_text.get_width() // 2, HEIGHT // 1.5))
+    surface.blit(game_over_text, (width // 2 - game_over_text.get_width() // 2, height // 3))
+    surface.blit(score_text, (width // 2 - score_text.get_width() // 2, height // 2))
+    surface.blit(restart_text, (width // 2 - restart_text.get_width() // 2, height // 1.5))
     screen.blit(surface, (0, 0))
     pygame.display.update()
     
     waiting = True
     while waiting:
-        for event in pygame.event.get():
+        loop.wait(idle=True)
+        for event in loop.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r:
-                    snake.reset()
-                    food.randomize_position()
-                    current_fps = FPS
-                    game_over = False
+                    sessions.finish()
+                    recorder.apply('reset')
+                    sessions.start()
                     waiting = False
                 elif event.key == pygame.K_q:
                     pygame.quit()
                     sys.exit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(replay.record_path(), profile_path(), replay.size_option() or (GRID_WIDTH, GRID_HEIGHT),
+         spectate.spectate_port())
\ No newline at end of file
@@ -0,0 +1,306 @@
+import random
+import struct
+from collections import deque, namedtuple
+
+from gamestate import SnapshotRandom, pack_rng, unpack_rng
+
+# Game logic for Snake without any pygame dependency, so games can be stepped
+# headless as fast as the CPU allows. snake_game.py draws on top of this.
+# Positions are (column, row) grid cells; the renderer scales them to pixels.
+# The snake keeps a count of its segments on every cell, so self-collision
+# never scans the body. Food goes on random cells drawn until a free one
+# comes up, so where it lands follows from the body and the generator alone,
+# and a state needs nothing else.
+
+# Constants
+GRID_WIDTH = 30
+GRID_HEIGHT = 30
+FPS = 10  # Start speed
+
+# Directions
+UP = (0, -1)
+DOWN = (0, 1)
+LEFT = (-1, 0)
+RIGHT = (1, 0)
+
+# Actions accepted by step(), either by value or by index (None keeps going)
+ACTIONS = (None, UP, DOWN, LEFT, RIGHT)
+
+# Direction that cannot be taken while moving in the key's direction
+OPPOSITE = {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT}
+
+# Two-bit codes of the steps between body segments in encoded states
+STEPS = (UP, DOWN, LEFT, RIGHT)
+
+_STATE_HEADER = struct.Struct('<HHbbIIHBHHI')
+
+# Random cells tried for the food before drawing among the free cells in
+# order, which scans the grid but only happens on a crowded board
+FOOD_TRIES = 16
+
+
+class Snake:
+    def __init__(self, rng=random, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.rng = rng
+        self.width = width
+        self.height = height
+        self.reset()
+
+    def snapshot(self):
+        """Return (positions, occupancy), shared until the snake next moves"""
+        self.shared = True
+        return self.positions, self.occupancy
+
+    def restore(self, positions, occupancy):
+        """Take the body of a snapshot, copying it before the snake next moves"""
+        self.positions = positions
+        self.occupancy = occupancy
+        self.shared = True
+
+    def unshare(self):
+        # A snapshot holds the body; give the snake its own copy to change.
+        # The occupancy is one flat bytearray, so besides the body this is
+        # a single copy of width * height bytes
+        self.positions = deque(self.positions)
+        self.occupancy = bytearray(self.occupancy)
+        self.shared = False
+
+    def get_head_position(self):
+        return self.positions[0]
+
+    def turn(self, direction):
+        # The snake cannot reverse onto itself
+        if self.direction != OPPOSITE[direction]:
+            self.direction = direction
+
+    def update(self):
+        if self.shared:
+            self.unshare()
+        positions = self.positions
+        width = self.width
+        current = positions[0]
+        x, y = self.direction
+        new = ((current[0] + x) % width, (current[1] + y) % self.height)
+        cell = new[1] * width + new[0]
+
+        # The body may run into anything but its head and neck, including the
+        # tail that is about to move away
+        hits = self.occupancy[cell]
+        if hits and len(positions) > 1:
+            if positions[0] == new:
+                hits -= 1
+            if positions[1] == new:
+                hits -= 1
+            if hits > 0:
+                return False  # Game over
+
+        # A cell can be covered more than once if the snake turns back onto its neck
+        positions.appendleft(new)
+        self.occupancy[cell] += 1
+        if len(positions) > self.length:
+            x, y = positions.pop()
+            self.occupancy[y * width + x] -= 1
+        return True
+
+    def reset(self):
+        self.shared = False
+        self.length = 1
+        self.positions = deque()
+        self.occupancy = bytearray(self.width * self.height)
+        start = (self.width // 2, self.height // 2)
+        self.positions.append(start)
+        self.occupancy[start[1] * self.width + start[0]] = 1
+        self.direction = self.rng.choice([UP, DOWN, LEFT, RIGHT])
+        self.score = 0
+
+
+class Food:
+    def __init__(self, rng=random, snake=None, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.rng = rng
+        self.snake = snake
+        self.width = width
+        self.height = height
+        self.position = (0, 0)
+        self.randomize_position()
+
+    def randomize_position(self):
+        """Move the food to a uniformly random cell, off the snake if there is one,
+        leaving it where it is when the snake fills the grid"""
+        if self.snake is None:
+            self.position = (self.rng.randint(0, self.width - 1),
+                             self.rng.randint(0, self.height - 1))
+            return
+        occupancy = self.snake.occupancy
+        rng = self.rng
+        for _ in range(FOOD_TRIES):
+            cell = rng.randrange(len(occupancy))
+            if not occupancy[cell]:
+                break
+        else:
+            free = occupancy.count(0)
+            if not free:
+                return
+            cell = -1
+            for _ in range(rng.randrange(free) + 1):
+                cell = occupancy.index(0, cell + 1)
+        self.position = cell % self.width, cell // self.width
+
+
+def pack_steps(positions, width, height):
+    """Encode the steps from each body segment to the next, four to a byte"""
+    data = bytearray()
+    byte = 0
+    previous = None
+    for k, (x, y) in enumerate(positions):
+        if previous is not None:
+            for code, (dx, dy) in enumerate(STEPS):
+                if ((previous[0] + dx) % width, (previous[1] + dy) % height) == (x, y):
+                    break
+            else:
+                raise ValueError(f"Body segments {previous} and {(x, y)} are not adjacent")
+            byte |= code << (k - 1) % 4 * 2
+            if k % 4 == 0:
+                data.append(byte)
+                byte = 0
+        previous = x, y
+    if (len(positions) - 1) % 4:
+        data.append(byte)
+    return bytes(data)
+
+
+def unpack_steps(data, head, count, width, height):
+    """Rebuild count body positions from the head and steps packed by pack_steps"""
+    positions = [head]
+    x, y = head
+    for k in range(count - 1):
+        dx, dy = STEPS[data[k // 4] >> k % 4 * 2 & 3]
+        x = (x + dx) % width
+        y = (y + dy) % height
+        positions.append((x, y))
+    return positions
+
+
+class SnakeState(namedtuple('SnakeState', [
+        'width', 'height', 'positions', 'occupancy', 'direction', 'length', 'score', 'food',
+        'fps', 'game_over', 'rng'])):
+    """A snapshot of a Snake game
+
+    The body (positions and per-cell occupancy) is shared with the game
+    until the snake next moves, and must not be modified. rng is the
+    generator's state, or None when it was left out.
+    """
+
+    __slots__ = ()
+
+    def to_bytes(self):
+        """Encode the state: a header, the steps along the body, the head and
+        the generator state
+
+        The body takes a quarter byte a segment; the generator state is
+        2.5 KB whatever the game, so it is most of the record.
+        """
+        positions = self.positions
+        head = positions[0]
+        header = _STATE_HEADER.pack(
+            self.width, self.height, self.direction[0], self.direction[1], self.length,
+            self.score, self.fps, self.game_over, self.food[0], self.food[1], len(positions))
+        return (header + pack_steps(positions, self.width, self.height)
+                + struct.pack('<HH', *head) + pack_rng(self.rng))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decode a state encoded by to_bytes, rebuilding the occupancy from the body"""
+        (width, height, dx, dy, length, score, fps, game_over, food_x, food_y,
+         segments) = _STATE_HEADER.unpack_from(data)
+        offset = _STATE_HEADER.size
+        steps = data[offset:offset + (segments + 2) // 4]
+        offset += len(steps)
+        head = struct.unpack_from('<HH', data, offset)
+        rng, _ = unpack_rng(data, offset + 4)
+
+        positions = deque(unpack_steps(steps, head, segments, width, height))
+        occupancy = bytearray(width * height)
+        for x, y in positions:
+            occupancy[y * width + x] += 1
+        return cls(width, height, positions, occupancy, (dx, dy), length, score,
+                   (food_x, food_y), fps, bool(game_over), rng)
+
+
+class SnakeLogic:
+    def __init__(self, seed=None, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.rng = SnapshotRandom(seed)
+        self.snake = Snake(self.rng, width, height)
+        self.food = Food(self.rng, self.snake, width, height)
+        self.fps = FPS
+        self.game_over = False
+
+    @property
+    def score(self):
+        return self.snake.score
+
+    def snapshot(self, rng=True):
+        """Return the game state as a SnakeState, leaving out the generator if rng is False"""
+        snake = self.snake
+        return SnakeState(self.width, self.height, *snake.snapshot(), snake.direction,
+                          snake.length, snake.score, self.food.position, self.fps, self.game_over,
+                          self.rng.getstate() if rng else None)
+
+    def restore(self, state):
+        """Put the game back in a snapshotted state (the generator too, if it was saved)"""
+        if (state.width, state.height) != (self.width, self.height):
+            self.width = state.width
+            self.height = state.height
+            self.snake = Snake(self.rng, state.width, state.height)
+            self.food = Food(self.rng, self.snake, state.width, state.height)
+        snake = self.snake
+        snake.restore(state.positions, state.occupancy)
+        snake.direction = state.direction
+        snake.length = state.length
+        snake.score = state.score
+        self.food.position = state.food
+        self.fps = state.fps
+        self.game_over = state.game_over
+        if state.rng is not None:
+            self.rng.setstate(state.rng)
+        return self
+
+    def reset(self, seed=None):
+        """Reset the game, reseeding the generator if a seed is given"""
+        if seed is not None:
+            self.rng.seed(seed)
+        self.snake.reset()
+        self.food.randomize_position()
+        self.fps = FPS
+        self.game_over = False
+        return self
+
+    def update(self):
+        """Advance the snake one cell, returning the points scored"""
+        if not self.snake.update():
+            self.game_over = True
+            return 0
+
+        # Check if snake has eaten the food
+        if self.snake.get_head_position() != self.food.position:
+            return 0
+        self.snake.length += 1
+        self.snake.score += 10
+        self.food.randomize_position()
+
+        # Increase speed every 5 score points
+        if self.snake.score % 50 == 0:
+            self.fps += 1
+        return 10
+
+    def step(self, action):
+        """Turn (unless the action is None), advance one cell and return (state, reward, done)"""
+        if self.game_over:
+            return self, 0, True
+        if isinstance(action, int):
+            action = ACTIONS[action]
+        if action is not None:
+            self.snake.turn(action)
+        reward = self.update()
+        return self, reward, self.game_over
@@ -0,0 +1,545 @@
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+import replay
+from snake_logic import pack_steps, unpack_steps
+from tetris_logic import Tetromino, pack_colors, unpack_colors
+
+# Live spectator feeds of running games.
+# A Broadcaster encodes its game's state (not pixels) once per tick: a
+# keyframe with the whole state every KEYFRAME_INTERVAL ticks and a delta
+# with just what changed in between, or nothing when nothing did. The one
+# encoded frame is then queued for every subscriber, so encoding costs the
+# same for one viewer or a thousand. Subscriber queues are bounded: a
+# viewer that falls QUEUE_LIMIT frames behind loses its backlog and picks
+# up again at the next keyframe, without slowing the game or the others.
+# New viewers start from the last keyframe and the deltas since, which the
+# broadcaster keeps, so they see the game at once.
+#
+# The games take --spectate PORT to serve their feed over TCP, and
+#
+#   python spectate.py localhost:PORT
+#
+# prints what a viewer receives.
+#
+# A frame is <BBI: kind (KEYFRAME or DELTA), game (index into GAMES) and
+# tick, then the game's payload (see the encoders). Over TCP each frame is
+# preceded by its length as <I.
+
+KEYFRAME_INTERVAL = 60  # Ticks between keyframes
+QUEUE_LIMIT = 2 * KEYFRAME_INTERVAL  # Frames a subscriber can fall behind before it is dropped
+HIGH_WATER = 1 << 16  # Bytes buffered on a socket before frames stay queued
+
+KEYFRAME, DELTA = 1, 2
+GAMES = ('2048', 'tetris', 'snake')
+
+GAME_OVER = 1
+GAME_WON = 2
+
+FRAME_HEADER = struct.Struct('<BBI')
+LENGTH = struct.Struct('<I')
+
+# Returned by an encoder's delta() when the change can't be told as a delta
+# (a reset or a new board size), so a keyframe is sent instead
+KEYFRAME_NEEDED = object()
+
+
+class Board2048:
+    def __init__(self, size, cells, score, flags):
+        self.size = size
+        self.cells = bytearray(cells)  # Exponents in row-major order, 0 = empty
+        self.score = score
+        self.game_over = bool(flags & GAME_OVER)
+        self.game_won = bool(flags & GAME_WON)
+
+
+class Game2048Encoder:
+    # Keyframe: <HIB size, score, flags, then every cell's exponent as a byte.
+    # Delta: <IBH score, flags, changed cells, then <HB index and exponent each.
+
+    KEYFRAME = struct.Struct('<HIB')
+    DELTA = struct.Struct('<IBH')
+    CELL = struct.Struct('<HB')
+
+    def __init__(self, game):
+        self.game = game
+        self.sent = None  # (size, bits, cells, score, flags) as of the last frame
+
+    def flags(self):
+        game = self.game
+        return (GAME_OVER if game.game_over else 0) | (GAME_WON if game.game_won else 0)
+
+    def keyframe(self):
+        game = self.game
+        cells = bytes(game.backend.exponents(game.bits))
+        flags = self.flags()
+        self.sent = (game.size, game.bits, cells, game.score, flags)
+        return self.KEYFRAME.pack(game.size, game.score, flags) + cells
+
+    def delta(self):
+        game = self.game
+        size, bits, cells, score, flags = self.sent
+        if game.size != size:
+            return KEYFRAME_NEEDED
+        new_flags = self.flags()
+        if game.bits == bits and game.score == score and new_flags == flags:
+            return None
+        new_cells = bytes(game.backend.exponents(game.bits)) if game.bits != bits else cells
+        changed = [i for i, (new, old) in enumerate(zip(new_cells, cells)) if new != old]
+        self.sent = (size, game.bits, new_cells, game.score, new_flags)
+        return (self.DELTA.pack(game.score, new_flags, len(changed))
+                + b''.join(self.CELL.pack(i, new_cells[i]) for i in changed))
+
+    @classmethod
+    def decode(cls, data, offset):
+        size, score, flags = cls.KEYFRAME.unpack_from(data, offset)
+        offset += cls.KEYFRAME.size
+        return Board2048(size, data[offset:offset + size * size], score, flags)
+
+    @classmethod
+    def apply(cls, board, data, offset):
+        board.score, flags, count = cls.DELTA.unpack_from(data, offset)
+        board.game_over = bool(flags & GAME_OVER)
+        board.game_won = bool(flags & GAME_WON)
+        offset += cls.DELTA.size
+        for _ in range(count):
+            i, exponent = cls.CELL.unpack_from(data, offset)
+            board.cells[i] = exponent
+            offset += cls.CELL.size
+
+
+class TetrisEncoder:
+    # Keyframe: <HH width and height, the piece block, then the whole grid
+    # packed by pack_colors. Delta: the piece block and <H changed rows, then
+    # <H row index and the row packed by pack_colors each. The piece block is
+    # <BBhhIHBB shape, rotation, x, y, score, lines, next shape and flags.
+    # Changed rows are found as in tetris_server: the grid is snapshotted
+    # after each frame, so an unchanged grid still holds the same row lists.
+
+    SIZE = struct.Struct('<HH')
+    PIECE = struct.Struct('<BBhhIHBB')
+    ROWS = struct.Struct('<H')
+
+    def __init__(self, game):
+        self.game = game
+        self.sent_rows = None
+        self.sent_piece = None
+
+    def piece(self):
+        game = self.game
+        piece = game.current_piece
+        return (piece.shape_idx, piece.rotation, piece.x, piece.y, game.score,
+                game.lines_cleared_total, game.next_piece_idx, GAME_OVER if game.game_over else 0)
+
+    def keyframe(self):
+        grid = self.game.grid
+        self.sent_piece = self.piece()
+        self.sent_rows = grid.snapshot()[1]
+        return (self.SIZE.pack(grid.width, grid.height) + self.PIECE.pack(*self.sent_piece)
+                + pack_colors(self.sent_rows))
+
+    def delta(self):
+        grid = self.game.grid
+        sent = self.sent_rows
+        if len(grid.colors) != len(sent) or grid.width != len(sent[0]):
+            return KEYFRAME_NEEDED
+        piece = self.piece()
+        colors = grid.colors
+        if colors is sent:
+            if piece == self.sent_piece:
+                return None
+            changed = ()
+        else:
+            changed = [i for i, row in enumerate(colors) if row is not sent[i] and row != sent[i]]
+            self.sent_rows = grid.snapshot()[1]
+            if not changed and piece == self.sent_piece:
+                return None
+        self.sent_piece = piece
+        return (self.PIECE.pack(*piece) + self.ROWS.pack(len(changed))
+                + b''.join(self.ROWS.pack(i) + pack_colors((colors[i],)) for i in changed))
+
+    @classmethod
+    def decode(cls, data, offset):
+        from tetris_server import RemoteBoard
+        width, height = cls.SIZE.unpack_from(data, offset)
+        offset += cls.SIZE.size
+        board = RemoteBoard(width, height)
+        offset = cls.apply_piece(board, data, offset)
+        colors = unpack_colors(data[offset:offset + (width * height + 1) // 2], width, height)
+        for i, row in enumerate(colors):
+            board.grid.colors[i] = row
+            board.grid.rows[i] = sum(1 << j for j, color in enumerate(row) if color)
+        board.grid.forget_columns()
+        return board
+
+    @classmethod
+    def apply(cls, board, data, offset):
+        offset = cls.apply_piece(board, data, offset)
+        count = cls.ROWS.unpack_from(data, offset)[0]
+        offset += cls.ROWS.size
+        row_size = (board.width + 1) // 2
+        grid = board.grid
+        for _ in range(count):
+            i = cls.ROWS.unpack_from(data, offset)[0]
+            offset += cls.ROWS.size
+            row = unpack_colors(data[offset:offset + row_size], board.width, 1)[0]
+            offset += row_size
+            grid.colors[i] = row
+            grid.rows[i] = sum(1 << j for j, color in enumerate(row) if color)
+        if count:
+            grid.forget_columns()
+
+    @classmethod
+    def apply_piece(cls, board, data, offset):
+        shape_idx, rotation, x, y, score, lines, next_idx, flags = cls.PIECE.unpack_from(data, offset)
+        # A new piece object for a new shape, so the renderer repaints it
+        piece = board.current_piece
+        if piece.shape_idx != shape_idx:
+            piece = board.current_piece = Tetromino(x, y, shape_idx)
+        piece.x = x
+        piece.y = y
+        piece.rotation = rotation
+        board.score = score
+        board.lines_cleared_total = lines
+        board.level = lines // 10 + 1
+        board.queue = (next_idx,)
+        board.game_over = bool(flags & GAME_OVER)
+        return offset + cls.PIECE.size
+
+
+class SnakeBody:
+    def __init__(self, width, height, positions, food, score, flags):
+        self.width = width
+        self.height = height
+        self.positions = deque(positions)  # Head first
+        self.food = food
+        self.score = score
+        self.game_over = bool(flags & GAME_OVER)
+
+
+class SnakeEncoder:
+    # Keyframe: <HHIHHBI width, height, score, food x and y, flags and body
+    # length, then the head as <HH and the body as pack_steps steps.
+    # Delta: <IHHBBI score, food, flags, the number of cells the head
+    # moved and the new length, then each new head cell as <HH, newest first.
+    # The viewer pushes the new cells on the front and trims the tail.
+
+    KEYFRAME = struct.Struct('<HHIHHBI')
+    DELTA = struct.Struct('<IHHBBI')
+    CELL = struct.Struct('<HH')
+    MAX_MOVES = 255  # Moves between frames a delta can carry
+
+    def __init__(self, game):
+        self.game = game
+        self.sent = None  # (head, neck, length, score, food, flags) as of the last frame
+        self.sent_size = None
+
+    def state(self):
+        game = self.game
+        positions = game.snake.positions
+        neck = positions[1] if len(positions) > 1 else None
+        return (positions[0], neck, len(positions), game.score, game.food.position,
+                GAME_OVER if game.game_over else 0)
+
+    def keyframe(self):
+        game = self.game
+        snake = game.snake
+        self.sent = state = self.state()
+        self.sent_size = (snake.width, snake.height)
+        _, _, length, score, food, flags = state
+        return (self.KEYFRAME.pack(snake.width, snake.height, score, food[0], food[1], flags, length)
+                + self.CELL.pack(*state[0]) + pack_steps(snake.positions, snake.width, snake.height))
+
+    def delta(self):
+        state = self.state()
+        if state == self.sent:
+            return None
+        snake = self.game.snake
+        if (snake.width, snake.height) != self.sent_size:
+            return KEYFRAME_NEEDED
+        positions = snake.positions
+        head, neck, length, score, food, flags = self.sent
+        # Find where the last frame's head is now. When it is gone (a short
+        # snake moved past it, or a reset) the whole body goes as new cells.
+        for moves in range(min(len(positions), self.MAX_MOVES + 1)):
+            if positions[moves] == head and (neck is None or moves + 1 >= len(positions)
+                                             or positions[moves + 1] == neck):
+                break
+        else:
+            if len(positions) > self.MAX_MOVES:
+                return KEYFRAME_NEEDED
+            moves = len(positions)
+        self.sent = state
+        _, _, length, score, food, flags = state
+        return (self.DELTA.pack(score, food[0], food[1], flags, moves, length)
+                + b''.join(self.CELL.pack(*positions[k]) for k in range(moves)))
+
+    @classmethod
+    def decode(cls, data, offset):
+        width, height, score, food_x, food_y, flags, length = cls.KEYFRAME.unpack_from(data, offset)
+        offset += cls.KEYFRAME.size
+        head = cls.CELL.unpack_from(data, offset)
+        positions = unpack_steps(data[offset + cls.CELL.size:], head, length, width, height)
+        return SnakeBody(width, height, positions, (food_x, food_y), score, flags)
+
+    @classmethod
+    def apply(cls, body, data, offset):
+        score, food_x, food_y, flags, moves, length = cls.DELTA.unpack_from(data, offset)
+        offset += cls.DELTA.size
+        positions = body.positions
+        for k in range(moves - 1, -1, -1):
+            positions.appendleft(cls.CELL.unpack_from(data, offset + k * cls.CELL.size))
+        while len(positions) > length:
+            positions.pop()
+        body.score = score
+        body.food = (food_x, food_y)
+        body.game_over = bool(flags & GAME_OVER)
+
+
+ENCODERS = {'2048': Game2048Encoder, 'tetris': TetrisEncoder, 'snake': SnakeEncoder}
+
+
+class Subscriber:
+    """One viewer's bounded queue of frames"""
+
+    def __init__(self, limit=QUEUE_LIMIT):
+        self.queue = deque()
+        self.limit = limit
+        self.synced = False  # Frames are only queued from a keyframe on
+        self.dropped = 0  # Frames lost by falling behind
+        self.closed = False
+
+    def push(self, frame, keyframe):
+        if keyframe:
+            self.synced = True
+        elif not self.synced:
+            return
+        if len(self.queue) >= self.limit:
+            # Too slow: drop the backlog and wait for the next keyframe
+            self.dropped += len(self.queue) + 1
+            self.queue.clear()
+            self.synced = False
+            if not keyframe:
+                return
+            self.synced = True
+        self.queue.append(frame)
+
+    def frames(self):
+        """Take every queued frame (under the broadcaster's lock if it publishes from another thread)"""
+        frames = self.queue
+        self.queue = deque()
+        return frames
+
+    def close(self):
+        self.closed = True
+
+
+class Broadcaster:
+    def __init__(self, name, game, keyframe_interval=KEYFRAME_INTERVAL):
+        self.game_code = GAMES.index(name)
+        self.encoder = ENCODERS[name](game)
+        self.keyframe_interval = keyframe_interval
+        self.subscribers = []
+        self.recent = []  # The last keyframe and the deltas since, for new subscribers
+        self.tick = 0
+        self.keyframe_tick = 0
+        self.on_publish = None  # Called after a frame is queued, e.g. to wake a server
+        self.lock = threading.Lock()  # Subscribers may join from a server thread
+
+    def subscribe(self, subscriber=None):
+        """Add a subscriber, starting it from the last keyframe, and return it"""
+        subscriber = subscriber or Subscriber()
+        with self.lock:
+            for k, frame in enumerate(self.recent):
+                subscriber.push(frame, k == 0)
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def take(self, subscriber):
+        """Take a subscriber's queued frames, safely while the game publishes"""
+        with self.lock:
+            return subscriber.frames()
+
+    def publish(self):
+        """Encode this tick's frame and queue it for every subscriber, returning it (None if nothing changed)"""
+        self.tick += 1
+        encoder = self.encoder
+        keyframe = not self.recent or self.tick - self.keyframe_tick >= self.keyframe_interval
+        payload = None if keyframe else encoder.delta()
+        if payload is KEYFRAME_NEEDED:
+            keyframe = True
+        if keyframe:
+            payload = encoder.keyframe()
+            self.keyframe_tick = self.tick
+        elif payload is None:
+            return None
+        frame = FRAME_HEADER.pack(KEYFRAME if keyframe else DELTA, self.game_code, self.tick) + payload
+
+        with self.lock:
+            if keyframe:
+                self.recent = [frame]
+            else:
+                self.recent.append(frame)
+            subscribers = self.subscribers
+            if any(subscriber.closed for subscriber in subscribers):
+                subscribers[:] = [subscriber for subscriber in subscribers if not subscriber.closed]
+            for subscriber in subscribers:
+                subscriber.push(frame, keyframe)
+        if self.on_publish is not None:
+            self.on_publish()
+        return frame
+
+
+class NullBroadcaster:
+    """Stands in for a Broadcaster when the game isn't being spectated"""
+
+    def publish(self):
+        return None
+
+
+class FeedView:
+    """Rebuilds a game from its frames: state is a Board2048, a tetris_server.RemoteBoard or a SnakeBody"""
+
+    def __init__(self):
+        self.name = None
+        self.state = None
+        self.tick = 0
+
+    def apply(self, frame):
+        kind, game_code, self.tick = FRAME_HEADER.unpack_from(frame)
+        self.name = GAMES[game_code]
+        encoder = ENCODERS[self.name]
+        if kind == KEYFRAME:
+            self.state = encoder.decode(frame, FRAME_HEADER.size)
+        elif self.state is not None:
+            encoder.apply(self.state, frame, FRAME_HEADER.size)
+
+
+class FeedServer:
+    """Serves a broadcaster's frames over TCP from an asyncio loop on a background thread"""
+
+    def __init__(self, broadcaster, host='127.0.0.1', port=0):
+        # asyncio takes longer to import than the rest of a game, so games
+        # that are not spectated never import it
+        import asyncio
+        self.broadcaster = broadcaster
+        self.connections = {}  # Subscriber -> StreamWriter
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, host, port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.scheduled = False
+        broadcaster.on_publish = self.wake
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def wake(self):
+        # One wakeup per frame for all connections, skipped while one is pending
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon_threadsafe(self.flush)
+
+    def flush(self):
+        self.scheduled = False
+        take = self.broadcaster.take
+        for subscriber, writer in list(self.connections.items()):
+            # A viewer that isn't keeping up leaves its frames queued, where
+            # the subscriber's limit applies
+            if subscriber.queue and writer.transport.get_write_buffer_size() < HIGH_WATER:
+                writer.write(b''.join(LENGTH.pack(len(frame)) + frame for frame in take(subscriber)))
+
+    async def handle(self, reader, writer):
+        subscriber = Subscriber()
+        self.connections[subscriber] = writer
+        self.broadcaster.subscribe(subscriber)
+        self.flush()
+        try:
+            # Viewers send nothing; reading just notices when they leave
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            subscriber.close()
+            del self.connections[subscriber]
+            writer.close()
+
+    def close(self):
+        """Stop serving and disconnect every viewer"""
+        import asyncio
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def shutdown(self):
+        import asyncio
+        self.server.close()
+        # Closing a connection ends its handler, which sees the end of the stream
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+
+def broadcaster(port, name, game):
+    """Return a Broadcaster served on port, or a NullBroadcaster when port is None"""
+    if port is None:
+        return NullBroadcaster()
+    feed = Broadcaster(name, game)
+    feed.server = FeedServer(feed, '0.0.0.0', port)
+    return feed
+
+
+def spectate_port(argv=None):
+    """Return the port given as --spectate PORT on the command line, or None"""
+    port = replay.option('--spectate', argv)
+    return None if port is None else int(port)
+
+
+def describe(view):
+    state = view.state
+    if view.name == '2048':
+        summary = f"max tile {1 << max(state.cells)}"
+    elif view.name == 'tetris':
+        summary = f"lines {state.lines_cleared_total}, stack {sum(1 for row in state.grid.rows if row)} rows"
+    else:
+        summary = f"length {len(state.positions)}, head {state.positions[0]}"
+    over = ", game over" if state.game_over else ""
+    return f"{view.name} tick {view.tick}: score {state.score}, {summary}{over}"
+
+
+def watch(host, port):
+    """Print a line a second about the game a feed shows"""
+    view = FeedView()
+    buffer = bytearray()
+    last = 0
+    with socket.create_connection((host, port)) as connection:
+        while True:
+            data = connection.recv(1 << 16)
+            if not data:
+                break
+            buffer += data
+            offset = 0
+            while len(buffer) - offset >= LENGTH.size:
+                size = LENGTH.unpack_from(buffer, offset)[0]
+                if len(buffer) - offset - LENGTH.size < size:
+                    break
+                view.apply(bytes(buffer[offset + LENGTH.size:offset + LENGTH.size + size]))
+                offset += LENGTH.size + size
+            del buffer[:offset]
+            if view.state is not None and time.monotonic() - last >= 1:
+                last = time.monotonic()
+                print(describe(view))
+
+
+if __name__ == "__main__":
+    host, _, port = sys.argv[1].rpartition(':')
+    try:
+        watch(host or 'localhost', int(port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,56 @@
+import time
+
+# Cold start of the games.
+# pygame.init() starts every subsystem, audio and joysticks included, which
+# the games never use; init_pygame() starts only the display and fonts
+# (fonts themselves load on first use, through text_cache). STARTUP times
+# each step of the start: the imports up to init_pygame(), pygame's init,
+# and the rest up to the first frame on screen, which GameLoop reports.
+# Nothing here imports pygame, so the launcher can start the clock first.
+
+STARTED = time.perf_counter()  # Set again by the launcher, which starts earlier
+
+
+class StartupTimer:
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.last = started
+        self.phases = []  # (step name, seconds) in order
+        self.done = False
+        self.on_first_frame = None  # Called with the timer when the first frame is up
+
+    def restart(self, started):
+        self.started = self.last = started
+        self.phases = []
+
+    def mark(self, phase):
+        """Record the time since the previous mark as a step of the start"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def first_frame(self):
+        if self.done:
+            return
+        self.done = True
+        self.mark('first frame')
+        if self.on_first_frame is not None:
+            self.on_first_frame(self)
+
+    def report(self):
+        """A table of the startup steps in milliseconds"""
+        lines = [f"  {phase:<16}{seconds * 1000:8.1f} ms" for phase, seconds in self.phases]
+        lines.append(f"  {'total':<16}{(self.last - self.started) * 1000:8.1f} ms")
+        return "Startup:\n" + "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+
+
+def init_pygame():
+    """Start the pygame subsystems the games use: the display and fonts"""
+    STARTUP.mark('imports')
+    import pygame
+    pygame.display.init()
+    pygame.font.init()
+    STARTUP.mark('pygame init')
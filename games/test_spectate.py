@@ -0,0 +1,147 @@
+import random
+import socket
+
+import pytest
+
+import spectate
+from game2048_logic import Game2048Logic
+from snake_logic import SnakeLogic
+from spectate import (
+    FRAME_HEADER, KEYFRAME, LENGTH, Broadcaster, FeedServer, FeedView, Subscriber,
+)
+from tetris_logic import TetrisLogic
+
+# Spectator feed tests: in-process subscribers decode a game's frames with
+# a FeedView, which must always show the game as it is.
+
+# name, a game of a given seed and size, the number of actions, two sizes
+GAMES = [
+    ('2048', lambda seed, size: Game2048Logic(seed, size[0]), 4, ((4, 4), (6, 6))),
+    ('tetris', lambda seed, size: TetrisLogic(seed, *size), 6, ((10, 20), (14, 24))),
+    ('snake', lambda seed, size: SnakeLogic(seed, *size), 5, ((40, 30), (12, 9))),
+]
+
+
+def assert_shown(name, game, view):
+    state = view.state
+    assert state.score == game.score
+    assert state.game_over == game.game_over
+    if name == '2048':
+        assert state.size == game.size
+        assert bytes(state.cells) == bytes(game.backend.exponents(game.bits))
+    elif name == 'tetris':
+        assert state.grid.colors == list(game.grid.colors)
+        assert state.grid.rows == list(game.grid.rows)
+        piece, shown = game.current_piece, state.current_piece
+        assert (shown.shape_idx, shown.rotation, shown.x, shown.y) == (
+            piece.shape_idx, piece.rotation, piece.x, piece.y)
+    else:
+        assert (state.width, state.height) == (game.snake.width, game.snake.height)
+        assert list(state.positions) == list(game.snake.positions)
+        assert state.food == game.food.position
+
+
+@pytest.mark.parametrize('name, make_game, actions, sizes', GAMES, ids=[game[0] for game in GAMES])
+def test_views_follow_the_game(name, make_game, actions, sizes):
+    rng = random.Random(name)
+    game = make_game(1, sizes[0])
+    other = make_game(2, sizes[1])
+    feed = Broadcaster(name, game, keyframe_interval=25)
+    fast, fast_view = feed.subscribe(), FeedView()
+    slow, slow_view = feed.subscribe(Subscriber(limit=30)), FeedView()
+    late = late_view = None
+    dropped = 0
+    for tick in range(3000):
+        for _ in range(rng.choice((0, 1, 1, 2))):
+            game.step(rng.randrange(actions))
+        if game.game_over and rng.random() < 0.05:
+            game.reset()
+        if tick in (800, 2100):
+            # Switch board sizes, which only a keyframe can tell
+            state = game.snapshot()
+            game.restore(other.snapshot())
+            other.restore(state)
+        feed.publish()
+
+        for frame in fast.frames():
+            fast_view.apply(frame)
+        assert_shown(name, game, fast_view)
+
+        if tick == 1234:
+            late, late_view = feed.subscribe(), FeedView()
+        if late is not None:
+            for frame in late.frames():
+                late_view.apply(frame)
+            assert_shown(name, game, late_view)
+
+        if tick % 50 == 49:
+            frames = slow.frames()
+            if slow.dropped > dropped:
+                # Fell behind: the backlog is gone and it starts again at a keyframe
+                dropped = slow.dropped
+                assert not frames or FRAME_HEADER.unpack_from(frames[0])[0] == KEYFRAME
+            for frame in frames:
+                slow_view.apply(frame)
+            if slow.synced:
+                assert_shown(name, game, slow_view)
+    assert dropped
+    assert late_view.state is not None
+
+
+def test_slow_subscriber_resyncs_at_the_next_keyframe():
+    game = SnakeLogic(4)
+    feed = Broadcaster('snake', game, keyframe_interval=10)
+    slow = feed.subscribe(Subscriber(limit=4))
+    for _ in range(6):
+        game.step(0)
+        assert feed.publish() is not None
+    # The fifth frame found the queue full: the backlog is gone, and deltas
+    # are ignored until a keyframe comes
+    assert slow.dropped == 5
+    assert not slow.synced
+    assert not slow.queue
+    for _ in range(4):
+        game.step(0)
+        feed.publish()
+    assert not slow.queue
+    game.step(0)
+    feed.publish()
+    assert slow.synced
+    frames = slow.frames()
+    assert [FRAME_HEADER.unpack_from(frame)[0] for frame in frames] == [KEYFRAME]
+    view = FeedView()
+    view.apply(frames[0])
+    assert_shown('snake', game, view)
+
+
+def test_feed_server_round_trip():
+    game = SnakeLogic(4)
+    feed = Broadcaster('snake', game)
+    server = FeedServer(feed)
+    try:
+        connection = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+        view = FeedView()
+        buffer = bytearray()
+        rng = random.Random(0)
+        for _ in range(200):
+            game.step(rng.randrange(5))
+            frame = feed.publish()
+            if frame is None:
+                continue
+            # Read each frame before publishing the next, so the viewer never
+            # falls behind however the server thread is scheduled
+            tick = FRAME_HEADER.unpack_from(frame)[2]
+            while view.tick < tick:
+                buffer += connection.recv(1 << 16)
+                while len(buffer) >= LENGTH.size:
+                    size = LENGTH.unpack_from(buffer)[0]
+                    if len(buffer) < LENGTH.size + size:
+                        break
+                    view.apply(bytes(buffer[LENGTH.size:LENGTH.size + size]))
+                    del buffer[:LENGTH.size + size]
+        assert view.name == 'snake'
+        assert_shown('snake', game, view)
+        assert spectate.describe(view)
+        connection.close()
+    finally:
+        server.close()
@@ -0,0 +1,158 @@
+from tetris_logic import GARBAGE, I_PIECE, O_PIECE, PIECE_STATES, Tetromino
+from tetris_server import (
+    ATTACK, RESTART_TICKS, LoopbackConnection, TetrisServer, simulate,
+)
+
+# Server tests over loopback connections, whose MatchClients decode every
+# message the server sends them.
+
+
+def start_match(seed=0, **size):
+    """A server with one full room, ticked until its match is on"""
+    server = TetrisServer(seed=seed, **size)
+    players = [server.join(1, LoopbackConnection()) for _ in range(server.room_size)]
+    room = players[0].room
+    while not room.playing:
+        server.tick()
+    return server, room, players
+
+
+def assert_mirrored(room):
+    """Check that every client sees every game of the room as the server has it"""
+    for viewer in room.players:
+        client = viewer.connection.client
+        for player in room.players:
+            board = client.boards[player.slot]
+            game = player.game
+            assert board.grid.colors == list(game.grid.colors)
+            assert board.grid.rows == list(game.grid.rows)
+            piece = game.current_piece
+            shown = board.current_piece
+            assert (shown.shape_idx, shown.rotation, shown.x, shown.y) == (
+                piece.shape_idx, piece.rotation, piece.x, piece.y)
+            assert board.next_piece_idx == game.queue[0]
+            assert board.score == game.score
+            assert board.lines_cleared_total == game.lines_cleared_total
+            assert board.game_over == game.game_over
+            assert board.garbage == player.garbage
+
+
+def test_clients_mirror_the_server():
+    server, _ = simulate(4, 1500, seed=3, decode=True)
+    assert server.rooms
+    for room in server.rooms.values():
+        assert_mirrored(room)
+
+
+def test_multi_line_clear_sends_garbage():
+    server, room, (attacker, defender) = start_match()
+    grid = attacker.game.grid
+    grid.unshare()
+    # Four full rows but for column 0, for a vertical I piece to clear
+    for i in range(grid.height - 4, grid.height):
+        grid.rows[i] = grid.full_row & ~1
+        grid.colors[i] = bytes((0,)) + bytes((1,)) * (grid.width - 1)
+    grid.forget_columns()
+    rotation = 1
+    column = PIECE_STATES[I_PIECE][rotation].cells[0][1]
+    piece = attacker.game.current_piece = Tetromino(-column, 0, I_PIECE)
+    piece.rotation = rotation
+
+    attacker.queue_input('drop')
+    server.tick()
+    assert attacker.game.lines_cleared_total == 4
+    assert defender.garbage == ATTACK[4]
+    assert attacker.connection.client.boards[defender.slot].garbage == ATTACK[4]
+
+    # The garbage rises under the defender's stack when its piece locks
+    defender.queue_input('drop')
+    server.tick()
+    assert defender.garbage == 0
+    defender_grid = defender.game.grid
+    bottom = defender_grid.rows[-ATTACK[4]:]
+    hole = (defender_grid.full_row ^ bottom[0]).bit_length() - 1
+    assert bottom == [defender_grid.full_row & ~(1 << hole)] * ATTACK[4]
+    for colors in attacker.connection.client.boards[defender.slot].grid.colors[-ATTACK[4]:]:
+        assert colors.count(GARBAGE) == defender_grid.width - 1
+    assert_mirrored(room)
+
+
+def test_each_lock_attacks_on_its_own():
+    server, room, (attacker, defender) = start_match()
+    game = attacker.game
+    grid = game.grid
+    grid.unshare()
+    # Two O pieces dropped in one tick clear two lines each, which is
+    # ATTACK[2] twice and not the ATTACK[4] of four lines at once
+    piece = game.current_piece = Tetromino(grid.width // 2 - 1, 0, O_PIECE)
+    gap = 0
+    for _, j in piece.get_positions():
+        gap |= 1 << j
+    for i in range(grid.height - 4, grid.height):
+        grid.rows[i] = grid.full_row & ~gap
+        grid.colors[i] = bytes(0 if gap >> j & 1 else 1 for j in range(grid.width))
+    grid.forget_columns()
+    game.queue[0] = O_PIECE
+
+    attacker.queue_input('drop')
+    attacker.queue_input('drop')
+    server.tick()
+    assert game.lines_cleared_total == 4
+    assert defender.garbage == 2 * ATTACK[2]
+
+
+def test_boards_taller_than_a_byte():
+    server, room, players = start_match(width=8, height=300)
+    for _ in range(200):
+        for player in players:
+            player.queue_input('drop')
+        server.tick()
+    assert_mirrored(room)
+
+
+def test_handshake_and_full_room():
+    server = TetrisServer(seed=0)
+    connections = [LoopbackConnection() for _ in range(server.room_size + 1)]
+    players = [server.join(7, connection) for connection in connections]
+    for slot, connection in enumerate(connections[:-1]):
+        client = connection.client
+        assert client.slot == slot
+        assert len(client.boards) == server.room_size
+        assert (client.width, client.height) == (server.width, server.height)
+        assert not client.full
+    assert players[-1] is None
+    assert connections[-1].client.full
+
+    # The others are told when a player leaves, and a slot so freed is
+    # taken by the next one to join
+    board = connections[1].client.boards[0]
+    server.leave(players[0])
+    assert connections[1].client.boards[0] is not board
+    assert connections[1].client.boards[0].waiting
+    connection = LoopbackConnection()
+    assert server.join(7, connection).slot == 0
+    assert connection.client.slot == 0
+
+
+def test_restart_after_game_over():
+    server, room, (loser, winner) = start_match(seed=5)
+    loser.game.game_over = True
+    server.tick()
+    assert not room.playing
+    for player in room.players:
+        client = player.connection.client
+        assert client.boards[loser.slot].game_over
+        assert client.boards[winner.slot].waiting
+
+    for _ in range(RESTART_TICKS):
+        server.tick()
+    assert room.playing
+    assert not loser.game.game_over
+    # Both players of a match get the same pieces
+    assert loser.game.current_piece.shape_idx == winner.game.current_piece.shape_idx
+    assert list(loser.game.queue) == list(winner.game.queue)
+    for player in room.players:
+        board = player.connection.client.boards[loser.slot]
+        assert not board.game_over
+        assert not board.waiting
+    assert_mirrored(room)
@@ -1,320 +1,430 @@
 import pygame
 import random
-import time
 import sys
+from collections import namedtuple
 
-# Initialize pygame
-pygame.init()
+import replay
+import scores
+import spectate
+import startup
+from loop import GameLoop
+from profiler import PROFILER, profile_path, start_export
+from tetris_ai import TetrisBot
+from text_cache import render_text
+from tetris_logic import (
+    GRID_WIDTH, GRID_HEIGHT, BLACK, RED, SHAPES, SHAPE_COLORS, TetrisLogic, BitGrid,
+)
 
 # Constants
 WIDTH, HEIGHT = 800, 600
 GRID_SIZE = 30
-GRID_WIDTH = 10  # Standard Tetris grid width
-GRID_HEIGHT = 20  # Standard Tetris grid height
 PLAY_WIDTH = GRID_WIDTH * GRID_SIZE
 PLAY_HEIGHT = GRID_HEIGHT * GRID_SIZE
 PLAY_X = (WIDTH - PLAY_WIDTH) // 2
 PLAY_Y = HEIGHT - PLAY_HEIGHT - 20
+PANEL_WIDTH = 200  # Next piece and score panel on the right
+QUEUE_PREVIEWS = 4  # Pieces previewed after the next one
+QUEUE_CELL_SIZE = 15
+QUEUE_Y = 360
+QUEUE_SPACING = 40
+GARBAGE_Y = 530  # Incoming garbage in an online match, below the queue
 FPS = 60
 
 # Colors
-BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 GRAY = (128, 128, 128)
-RED = (255, 0, 0)
-GREEN = (0, 255, 0)
-BLUE = (0, 0, 255)
-CYAN = (0, 255, 255)
-MAGENTA = (255, 0, 255)
-YELLOW = (255, 255, 0)
-ORANGE = (255, 165, 0)
-
-# Tetromino shapes and colors
-SHAPES = [
-    [[1, 1, 1, 1]],  # I
-    [[1, 1], [1, 1]],  # O
-    [[0, 1, 0], [1, 1, 1]],  # T
-    [[0, 1, 1], [1, 1, 0]],  # S
-    [[1, 1, 0], [0, 1, 1]],  # Z
-    [[1, 0, 0], [1, 1, 1]],  # J
-    [[0, 0, 1], [1, 1, 1]]   # L
-]
-
-SHAPE_COLORS = [
-    CYAN,    # I
-    YELLOW,  # O
-    MAGENTA, # T
-    GREEN,   # S
-    RED,     # Z
-    BLUE,    # J
-    ORANGE   # L
-]
-
-class Tetromino:
-    def __init__(self, x, y, shape_idx):
-        self.x = x
-        self.y = y
-        self.shape_idx = shape_idx
-        self.shape = SHAPES[shape_idx]
-        self.color = SHAPE_COLORS[shape_idx]
-        self.rotation = 0
-
-    def rotate(self):
-        # Create a new rotated shape
-        rows = len(self.shape)
-        cols = len(self.shape[0])
-        
-        # For 'O' piece, rotation does nothing
-        if self.shape_idx == 1:
-            return
-        
-        rotated = [[0 for _ in range(rows)] for _ in range(cols)]
-        for r in range(rows):
-            for c in range(cols):
-                rotated[c][rows - 1 - r] = self.shape[r][c]
-                
-        # Check if rotation is valid before applying
-        old_shape = self.shape
-        self.shape = rotated
-        
-        if not self.is_valid_position(self.x, self.y, self.shape):
-            self.shape = old_shape
 
-    def is_valid_position(self, x, y, shape):
-        # Check if the tetromino is in a valid position
-        for i in range(len(shape)):
-            for j in range(len(shape[i])):
-                if shape[i][j] == 0:
-                    continue
-                
-                pos_x = x + j
-                pos_y = y + i
-                
-                # Check boundaries
-                if pos_x < 0 or pos_x >= GRID_WIDTH or pos_y >= GRID_HEIGHT:
-                    return False
-                
-                # Check if position is already filled in the grid
-                if pos_y >= 0 and grid[pos_y][pos_x] != BLACK:
-                    return False
-        
-        return True
+# Where the playfield goes on screen: the cell size in pixels, the top left
+# corner and the size of the field in pixels and in cells
+Layout = namedtuple('Layout', ['cell_size', 'x', 'y', 'width', 'height', 'columns', 'rows'])
 
-    def move(self, dx, dy, grid):
-        # Try to move the tetromino
-        if self.is_valid_position(self.x + dx, self.y + dy, self.shape):
-            self.x += dx
-            self.y += dy
-            return True
-        return False
-    
-    def get_positions(self):
-        positions = []
-        for i in range(len(self.shape)):
-            for j in range(len(self.shape[i])):
-                if self.shape[i][j] == 1:
-                    positions.append((self.y + i, self.x + j))
-        return positions
-
-def create_grid():
-    # Create an empty grid
-    return [[BLACK for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-
-def merge_tetromino(grid, tetromino):
-    # Add the tetromino to the grid
-    for i in range(len(tetromino.shape)):
-        for j in range(len(tetromino.shape[i])):
-            if tetromino.shape[i][j] == 1:
-                grid[tetromino.y + i][tetromino.x + j] = tetromino.color
-    return grid
-
-def clear_rows(grid):
-    # Check for filled rows and clear them
-    rows_cleared = 0
-    for i in range(GRID_HEIGHT):
-        if BLACK not in grid[i]:
-            # Row is filled
-            rows_cleared += 1
-            # Move all rows above down
-            for j in range(i, 0, -1):
-                grid[j] = grid[j-1].copy()
-            # Add new empty row at the top
-            grid[0] = [BLACK for _ in range(GRID_WIDTH)]
-    
-    return rows_cleared, grid
+def play_layout(columns=GRID_WIDTH, rows=GRID_HEIGHT):
+    # Shrink the cells until the grid fits next to the panel; the standard
+    # 10x20 grid keeps the original 30 pixel cells and position
+    cell_size = max(1, min(GRID_SIZE, HEIGHT // rows, (WIDTH - PANEL_WIDTH - 40) // columns))
+    width = columns * cell_size
+    height = rows * cell_size
+    x = min((WIDTH - width) // 2, WIDTH - PANEL_WIDTH - 20 - width)
+    return Layout(cell_size, x, HEIGHT - height - 20, width, height, columns, rows)
+
+LAYOUT = play_layout()
 
-def is_game_over(grid):
-    # Check if any piece in the top row is filled
-    return any(grid[0][i] != BLACK for i in range(GRID_WIDTH))
+def opponent_layout(columns, rows, beside, index=0, count=1):
+    # Opponents' playfields share the space left of the player's, at no
+    # more than half the standard cell size, leaving room for a label above
+    cell_size = max(1, min(GRID_SIZE // 2, (HEIGHT - 80) // rows,
+                           (beside.x - 20 * (count + 1)) // (count * columns)))
+    width = columns * cell_size
+    height = rows * cell_size
+    slot_width = beside.x // count
+    x = index * slot_width + (slot_width - width) // 2
+    return Layout(cell_size, x, HEIGHT - height - 20, width, height, columns, rows)
 
-def draw_grid(surface, grid):
+def draw_grid(surface, grid, layout=LAYOUT):
     # Draw the grid
-    for i in range(GRID_HEIGHT):
-        for j in range(GRID_WIDTH):
-            pygame.draw.rect(
-                surface, 
-                grid[i][j], 
-                pygame.Rect(
-                    PLAY_X + j * GRID_SIZE, 
-                    PLAY_Y + i * GRID_SIZE, 
-                    GRID_SIZE, 
-                    GRID_SIZE
-                )
-            )
-            # Draw grid lines
-            pygame.draw.rect(
-                surface, 
-                GRAY, 
-                pygame.Rect(
-                    PLAY_X + j * GRID_SIZE, 
-                    PLAY_Y + i * GRID_SIZE, 
-                    GRID_SIZE, 
-                    GRID_SIZE
-                ), 
-                1
+    for i in range(layout.rows):
+        draw_grid_row(surface, grid, i, layout)
+
+def draw_grid_row(surface, grid, i, layout=LAYOUT):
+    # Draw one row of the grid
+    size = layout.cell_size
+    for j in range(layout.columns):
+        pygame.draw.rect(
+            surface, 
+            grid.color_at(i, j), 
+            pygame.Rect(
+                layout.x + j * size, 
+                layout.y + i * size, 
+                size, 
+                size
             )
+        )
+        # Draw grid lines
+        pygame.draw.rect(
+            surface, 
+            GRAY, 
+            pygame.Rect(
+                layout.x + j * size, 
+                layout.y + i * size, 
+                size, 
+                size
+            ), 
+            1
+        )
 
-def draw_tetromino(surface, tetromino):
+def draw_tetromino(surface, tetromino, layout=LAYOUT):
     # Draw the current tetromino
-    for i in range(len(tetromino.shape)):
-        for j in range(len(tetromino.shape[i])):
-            if tetromino.shape[i][j] == 1:
-                pygame.draw.rect(
-                    surface, 
-                    tetromino.color,
-                    pygame.Rect(
-                        PLAY_X + (tetromino.x + j) * GRID_SIZE, 
-                        PLAY_Y + (tetromino.y + i) * GRID_SIZE, 
-                        GRID_SIZE, 
-                        GRID_SIZE
-                    )
-                )
-                # Draw outline
-                pygame.draw.rect(
-                    surface, 
-                    BLACK, 
-                    pygame.Rect(
-                        PLAY_X + (tetromino.x + j) * GRID_SIZE, 
-                        PLAY_Y + (tetromino.y + i) * GRID_SIZE, 
-                        GRID_SIZE, 
-                        GRID_SIZE
-                    ), 
-                    1
-                )
+    for i, j in tetromino.get_positions():
+        draw_block(surface, tetromino.color, i, j, layout)
+
+def draw_block(surface, color, i, j, layout=LAYOUT):
+    # Draw one cell of a falling piece
+    size = layout.cell_size
+    pygame.draw.rect(
+        surface, 
+        color,
+        pygame.Rect(
+            layout.x + j * size, 
+            layout.y + i * size, 
+            size, 
+            size
+        )
+    )
+    # Draw outline
+    pygame.draw.rect(
+        surface, 
+        BLACK, 
+        pygame.Rect(
+            layout.x + j * size, 
+            layout.y + i * size, 
+            size, 
+            size
+        ), 
+        1
+    )
+
+class PieceSprites:
+    # Every piece drawn once per cell size onto its own surface, so previews
+    # are one opaque blit each instead of two rects per cell
+
+    def __init__(self):
+        self.sprites = {}
+
+    def build(self, shape_idx, cell_size):
+        shape = SHAPES[shape_idx]
+        color = SHAPE_COLORS[shape_idx]
+        sprite = pygame.Surface((len(shape[0]) * cell_size, len(shape) * cell_size)).convert()
+        sprite.fill(BLACK)
+        for i in range(len(shape)):
+            for j in range(len(shape[i])):
+                if shape[i][j] == 1:
+                    rect = pygame.Rect(j * cell_size, i * cell_size, cell_size, cell_size)
+                    pygame.draw.rect(sprite, color, rect)
+                    pygame.draw.rect(sprite, BLACK, rect, 1)
+        return sprite
+
+    def get(self, shape_idx, cell_size=GRID_SIZE):
+        key = (shape_idx, cell_size)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.sprites[key] = self.build(shape_idx, cell_size)
+        return sprite
+
+PIECE_SPRITES = PieceSprites()
 
 def draw_next_piece(surface, shape_idx):
     # Draw the next piece preview
-    font = pygame.font.SysFont('arial', 24)
-    label = font.render("Next Piece:", True, WHITE)
+    label = render_text('arial', 24, "Next Piece:", WHITE)
     surface.blit(label, (WIDTH - 200, 100))
-    
-    shape = SHAPES[shape_idx]
-    color = SHAPE_COLORS[shape_idx]
-    
-    # Calculate center position for the preview
-    center_x = WIDTH - 150
-    center_y = 180
-    
-    for i in range(len(shape)):
-        for j in range(len(shape[i])):
-            if shape[i][j] == 1:
-                pygame.draw.rect(
-                    surface,
-                    color,
-                    pygame.Rect(
-                        center_x + j * GRID_SIZE, 
-                        center_y + i * GRID_SIZE, 
-                        GRID_SIZE, 
-                        GRID_SIZE
-                    )
-                )
-                pygame.draw.rect(
-                    surface,
-                    BLACK,
-                    pygame.Rect(
-                        center_x + j * GRID_SIZE, 
-                        center_y + i * GRID_SIZE, 
-                        GRID_SIZE, 
-                        GRID_SIZE
-                    ),
-                    1
-                )
+    surface.blit(PIECE_SPRITES.get(shape_idx), (WIDTH - 150, 180))
+
+def draw_queue(surface, queue):
+    # Draw the pieces coming after the next one, smaller, below the score
+    for k, shape_idx in enumerate(queue[:QUEUE_PREVIEWS]):
+        surface.blit(PIECE_SPRITES.get(shape_idx, QUEUE_CELL_SIZE),
+                     (WIDTH - 150, QUEUE_Y + k * QUEUE_SPACING))
 
 def draw_score(surface, score, level, lines):
     # Draw the score, level and lines cleared
-    font = pygame.font.SysFont('arial', 24)
-    
-    score_label = font.render(f"Score: {score}", True, WHITE)
-    level_label = font.render(f"Level: {level}", True, WHITE)
-    lines_label = font.render(f"Lines: {lines}", True, WHITE)
+    score_label = render_text('arial', 24, f"Score: {score}", WHITE)
+    level_label = render_text('arial', 24, f"Level: {level}", WHITE)
+    lines_label = render_text('arial', 24, f"Lines: {lines}", WHITE)
     
     surface.blit(score_label, (WIDTH - 200, 250))
     surface.blit(level_label, (WIDTH - 200, 280))
     surface.blit(lines_label, (WIDTH - 200, 310))
 
-def draw_game_area(surface):
+def draw_game_area(surface, layout=LAYOUT):
     # Draw the game area outline
     pygame.draw.rect(
         surface, 
         WHITE, 
         pygame.Rect(
-            PLAY_X - 1, 
-            PLAY_Y - 1, 
-            PLAY_WIDTH + 2, 
-            PLAY_HEIGHT + 2
+            layout.x - 1, 
+            layout.y - 1, 
+            layout.width + 2, 
+            layout.height + 2
         ), 
         1
     )
 
-def main():
-    # Main game function
+def draw_overlay(surface, paused):
+    # Draw the pause or game over message
+    if paused:
+        pause_label = render_text('arial', 40, "PAUSED", WHITE)
+        surface.blit(pause_label, (WIDTH // 2 - pause_label.get_width() // 2, HEIGHT // 2))
+    else:
+        go_label = render_text('arial', 40, "GAME OVER", RED)
+        restart_label = render_text('arial', 24, "Press R to restart or Q to quit", WHITE)
+        surface.blit(go_label, (WIDTH // 2 - go_label.get_width() // 2, HEIGHT // 2 - 30))
+        surface.blit(restart_label, (WIDTH // 2 - restart_label.get_width() // 2, HEIGHT // 2 + 30))
+
+class TetrisRenderer:
+    # Draws a TetrisLogic game to the screen, touching only what changed.
+    # Locked cells and grid lines live on a cached background layer; each
+    # frame restores the cells the falling piece left, redraws the cells it
+    # entered and passes just those rects to pygame.display.update.
+
+    PANEL_RECT = pygame.Rect(WIDTH - PANEL_WIDTH, 100, PANEL_WIDTH,
+                             QUEUE_Y + QUEUE_PREVIEWS * QUEUE_SPACING - 100)
+
+    def __init__(self, screen, layout=LAYOUT):
+        self.screen = screen
+        self.layout = layout
+        self.background = pygame.Surface(screen.get_size()).convert()
+        self.background.fill(BLACK)
+        draw_game_area(self.background, layout)
+        self.grid_rows = [None] * layout.rows  # Color rows drawn on the background
+        self.piece = None
+        self.piece_cells = set()
+        self.panel = None
+        self.overlay = None
+        self.full_redraw = True
+
+    def invalidate(self):
+        """Force a full redraw on the next frame"""
+        self.full_redraw = True
+
+    def cell_rect(self, i, j):
+        layout = self.layout
+        size = layout.cell_size
+        return pygame.Rect(layout.x + j * size, layout.y + i * size, size, size)
+
+    def update_background(self, grid):
+        """Redraw changed grid rows onto the background, returning their indices"""
+        changed = []
+        for i in range(self.layout.rows):
+            row = bytes(grid.colors[i])
+            if row != self.grid_rows[i]:
+                self.grid_rows[i] = row
+                draw_grid_row(self.background, grid, i, self.layout)
+                changed.append(i)
+        return changed
+
+    def draw(self, game, paused=False):
+        """Draw a frame and update the changed parts of the display, returning
+        True if the whole screen was redrawn"""
+        screen = self.screen
+        overlay = 'paused' if paused else 'game_over' if game.game_over else None
+        if overlay != self.overlay:
+            self.overlay = overlay
+            self.full_redraw = True
+
+        changed_rows = self.update_background(game.grid)
+        if overlay is None:
+            piece_cells = {cell for cell in game.current_piece.get_positions() if cell[0] >= 0}
+        else:
+            piece_cells = set()
+        panel = self.panel_state(game)
+
+        # A newly spawned piece may overlap the old one's cells in another color
+        piece = game.current_piece
+        drawn_cells = self.piece_cells if piece is self.piece else set()
+        self.piece = piece
+
+        if self.full_redraw:
+            self.full_redraw = False
+            self.piece_cells = piece_cells
+            self.panel = panel
+            screen.blit(self.background, (0, 0))
+            for i, j in piece_cells:
+                draw_block(screen, piece.color, i, j, self.layout)
+            self.draw_panel(game)
+            if overlay is not None:
+                draw_overlay(screen, paused)
+            pygame.display.update()
+            return True
+
+        rects = []
+        layout = self.layout
+        # Rows that changed under the piece (locks and line clears)
+        for i in changed_rows:
+            row_rect = pygame.Rect(layout.x, layout.y + i * layout.cell_size, layout.width, layout.cell_size)
+            screen.blit(self.background, row_rect, row_rect)
+            rects.append(row_rect)
+
+        # Cells the piece left get the background back
+        for i, j in self.piece_cells - piece_cells:
+            rect = self.cell_rect(i, j)
+            screen.blit(self.background, rect, rect)
+            rects.append(rect)
+
+        # Cells the piece entered, plus any of its cells a row redraw covered
+        changed = set(changed_rows)
+        for i, j in piece_cells:
+            if (i, j) not in drawn_cells or i in changed:
+                draw_block(screen, piece.color, i, j, layout)
+                rects.append(self.cell_rect(i, j))
+        self.piece_cells = piece_cells
+
+        if panel != self.panel:
+            self.panel = panel
+            screen.blit(self.background, self.PANEL_RECT, self.PANEL_RECT)
+            self.draw_panel(game)
+            rects.append(self.PANEL_RECT)
+
+        if rects:
+            pygame.display.update(rects)
+        return False
+
+    def panel_state(self, game):
+        """What the panel shows, redrawn when it changes"""
+        return (game.score, game.level, game.lines_cleared_total, tuple(game.queue))
+
+    def draw_panel(self, game):
+        draw_score(self.screen, game.score, game.level, game.lines_cleared_total)
+        draw_next_piece(self.screen, game.next_piece_idx)
+        draw_queue(self.screen, list(game.queue)[1:])
+
+class MatchRenderer(TetrisRenderer):
+    # Draws the player's board of an online match (a RemoteBoard), with the
+    # garbage lines waiting to rise under it at the bottom of the panel
+
+    PANEL_RECT = TetrisRenderer.PANEL_RECT.union(
+        pygame.Rect(WIDTH - PANEL_WIDTH, GARBAGE_Y, PANEL_WIDTH, 30))
+
+    def panel_state(self, game):
+        return super().panel_state(game) + (game.garbage,)
+
+    def draw_panel(self, game):
+        super().draw_panel(game)
+        if game.garbage:
+            label = render_text('arial', 24, f"Incoming: {game.garbage}", RED)
+            self.screen.blit(label, (WIDTH - 200, GARBAGE_Y))
+
+class OpponentView:
+    # An opponent's board in an online match, drawn small beside the
+    # player's, in full but only when something on it changed
+
+    def __init__(self, screen, layout):
+        self.screen = screen
+        self.layout = layout
+        self.rect = pygame.Rect(layout.x - 1, layout.y - 31, layout.width + 2, layout.height + 32)
+        self.shown = None
+
+    def invalidate(self):
+        self.shown = None
+
+    def draw(self, board):
+        piece = board.current_piece
+        shown = (tuple(board.grid.colors), piece.shape_idx, piece.rotation, piece.x, piece.y,
+                 board.score, board.garbage, board.game_over)
+        if shown == self.shown:
+            return
+        self.shown = shown
+        screen = self.screen
+        layout = self.layout
+        screen.fill(BLACK, self.rect)
+        draw_game_area(screen, layout)
+        draw_grid(screen, board.grid, layout)
+        if not board.game_over:
+            for i, j in piece.get_positions():
+                if i >= 0:
+                    draw_block(screen, piece.color, i, j, layout)
+        text = "GAME OVER" if board.game_over else f"{board.score}"
+        if board.garbage:
+            text += f"  +{board.garbage}"
+        label = render_text('arial', 20, text, RED if board.game_over else WHITE)
+        screen.blit(label, (layout.x, layout.y - 28))
+        pygame.display.update(self.rect)
+
+# Timed while the profiler is on
+PROFILER.watch(BitGrid, 'clear_rows')
+PROFILER.watch(TetrisRenderer, 'draw', 'TetrisRenderer.draw')
+for name in ('draw_grid', 'draw_grid_row', 'draw_tetromino', 'draw_block', 'draw_next_piece',
+             'draw_queue', 'draw_score', 'draw_game_area', 'draw_overlay'):
+    PROFILER.watch(sys.modules[__name__], name)
+
+def main(record=None, profile=None, size=(GRID_WIDTH, GRID_HEIGHT), generator='random',
+         spectate_port=None):
+    # Main game function, recording a replay and exporting profiler metrics to
+    # the given files if any, with pieces dealt by the named generator, and
+    # serving a spectator feed on the given port if any
+    startup.init_pygame()
+    if profile:
+        start_export(profile)
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("Tetris")
-    clock = pygame.time.Clock()
-    
-    global grid
-    grid = create_grid()
-    
-    # Game variables
-    score = 0
-    level = 1
-    lines_cleared_total = 0
-    fall_speed = 0.5  # Time in seconds between falls
-    last_fall_time = time.time()
     
-    # Create first tetromino
-    current_piece_idx = random.randint(0, len(SHAPES) - 1)
-    current_piece = Tetromino(GRID_WIDTH // 2 - 1, 0, current_piece_idx)
-    
-    # Generate next piece
-    next_piece_idx = random.randint(0, len(SHAPES) - 1)
-    
-    game_over = False
+    seed = random.getrandbits(64)
+    game = TetrisLogic(seed, *size, generator=generator)
+    recorder = replay.recorder(record, 'tetris', game, seed, FPS)
+    feed = spectate.broadcaster(spectate_port, 'tetris', game)
+    sessions = scores.SessionTracker(scores.open_store(), 'tetris', game)
+    renderer = TetrisRenderer(screen, play_layout(*size))
+    bot = TetrisBot()
+    # Gravity is the fixed simulation step: one fall per tick
+    loop = GameLoop(1 / game.fall_speed, FPS)
     paused = False
+    autoplay = False
     
     # Game loop
     running = True
     while running:
+        recorder.tick()
+        feed.publish()
+        PROFILER.frame()
+        
         # Check events
-        for event in pygame.event.get():
+        for event in loop.events():
             if event.type == pygame.QUIT:
                 running = False
                 pygame.quit()
                 sys.exit()
             
-            if game_over:
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                # Toggle the profiler overlay
+                PROFILER.toggle()
+                renderer.invalidate()
+                continue
+            
+            if game.game_over:
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
                         # Restart game
-                        grid = create_grid()
-                        score = 0
-                        level = 1
-                        lines_cleared_total = 0
-                        fall_speed = 0.5
-                        current_piece_idx = random.randint(0, len(SHAPES) - 1)
-                        current_piece = Tetromino(GRID_WIDTH // 2 - 1, 0, current_piece_idx)
-                        next_piece_idx = random.randint(0, len(SHAPES) - 1)
-                        game_over = False
+                        sessions.finish()
+                        recorder.apply('reset')
+                        sessions.start()
                     elif event.key == pygame.K_q:
                         running = False
                         pygame.quit()
@@ -323,110 +433,115 @@ def main():
             
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_LEFT:
-                    current_piece.move(-1, 0, grid)
+                    recorder.apply('left')
                 elif event.key == pygame.K_RIGHT:
-                    current_piece.move(1, 0, grid)
+                    recorder.apply('right')
                 elif event.key == pygame.K_DOWN:
-                    current_piece.move(0, 1, grid)
+                    recorder.apply('down')
                 elif event.key == pygame.K_UP:
-                    current_piece.rotate()
+                    recorder.apply('rotate')
                 elif event.key == pygame.K_SPACE:
-                    # Hard drop
-                    while current_piece.move(0, 1, grid):
-                        pass
-                    grid = merge_tetromino(grid, current_piece)
-                    lines, grid = clear_rows(grid)
-                    
-                    # Update score based on lines cleared
-                    if lines == 1:
-                        score += 100 * level
-                    elif lines == 2:
-                        score += 300 * level
-                    elif lines == 3:
-                        score += 500 * level
-                    elif lines == 4:
-                        score += 800 * level
-                    
-                    lines_cleared_total += lines
-                    level = lines_cleared_total // 10 + 1
-                    fall_speed = max(0.1, 0.5 - (level - 1) * 0.05)
-                    
-                    # Get the next piece
-                    current_piece_idx = next_piece_idx
-                    current_piece = Tetromino(GRID_WIDTH // 2 - 1, 0, current_piece_idx)
-                    next_piece_idx = random.randint(0, len(SHAPES) - 1)
-                    
-                    # Check for game over
-                    if not current_piece.is_valid_position(current_piece.x, current_piece.y, current_piece.shape):
-                        game_over = True
-                
+                    recorder.apply('drop')
                 elif event.key == pygame.K_p:
                     paused = not paused
+                elif event.key == pygame.K_a:
+                    # Toggle the placement bot
+                    autoplay = not autoplay
+                    if not autoplay:
+                        pygame.display.set_caption("Tetris")
+        PROFILER.lap('events')
         
-        if paused or game_over:
+        if paused or game.game_over:
             # Draw everything but don't update game state
-            screen.fill(BLACK)
-            draw_game_area(screen)
-            draw_grid(screen, grid)
-            draw_score(screen, score, level, lines_cleared_total)
-            draw_next_piece(screen, next_piece_idx)
-            
-            font = pygame.font.SysFont('arial', 40)
-            if paused:
-                pause_label = font.render("PAUSED", True, WHITE)
-                screen.blit(pause_label, (WIDTH // 2 - pause_label.get_width() // 2, HEIGHT // 2))
-            elif game_over:
-                go_label = font.render("GAME OVER", True, RED)
-                restart_label = pygame.font.SysFont('arial', 24).render("Press R to restart or Q to quit", True, WHITE)
-                screen.blit(go_label, (WIDTH // 2 - go_label.get_width() // 2, HEIGHT // 2 - 30))
-                screen.blit(restart_label, (WIDTH // 2 - restart_label.get_width() // 2, HEIGHT // 2 + 30))
-            
-            pygame.display.update()
-            clock.tick(FPS)
+            loop.advance(False)
+            if loop.render_due():
+                renderer.draw(game, paused)
+                PROFILER.show_overlay(screen)
+                PROFILER.lap('draw')
+            loop.wait(idle=not PROFILER.overlay)
             continue
             
-        # Check if it's time for the piece to fall
-        if time.time() - last_fall_time > fall_speed:
-            if not current_piece.move(0, 1, grid):
-                # The piece can't move down anymore
-                grid = merge_tetromino(grid, current_piece)
-                lines, grid = clear_rows(grid)
-                
-                # Update score based on lines cleared
-                if lines == 1:
-                    score += 100 * level
-                elif lines == 2:
-                    score += 300 * level
-                elif lines == 3:
-                    score += 500 * level
-                elif lines == 4:
-                    score += 800 * level
-                
-                lines_cleared_total += lines
-                level = lines_cleared_total // 10 + 1
-                fall_speed = max(0.1, 0.5 - (level - 1) * 0.05)
-                
-                # Get the next piece
-                current_piece_idx = next_piece_idx
-                current_piece = Tetromino(GRID_WIDTH // 2 - 1, 0, current_piece_idx)
-                next_piece_idx = random.randint(0, len(SHAPES) - 1)
-                
-                # Check for game over
-                if not current_piece.is_valid_position(current_piece.x, current_piece.y, current_piece.shape):
-                    game_over = True
-            
-            last_fall_time = time.time()
+        if autoplay:
+            placement = bot.choose(game)
+            if placement is None:
+                recorder.apply('drop')
+            else:
+                recorder.apply('place', placement.turns, placement.x)
+            stats = bot.report()
+            pygame.display.set_caption(
+                f"Tetris - autoplay: {stats['placements_per_sec'] / 1000:.0f}k placements/s")
         
-        # Draw everything
-        screen.fill(BLACK)
-        draw_game_area(screen)
-        draw_grid(screen, grid)
-        draw_tetromino(screen, current_piece)
-        draw_score(screen, score, level, lines_cleared_total)
-        draw_next_piece(screen, next_piece_idx)
+        # Let the piece fall once for every gravity tick that is due (the
+        # bot drops its own pieces)
+        loop.tick_rate = 1 / game.fall_speed
+        for _ in range(loop.advance(not autoplay)):
+            recorder.apply('fall')
+            if game.game_over:
+                break
+        sessions.update()
+        PROFILER.lap('simulation')
         
-        pygame.display.update()
+        # Draw everything
+        if loop.render_due():
+            renderer.draw(game)
+            PROFILER.show_overlay(screen)
+            PROFILER.lap('draw')
+        loop.wait()
+
+ONLINE_KEYS = {
+    pygame.K_LEFT: 'left',
+    pygame.K_RIGHT: 'right',
+    pygame.K_DOWN: 'down',
+    pygame.K_UP: 'rotate',
+    pygame.K_SPACE: 'drop',
+}
+
+def play_online(address, room_id):
+    # Play a match on a tetris_server. Keys go to the server, which runs the
+    # game, and the board drawn is the one its frames describe; the board
+    # shows as paused until the room is full. Opponents' boards are drawn
+    # smaller on the left.
+    from tetris_server import NetworkClient
+    host, _, port = address.rpartition(':')
+    startup.init_pygame()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(f"Tetris - room {room_id}")
+    client = NetworkClient(host or 'localhost', int(port), room_id)
+    clock = pygame.time.Clock()
+    renderer = None
+    opponents = []
+
+    while client.connected and not client.full:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_q):
+                client.close()
+                pygame.quit()
+                return
+            if event.type == pygame.KEYDOWN and event.key in ONLINE_KEYS:
+                client.send_input(ONLINE_KEYS[event.key])
+        client.poll()
+        if client.slot is not None:
+            if renderer is None:
+                layout = play_layout(client.width, client.height)
+                renderer = MatchRenderer(screen, layout)
+                others = [slot for slot in range(len(client.boards)) if slot != client.slot]
+                opponents = [
+                    (slot, OpponentView(screen, opponent_layout(client.width, client.height, layout,
+                                                                k, len(others))))
+                    for k, slot in enumerate(others)]
+            board = client.board
+            if renderer.draw(board, board.waiting and not board.game_over):
+                for _, view in opponents:
+                    view.invalidate()
+            for slot, view in opponents:
+                view.draw(client.boards[slot])
         clock.tick(FPS)
+    client.close()
+    pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if replay.option('--connect'):
+        play_online(replay.option('--connect'), int(replay.option('--room') or 0))
+    else:
+        main(replay.record_path(), profile_path(), replay.size_option() or (GRID_WIDTH, GRID_HEIGHT),
+             replay.option('--generator') or 'random', spectate.spectate_port())
\ No newline at end of file
@@ -0,0 +1,350 @@
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from tetris_logic import BitGrid, Tetromino, SHAPES, O_PIECE, column_profile
+
+# Placement search bot for Tetris.
+# Every legal final placement of a piece is found by replaying what a player
+# can do from the spawn position (rotate with SRS kicks, slide sideways, hard
+# drop) on the occupancy bitmasks. Placements are scored with a linear
+# feature evaluator, optionally planning ahead over the game's piece queue
+# and refining the best candidates with random rollouts spread over a
+# process pool.
+
+# Feature weights (aggregate height, lines cleared, holes, bumpiness)
+DEFAULT_WEIGHTS = (-0.510066, 0.760666, -0.35663, -0.184483)
+
+BEAM_WIDTH = 6  # Best placements followed up at each planned piece after the first
+
+# A final piece position: turns is the number of clockwise rotations from
+# spawn (3 is played as one counter-clockwise turn), x/y the resting
+# position, rows the grid rows after locking and clearing, lines the number
+# of rows cleared and score the evaluator's value.
+Placement = namedtuple('Placement', ['shape_idx', 'turns', 'x', 'y', 'rows', 'lines', 'score'])
+
+
+class SearchGrid:
+    # Just the occupancy rows of a BitGrid, enough for collision checks
+    # during search without copying the color array
+    collides = BitGrid.collides
+
+    def __init__(self, rows, width, height):
+        self.rows = rows
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+
+
+def spawn_piece(grid, shape_idx):
+    """Create a tetromino where TetrisLogic would spawn it"""
+    return Tetromino(grid.width // 2 - 1, 0, shape_idx)
+
+
+def lock_rows(grid, piece):
+    """Return (rows, lines) after locking a piece and clearing full rows like BitGrid.clear_rows"""
+    rows = list(grid.rows)
+    _, masks, min_col, _ = piece.state
+    shift = piece.x + min_col
+    for i, mask in masks:
+        if piece.y + i >= 0:
+            rows[piece.y + i] |= mask << shift
+    full_row = grid.full_row
+    kept = [row for row in rows if row != full_row]
+    lines = len(rows) - len(kept)
+    if lines:
+        kept[:0] = [0] * lines
+    return kept, lines
+
+
+def features(rows, width):
+    """Return (aggregate height, holes, bumpiness) of a grid's rows"""
+    height = len(rows)
+    heights = [0] * width
+    seen = 0
+    holes = 0
+    for i, row in enumerate(rows):
+        new = row & ~seen
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = height - i
+            new ^= low
+        holes += bin(seen & ~row).count('1')
+        seen |= row
+    bumpiness = 0
+    for j in range(1, width):
+        bumpiness += abs(heights[j] - heights[j - 1])
+    return sum(heights), holes, bumpiness
+
+
+def placed_features(heights, cells, piece, height):
+    """Return features() after placing a piece that clears no lines, from the
+    column heights and filled cell count of the grid before it"""
+    heights = list(heights)
+    for i, j in piece.get_positions():
+        if i >= 0:
+            cells += 1
+            if heights[j] < height - i:
+                heights[j] = height - i
+    aggregate_height = sum(heights)
+    bumpiness = 0
+    for j in range(1, len(heights)):
+        bumpiness += abs(heights[j] - heights[j - 1])
+    return aggregate_height, aggregate_height - cells, bumpiness
+
+
+def evaluate(rows, width, lines, weights=DEFAULT_WEIGHTS):
+    """Score a grid after a placement (higher is better)"""
+    return evaluate_features(features(rows, width), lines, weights)
+
+
+def evaluate_features(features, lines, weights=DEFAULT_WEIGHTS):
+    """Score the features of a grid after a placement"""
+    aggregate_height, holes, bumpiness = features
+    return (
+        weights[0] * aggregate_height
+        + weights[1] * lines
+        + weights[2] * holes
+        + weights[3] * bumpiness
+    )
+
+
+def placements(grid, shape_idx, weights=DEFAULT_WEIGHTS):
+    """Return every distinct legal final placement of a piece, scored"""
+    results = []
+    seen = set()
+    # Placements that clear no lines only change the columns the piece lands
+    # in, so they are scored from the grid's column profile
+    heights, filled = column_profile(grid.rows, grid.width)
+    filled_cells = sum(filled)
+    for turns in range(1 if shape_idx == O_PIECE else 4):
+        piece = spawn_piece(grid, shape_idx)
+        if not piece.is_valid_position(piece.x, piece.y, piece.rotation, grid):
+            return results
+        if turns == 3:
+            rotated = piece.rotate(grid, -1)
+        else:
+            rotated = all(piece.rotate(grid) for _ in range(turns))
+        if not rotated:
+            continue
+
+        # Every column reachable by sliding left or right from here
+        start_x = piece.x
+        columns = [start_x]
+        while piece.move(-1, 0, grid):
+            columns.append(piece.x)
+        piece.x = start_x
+        while piece.move(1, 0, grid):
+            columns.append(piece.x)
+
+        start_y = piece.y
+        for x in columns:
+            y = start_y
+            while not grid.collides(piece.state, x, y + 1):
+                y += 1
+            piece.x = x
+            piece.y = y
+            cells = frozenset(piece.get_positions())
+            if cells in seen:
+                continue
+            seen.add(cells)
+            rows, lines = lock_rows(grid, piece)
+            if lines:
+                score = evaluate(rows, grid.width, lines, weights)
+            else:
+                score = evaluate_features(placed_features(heights, filled_cells, piece, grid.height), 0, weights)
+            results.append(Placement(shape_idx, turns, x, y, rows, lines, score))
+    return results
+
+
+def rollout(args):
+    """Play random pieces greedily from a grid and return (average score, placements evaluated)
+
+    Runs in worker processes, so it only takes plain picklable values.
+    """
+    rows, width, height, seeds, depth, weights = args
+    total = 0.0
+    evaluated = 0
+    for seed in seeds:
+        rng = random.Random(seed)
+        grid = SearchGrid(list(rows), width, height)
+        lines = 0
+        penalty = 0.0
+        for _ in range(depth):
+            options = placements(grid, rng.randint(0, len(SHAPES) - 1), weights)
+            evaluated += len(options)
+            if not options:
+                penalty = 1000.0  # Topped out
+                break
+            best = max(options, key=lambda placement: placement.score)
+            grid.rows = best.rows
+            lines += best.lines
+        # The final grid scored on its own, with every line cleared on the way counted once
+        total += evaluate(grid.rows, width, 0, weights) + weights[1] * lines - penalty
+    return total / len(seeds), evaluated
+
+
+class TetrisBot:
+    """Chooses and plays placements for a TetrisLogic game
+
+    With lookahead on, each placement of the current piece is scored by the
+    best plan for the next preview pieces of the queue on the resulting
+    grid, following the beam best placements of every piece after the
+    first. The best plan is kept in plan. Placements found during a search
+    are kept for the next one, which starts from the grid the plan led to,
+    so the next spawn doesn't search from scratch. With rollouts above zero,
+    the top_k candidates are then re-ranked by the average of that many
+    random rollouts of rollout_depth pieces, run across a process pool of
+    the given number of workers.
+    """
+
+    def __init__(self, weights=DEFAULT_WEIGHTS, lookahead=True, rollouts=0,
+                 rollout_depth=4, top_k=4, workers=None, seed=None, preview=1, beam=BEAM_WIDTH):
+        self.weights = weights
+        self.lookahead = lookahead
+        self.preview = preview
+        self.beam = beam
+        self.plan = []  # Placements planned for the current piece and the queue after it
+        self.cache = {}  # (rows, width, shape) -> placements, from this search
+        self.previous = {}  # The same from the search before
+        self.rollouts = rollouts
+        self.rollout_depth = rollout_depth
+        self.top_k = top_k
+        self.workers = workers
+        self.pool = None
+        self.rng = random.Random(seed)  # Seeds for the rollouts
+        self.evaluated = 0
+        self.elapsed = 0.0
+
+    def placements(self, grid, shape_idx):
+        """Return placements(grid, shape_idx), reusing those found by this search or the last"""
+        key = (tuple(grid.rows), grid.width, shape_idx)
+        options = self.cache.get(key)
+        if options is None:
+            options = self.previous.get(key)
+            if options is None:
+                options = placements(grid, shape_idx, self.weights)
+                self.evaluated += len(options)
+            self.cache[key] = options
+        return options
+
+    def search(self, grid, pieces):
+        """Return (value, plan): the best value reachable by placing pieces in turn, and the placements reaching it"""
+        options = self.placements(grid, pieces[0])
+        if not options:
+            return -1000.0, []  # Topped out
+        if len(pieces) == 1:
+            best = max(options, key=lambda placement: placement.score)
+            return best.score, [best]
+        options = sorted(options, key=lambda placement: placement.score, reverse=True)
+        best = None
+        for placement in options[:self.beam]:
+            after = SearchGrid(placement.rows, grid.width, grid.height)
+            value, plan = self.search(after, pieces[1:])
+            value += self.weights[1] * placement.lines
+            if best is None or value > best[0]:
+                best = (value, [placement] + plan)
+        return best
+
+    def prune(self, game, candidates):
+        """Keep the beam best candidates, plus the one the last plan had lined up for this piece"""
+        kept = sorted(candidates, key=lambda placement: placement.score, reverse=True)[:self.beam]
+        plan = self.plan
+        if (len(plan) > 1 and plan[0].rows == game.grid.rows
+                and plan[1].shape_idx == game.current_piece.shape_idx
+                and not any(placement is plan[1] for placement in kept)):
+            # The plan's candidates came from the same cached search, so it is among them
+            if any(placement is plan[1] for placement in candidates):
+                kept.append(plan[1])
+        return kept
+
+    def choose(self, game):
+        """Return the best Placement for the game's current piece, or None"""
+        start = time.perf_counter()
+        self.previous, self.cache = self.cache, {}
+        grid = SearchGrid(game.grid.rows, game.grid.width, game.grid.height)
+        candidates = self.placements(grid, game.current_piece.shape_idx)
+        if not candidates:
+            self.plan = []
+            self.elapsed += time.perf_counter() - start
+            return None
+
+        plans = {}
+        if self.lookahead:
+            pieces = list(game.queue)[:self.preview]
+            if len(pieces) > 1 and len(candidates) > self.beam:
+                candidates = self.prune(game, candidates)
+            ranked = []
+            for placement in candidates:
+                after = SearchGrid(placement.rows, grid.width, grid.height)
+                value, plans[id(placement)] = self.search(after, pieces)
+                ranked.append((value + self.weights[1] * placement.lines, placement))
+        else:
+            ranked = [(placement.score, placement) for placement in candidates]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+
+        if self.rollouts > 0 and len(ranked) > 1:
+            ranked = self.rerank(ranked[:self.top_k], grid)
+
+        best = ranked[0][1]
+        self.plan = [best] + plans.get(id(best), [])
+        self.elapsed += time.perf_counter() - start
+        return best
+
+    def rerank(self, ranked, grid):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+        jobs = []
+        for _, placement in ranked:
+            seeds = [self.rng.getrandbits(32) for _ in range(self.rollouts)]
+            jobs.append((tuple(placement.rows), grid.width, grid.height, seeds,
+                         self.rollout_depth, self.weights))
+        results = list(self.pool.map(rollout, jobs))
+        rescored = []
+        for (_, placement), (value, evaluated) in zip(ranked, results):
+            self.evaluated += evaluated
+            rescored.append((value + self.weights[1] * placement.lines, placement))
+        rescored.sort(key=lambda item: item[0], reverse=True)
+        return rescored
+
+    def play(self, game):
+        """Choose a placement and play it, returning the points scored"""
+        placement = self.choose(game)
+        if placement is None:
+            return game.hard_drop()
+        return play_placement(game, placement)
+
+    def report(self):
+        """Placements evaluated so far and how fast"""
+        return {
+            'placements': self.evaluated,
+            'seconds': self.elapsed,
+            'placements_per_sec': self.evaluated / self.elapsed if self.elapsed else 0.0,
+        }
+
+    def close(self):
+        """Shut down the rollout process pool"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+def play_placement(game, placement):
+    """Rotate, slide and hard drop the current piece into a placement, returning the points scored"""
+    return play_move(game, placement.turns, placement.x)
+
+
+def play_move(game, turns, x):
+    """Turn the current piece clockwise turns times (3 is one counter-clockwise turn), slide it to column x and hard drop it"""
+    # Placements are found from the spawn, so start there whatever the piece did before
+    game.current_piece = game.spawn_piece(game.current_piece.shape_idx)
+    if turns == 3:
+        game.current_piece.rotate(game.grid, -1)
+    else:
+        for _ in range(turns):
+            game.rotate()
+    dx = 1 if x > game.current_piece.x else -1
+    while game.current_piece.x != x and game.move(dx, 0):
+        pass
+    return game.hard_drop()
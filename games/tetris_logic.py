@@ -0,0 +1,730 @@
+import struct
+from collections import deque, namedtuple
+
+from gamestate import SnapshotRandom, pack_rng, unpack_rng
+
+# Game logic for Tetris without any pygame dependency, so games can be stepped
+# headless as fast as the CPU allows. tetris.py draws on top of this.
+
+# Constants
+GRID_WIDTH = 10  # Standard Tetris grid width
+GRID_HEIGHT = 20  # Standard Tetris grid height
+
+# Colors
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+CYAN = (0, 255, 255)
+MAGENTA = (255, 0, 255)
+YELLOW = (255, 255, 0)
+ORANGE = (255, 165, 0)
+GRAY = (128, 128, 128)
+
+# Tetromino shapes and colors
+SHAPES = [
+    [[1, 1, 1, 1]],  # I
+    [[1, 1], [1, 1]],  # O
+    [[0, 1, 0], [1, 1, 1]],  # T
+    [[0, 1, 1], [1, 1, 0]],  # S
+    [[1, 1, 0], [0, 1, 1]],  # Z
+    [[1, 0, 0], [1, 1, 1]],  # J
+    [[0, 0, 1], [1, 1, 1]]   # L
+]
+
+SHAPE_COLORS = [
+    CYAN,    # I
+    YELLOW,  # O
+    MAGENTA, # T
+    GREEN,   # S
+    RED,     # Z
+    BLUE,    # J
+    ORANGE   # L
+]
+
+# Indices of the pieces that rotate differently
+I_PIECE = 0
+O_PIECE = 1
+
+# Colors indexed by the color indices stored in a BitGrid, with garbage
+# rows sent by an opponent last
+CELL_COLORS = [BLACK] + SHAPE_COLORS + [GRAY]
+GARBAGE = len(CELL_COLORS) - 1
+
+# Single-byte strings of the color indices, spliced into color rows
+COLOR_BYTES = [bytes((i,)) for i in range(len(CELL_COLORS))]
+
+# Points per number of lines cleared at once, multiplied by the level
+LINE_SCORES = {1: 100, 2: 300, 3: 500, 4: 800}
+
+# Actions accepted by step(), either by name or by index
+ACTIONS = ('noop', 'left', 'right', 'down', 'rotate', 'drop')
+
+PREVIEW_PIECES = 5  # Upcoming pieces kept in the queue
+
+
+def rotate_shape(shape):
+    # Rotate a shape matrix clockwise
+    rows = len(shape)
+    cols = len(shape[0])
+    rotated = [[0 for _ in range(rows)] for _ in range(cols)]
+    for r in range(rows):
+        for c in range(cols):
+            rotated[c][rows - 1 - r] = shape[r][c]
+    return rotated
+
+
+# One rotation state of a piece: the (row, column) offsets of its cells, its
+# row bitmasks as (row offset, mask) pairs with the mask shifted so bit 0 is
+# column min_col, and the column span used for wall checks.
+RotationState = namedtuple('RotationState', ['cells', 'masks', 'min_col', 'max_col'])
+
+
+def srs_box(shape_idx):
+    # Place a shape in its SRS bounding box: the I piece in a 4x4 box on the
+    # second row, the O piece in a 2x2 box and the rest in a 3x3 box
+    shape = SHAPES[shape_idx]
+    if shape_idx == I_PIECE:
+        return [[0, 0, 0, 0], list(shape[0]), [0, 0, 0, 0], [0, 0, 0, 0]]
+    box = [list(row) for row in shape]
+    while len(box) < len(box[0]):
+        box.append([0] * len(box[0]))
+    return box
+
+
+def rotation_state(box, top):
+    cells = tuple(
+        (r - top, c)
+        for r in range(len(box))
+        for c in range(len(box[r]))
+        if box[r][c]
+    )
+    min_col = min(c for _, c in cells)
+    max_col = max(c for _, c in cells)
+    masks = {}
+    for r, c in cells:
+        masks[r] = masks.get(r, 0) | (1 << (c - min_col))
+    return RotationState(cells, tuple(sorted(masks.items())), min_col, max_col)
+
+
+def piece_states(shape_idx):
+    # All four clockwise rotation states, with offsets shifted so the spawn
+    # state's top row is row 0 (pieces spawn exactly where SHAPES puts them)
+    boxes = [srs_box(shape_idx)]
+    for _ in range(3):
+        boxes.append(rotate_shape(boxes[-1]))
+    top = min(r for r, row in enumerate(boxes[0]) if any(row))
+    return tuple(rotation_state(box, top) for box in boxes)
+
+
+# Every rotation state of every piece, computed once at import. A piece
+# position is then fully described by (shape_idx, rotation, x, y).
+PIECE_STATES = tuple(piece_states(shape_idx) for shape_idx in range(len(SHAPES)))
+
+# SRS wall kicks tried in order when rotating from one state to the next, as
+# (dx, dy) with y pointing down the grid. States are 0 (spawn), 1 (R),
+# 2 (180) and 3 (L).
+JLSTZ_KICKS = {
+    (0, 1): ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+    (1, 0): ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+    (1, 2): ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+    (2, 1): ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+    (2, 3): ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+    (3, 2): ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+    (3, 0): ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+    (0, 3): ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+}
+I_KICKS = {
+    (0, 1): ((0, 0), (-2, 0), (1, 0), (-2, 1), (1, -2)),
+    (1, 0): ((0, 0), (2, 0), (-1, 0), (2, -1), (-1, 2)),
+    (1, 2): ((0, 0), (-1, 0), (2, 0), (-1, -2), (2, 1)),
+    (2, 1): ((0, 0), (1, 0), (-2, 0), (1, 2), (-2, -1)),
+    (2, 3): ((0, 0), (2, 0), (-1, 0), (2, -1), (-1, 2)),
+    (3, 2): ((0, 0), (-2, 0), (1, 0), (-2, 1), (1, -2)),
+    (3, 0): ((0, 0), (1, 0), (-2, 0), (1, 2), (-2, -1)),
+    (0, 3): ((0, 0), (-1, 0), (2, 0), (-1, -2), (2, 1)),
+}
+NO_KICKS = {key: ((0, 0),) for key in JLSTZ_KICKS}
+PIECE_KICKS = tuple(
+    I_KICKS if shape_idx == I_PIECE else NO_KICKS if shape_idx == O_PIECE else JLSTZ_KICKS
+    for shape_idx in range(len(SHAPES))
+)
+
+
+class Tetromino:
+    def __init__(self, x, y, shape_idx):
+        self.x = x
+        self.y = y
+        self.shape_idx = shape_idx
+        self.color = SHAPE_COLORS[shape_idx]
+        self.rotation = 0
+
+    @property
+    def state(self):
+        return PIECE_STATES[self.shape_idx][self.rotation]
+
+    @property
+    def cells(self):
+        # (row, column) offsets of the filled cells
+        return PIECE_STATES[self.shape_idx][self.rotation].cells
+
+    def rotate(self, grid, direction=1):
+        # Rotate clockwise (or counter-clockwise for direction -1), trying
+        # each SRS wall kick in turn. Returns True if the piece rotated.
+        # For 'O' piece, rotation does nothing
+        if self.shape_idx == O_PIECE:
+            return False
+
+        rotation = (self.rotation + direction) % 4
+        for dx, dy in PIECE_KICKS[self.shape_idx][self.rotation, rotation]:
+            if self.is_valid_position(self.x + dx, self.y + dy, rotation, grid):
+                self.x += dx
+                self.y += dy
+                self.rotation = rotation
+                return True
+        return False
+
+    def is_valid_position(self, x, y, rotation, grid):
+        # Check if the tetromino is in a valid position
+        return not grid.collides(PIECE_STATES[self.shape_idx][rotation], x, y)
+
+    def move(self, dx, dy, grid):
+        # Try to move the tetromino
+        if self.is_valid_position(self.x + dx, self.y + dy, self.rotation, grid):
+            self.x += dx
+            self.y += dy
+            return True
+        return False
+
+    def get_positions(self):
+        x = self.x
+        y = self.y
+        return [(y + i, x + j) for i, j in PIECE_STATES[self.shape_idx][self.rotation].cells]
+
+
+def column_profile(rows, width):
+    """Return (heights, filled): each column's stack height from the floor and
+    its number of filled cells, for occupancy rows listed top to bottom"""
+    height = len(rows)
+    heights = [0] * width
+    filled = [0] * width
+    seen = 0
+    for i, row in enumerate(rows):
+        new = row & ~seen
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = height - i
+            new ^= low
+        seen |= row
+        while row:
+            low = row & -row
+            filled[low.bit_length() - 1] += 1
+            row ^= low
+    return heights, filled
+
+
+class BitGrid:
+    # The playfield as one integer bitmask per row (bit j set when column j is
+    # filled) plus a parallel list of immutable color index rows for
+    # rendering, where 0 is empty and k + 1 is SHAPE_COLORS[k]. Collision
+    # checks are a few ANDs. A line clear only looks at the rows the last
+    # piece touched and removes all of them in one pass over the row lists.
+    # Rows are never changed in place, so after snapshot() the two lists are
+    # only copied (not the rows in them) when the grid next changes.
+    #
+    # The grid also keeps each column's stack height and filled cell count,
+    # which give its holes, up to date as pieces land and lines clear. They
+    # are measured from the rows when first asked for after a restore(), so
+    # code that writes rows directly calls forget_columns().
+
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+        self.colors = [bytes(width)] * height
+        self.shared = False  # The row lists also belong to a snapshot
+        self.touched = None  # (first, last + 1) of the rows placed into since the last clear
+        self.heights = [0] * width  # Column stack heights from the floor, None until measured
+        self.filled = [0] * width  # Filled cells per column, None until measured
+
+    def snapshot(self):
+        """Return (rows, colors), shared with the grid until it next changes"""
+        self.shared = True
+        return self.rows, self.colors
+
+    def restore(self, rows, colors):
+        """Take the row lists of a snapshot, copying them before the next change"""
+        self.rows = rows
+        self.colors = colors
+        self.shared = True
+        self.touched = None
+        self.forget_columns()
+
+    def unshare(self):
+        """Copy the row lists if a snapshot still holds them"""
+        if self.shared:
+            self.rows = list(self.rows)
+            self.colors = list(self.colors)
+            self.shared = False
+
+    def forget_columns(self):
+        """Drop the column heights and counts, to be measured again when next needed"""
+        self.heights = None
+        self.filled = None
+
+    def column_heights(self):
+        """Return each column's stack height, counted from the floor (not to be modified)"""
+        if self.heights is None:
+            self.heights, self.filled = column_profile(self.rows, self.width)
+        return self.heights
+
+    def column_holes(self):
+        """Return each column's empty cells below its top filled cell"""
+        heights = self.column_heights()
+        return [height - filled for height, filled in zip(heights, self.filled)]
+
+    def collides(self, state, x, y):
+        """Check if a rotation state at (x, y) hits a wall, the floor or a filled cell"""
+        _, masks, min_col, max_col = state
+        shift = x + min_col
+        if shift < 0 or x + max_col >= self.width:
+            return True
+        rows = self.rows
+        for i, mask in masks:
+            row = y + i
+            if row >= self.height:
+                return True
+            if row >= 0 and rows[row] & (mask << shift):
+                return True
+        return False
+
+    def place(self, state, x, y, color_index):
+        """Fill a rotation state's cells at (x, y) with a color index"""
+        self.unshare()
+        shift = x + state.min_col
+        for i, mask in state.masks:
+            if y + i >= 0:
+                self.rows[y + i] |= mask << shift
+        colors = self.colors
+        color = COLOR_BYTES[color_index]
+        heights = self.heights
+        filled = self.filled
+        for i, j in state.cells:
+            if y + i >= 0:
+                row = colors[y + i]
+                colors[y + i] = row[:x + j] + color + row[x + j + 1:]
+                if heights is not None:
+                    filled[x + j] += 1
+                    if heights[x + j] < self.height - y - i:
+                        heights[x + j] = self.height - y - i
+        first = max(y + state.masks[0][0], 0)
+        last = y + state.masks[-1][0] + 1
+        if self.touched is not None:
+            first = min(first, self.touched[0])
+            last = max(last, self.touched[1])
+        self.touched = (first, last)
+
+    def merge(self, tetromino):
+        """Add a tetromino to the grid"""
+        self.place(tetromino.state, tetromino.x, tetromino.y, tetromino.shape_idx + 1)
+
+    def clear_rows(self, rows=None):
+        """Remove the filled rows among rows (by default those placed into since
+        the last clear), shifting the rest down, and return their indices"""
+        if rows is None:
+            if self.touched is None:
+                return []
+            rows = range(*self.touched)
+        self.touched = None
+        full_row = self.full_row
+        grid_rows = self.rows
+        cleared = [i for i in rows if grid_rows[i] == full_row]
+        if not cleared:
+            return cleared
+
+        # Rows between the cleared ones keep their order, so the new lists are
+        # the empty rows on top followed by the runs in between
+        count = len(cleared)
+        new_rows = [0] * count
+        new_colors = [bytes(self.width)] * count
+        colors = self.colors
+        start = 0
+        for i in cleared:
+            new_rows += grid_rows[start:i]
+            new_colors += colors[start:i]
+            start = i + 1
+        new_rows += grid_rows[start:]
+        new_colors += colors[start:]
+        self.rows = new_rows
+        self.colors = new_colors
+        self.shared = False
+
+        heights = self.heights
+        if heights is not None:
+            # Every column loses one cell per full row. A column whose top was
+            # in a cleared row ends lower still where it had gaps, so it is
+            # looked up again, starting no higher than count rows down.
+            filled = self.filled
+            for j in range(self.width):
+                filled[j] -= count
+                height = heights[j] - count
+                if self.height - heights[j] in cleared:
+                    bit = 1 << j
+                    for i in range(self.height - height, self.height):
+                        if new_rows[i] & bit:
+                            break
+                        height -= 1
+                heights[j] = height
+        return cleared
+
+    def add_garbage(self, lines, hole):
+        """Push the stack up and fill the bottom lines rows, all but column hole,
+        returning True if filled cells were pushed out of the top"""
+        lines = min(lines, self.height)
+        overflow = any(self.rows[:lines])
+        mask = self.full_row & ~(1 << hole)
+        colors = COLOR_BYTES[GARBAGE] * hole + COLOR_BYTES[0] + COLOR_BYTES[GARBAGE] * (self.width - hole - 1)
+        self.rows = self.rows[lines:] + [mask] * lines
+        self.colors = self.colors[lines:] + [colors] * lines
+        self.shared = False
+        if self.touched is not None:
+            self.touched = (max(self.touched[0] - lines, 0), max(self.touched[1] - lines, 0))
+        heights = self.heights
+        if overflow:
+            self.forget_columns()
+        elif heights is not None:
+            for j in range(self.width):
+                if j != hole:
+                    self.filled[j] += lines
+                    heights[j] += lines
+                elif heights[j]:
+                    heights[j] += lines
+        return overflow
+
+    def is_game_over(self):
+        """Check if any cell in the top row is filled"""
+        return self.rows[0] != 0
+
+    def color_at(self, i, j):
+        """Return the RGB color of the cell at row i, column j"""
+        return CELL_COLORS[self.colors[i][j]]
+
+    def to_color_grid(self):
+        """Convert to the list-of-lists of RGB colors used by create_grid"""
+        return [[CELL_COLORS[c] for c in row] for row in self.colors]
+
+
+class RandomGenerator:
+    # Every piece drawn independently and uniformly, as classic Tetris did
+    name = 'random'
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def next(self):
+        """Draw the index of the next shape"""
+        return self.rng.randint(0, len(SHAPES) - 1)
+
+    def reset(self):
+        pass
+
+    def getstate(self):
+        """Return the generator's own state, beyond that of its random generator"""
+        return ()
+
+    def setstate(self, state):
+        pass
+
+
+class BagGenerator(RandomGenerator):
+    # The 7-bag: pieces are dealt from a shuffled set of all seven shapes,
+    # so every shape comes up once in each run of seven
+    name = 'bag'
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        self.bag = []
+
+    def next(self):
+        if not self.bag:
+            self.bag = list(range(len(SHAPES)))
+            self.rng.shuffle(self.bag)
+        return self.bag.pop()
+
+    def reset(self):
+        self.bag = []
+
+    def getstate(self):
+        return tuple(self.bag)
+
+    def setstate(self, state):
+        self.bag = list(state)
+
+
+# Piece generators by name. Both draw from the game's seeded generator, so a
+# seed always deals the same pieces.
+GENERATORS = {generator.name: generator for generator in (RandomGenerator, BagGenerator)}
+
+
+# List-of-lists helpers for grids of RGB colors (BLACK = empty). TetrisLogic
+# uses the BitGrid representation above instead.
+
+def create_grid():
+    # Create an empty grid
+    return [[BLACK for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
+
+
+def merge_tetromino(grid, tetromino):
+    # Add the tetromino to the grid
+    for i, j in tetromino.get_positions():
+        if i >= 0:
+            grid[i][j] = tetromino.color
+    return grid
+
+
+def clear_rows(grid):
+    # Check for filled rows and clear them
+    rows_cleared = 0
+    for i in range(GRID_HEIGHT):
+        if BLACK not in grid[i]:
+            # Row is filled
+            rows_cleared += 1
+            # Move all rows above down
+            for j in range(i, 0, -1):
+                grid[j] = grid[j-1].copy()
+            # Add new empty row at the top
+            grid[0] = [BLACK for _ in range(GRID_WIDTH)]
+
+    return rows_cleared, grid
+
+
+def is_game_over(grid):
+    # Check if any piece in the top row is filled
+    return any(grid[0][i] != BLACK for i in range(GRID_WIDTH))
+
+
+_STATE_HEADER = struct.Struct('<HHBBhhQIIdBBB')
+
+
+def pack_colors(colors):
+    """Pack color index rows two cells to a byte"""
+    cells = b''.join(colors)
+    if len(cells) % 2:
+        cells += b'\x00'
+    return bytes(a | b << 4 for a, b in zip(cells[0::2], cells[1::2]))
+
+
+def unpack_colors(data, width, height):
+    """Unpack color rows packed by pack_colors"""
+    cells = bytearray()
+    for byte in data:
+        cells.append(byte & 15)
+        cells.append(byte >> 4)
+    return [bytes(cells[i * width:(i + 1) * width]) for i in range(height)]
+
+
+class TetrisState(namedtuple('TetrisState', [
+        'width', 'height', 'rows', 'colors', 'shape_idx', 'rotation', 'x', 'y', 'queue',
+        'score', 'level', 'lines_cleared_total', 'fall_speed', 'game_over', 'generator', 'rng'])):
+    """A snapshot of a Tetris game
+
+    rows and colors are the grid's row lists at the time, shared with the
+    game until it next changes, and must not be modified. queue holds the
+    upcoming shapes and generator the piece generator's own state (the
+    rest of a 7-bag). rng is the random generator's state, or None when it
+    was left out.
+    """
+
+    __slots__ = ()
+
+    def to_bytes(self):
+        """Encode the state: a header, the queue and piece generator state, the
+        color grid at 4 bits a cell and the random generator state"""
+        header = _STATE_HEADER.pack(
+            self.width, self.height, self.shape_idx, self.rotation, self.x, self.y,
+            self.score, self.level, self.lines_cleared_total, self.fall_speed, self.game_over,
+            len(self.queue), len(self.generator))
+        return (header + bytes(self.queue) + bytes(self.generator) + pack_colors(self.colors)
+                + pack_rng(self.rng))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decode a state encoded by to_bytes, rebuilding the row masks from the colors"""
+        (width, height, shape_idx, rotation, x, y, score, level, lines, fall_speed,
+         game_over, queue_length, generator_length) = _STATE_HEADER.unpack_from(data)
+        offset = _STATE_HEADER.size
+        queue = tuple(data[offset:offset + queue_length])
+        offset += queue_length
+        generator = tuple(data[offset:offset + generator_length])
+        offset += generator_length
+        size = (width * height + 1) // 2
+        colors = unpack_colors(data[offset:offset + size], width, height)
+        rng, _ = unpack_rng(data, offset + size)
+        rows = [sum(1 << j for j, color in enumerate(row) if color) for row in colors]
+        return cls(width, height, rows, colors, shape_idx, rotation, x, y, queue,
+                   score, level, lines, fall_speed, bool(game_over), generator, rng)
+
+
+class TetrisLogic:
+    # Pieces come from a pluggable generator (a GENERATORS name or a class
+    # like RandomGenerator) through a queue of the next preview pieces,
+    # which the renderer previews and bots can plan with.
+
+    def __init__(self, seed=None, width=GRID_WIDTH, height=GRID_HEIGHT,
+                 generator=RandomGenerator.name, preview=PREVIEW_PIECES):
+        self.width = width
+        self.height = height
+        self.preview = preview
+        self.rng = SnapshotRandom(seed)
+        if isinstance(generator, str):
+            generator = GENERATORS[generator]
+        self.generator = generator(self.rng)
+        self.reset()
+
+    def reset(self, seed=None):
+        """Reset the game, reseeding the piece generator if a seed is given"""
+        if seed is not None:
+            self.rng.seed(seed)
+        self.grid = BitGrid(self.width, self.height)
+        self.score = 0
+        self.level = 1
+        self.lines_cleared_total = 0
+        self.fall_speed = 0.5  # Time in seconds between falls
+        self.game_over = False
+
+        # Create first tetromino and fill the queue behind it
+        self.generator.reset()
+        self.current_piece = self.spawn_piece(self.random_piece())
+        self.queue = deque(self.random_piece() for _ in range(self.preview))
+
+        # On a narrow board even the first piece may not fit
+        piece = self.current_piece
+        if not piece.is_valid_position(piece.x, piece.y, piece.rotation, self.grid):
+            self.game_over = True
+        return self
+
+    @property
+    def next_piece_idx(self):
+        """The shape that spawns after the current piece"""
+        return self.queue[0]
+
+    def snapshot(self, rng=True):
+        """Return the game state as a TetrisState, leaving out the piece generator if rng is False"""
+        piece = self.current_piece
+        rows, colors = self.grid.snapshot()
+        return TetrisState(
+            self.width, self.height, rows, colors, piece.shape_idx, piece.rotation, piece.x, piece.y,
+            tuple(self.queue), self.score, self.level, self.lines_cleared_total, self.fall_speed,
+            self.game_over, self.generator.getstate(), self.rng.getstate() if rng else None)
+
+    def restore(self, state):
+        """Put the game back in a snapshotted state (the generator too, if it was saved)"""
+        if (state.width, state.height) != (self.grid.width, self.grid.height):
+            self.width = state.width
+            self.height = state.height
+            self.grid = BitGrid(state.width, state.height)
+        self.grid.restore(state.rows, state.colors)
+        self.current_piece = Tetromino(state.x, state.y, state.shape_idx)
+        self.current_piece.rotation = state.rotation
+        self.queue = deque(state.queue)
+        self.generator.setstate(state.generator)
+        self.score = state.score
+        self.level = state.level
+        self.lines_cleared_total = state.lines_cleared_total
+        self.fall_speed = state.fall_speed
+        self.game_over = state.game_over
+        if state.rng is not None:
+            self.rng.setstate(state.rng)
+        return self
+
+    def random_piece(self):
+        """Draw the index of a shape from the piece generator"""
+        return self.generator.next()
+
+    def spawn_piece(self, shape_idx):
+        """Create a tetromino at the spawn position"""
+        return Tetromino(self.width // 2 - 1, 0, shape_idx)
+
+    def move(self, dx, dy):
+        """Try to move the current piece, returning True on success"""
+        return self.current_piece.move(dx, dy, self.grid)
+
+    def rotate(self):
+        """Try to rotate the current piece"""
+        self.current_piece.rotate(self.grid)
+
+    def lock_piece(self):
+        """Merge the current piece into the grid and bring in the next one, returning the points scored"""
+        self.grid.merge(self.current_piece)
+        lines = len(self.grid.clear_rows())
+
+        # Update score based on lines cleared
+        points = LINE_SCORES.get(lines, 0) * self.level
+        self.score += points
+
+        self.lines_cleared_total += lines
+        self.level = self.lines_cleared_total // 10 + 1
+        self.fall_speed = max(0.1, 0.5 - (self.level - 1) * 0.05)
+
+        # Get the next piece
+        self.current_piece = self.spawn_piece(self.queue.popleft())
+        self.queue.append(self.random_piece())
+
+        # Check for game over
+        piece = self.current_piece
+        if not piece.is_valid_position(piece.x, piece.y, piece.rotation, self.grid):
+            self.game_over = True
+
+        return points
+
+    def add_garbage(self, lines, hole):
+        """Push garbage rows in under the stack, lifting the current piece clear of
+        it, and end the game if the stack or the piece tops out"""
+        if self.grid.add_garbage(lines, hole):
+            self.game_over = True
+        piece = self.current_piece
+        for _ in range(lines):
+            if piece.is_valid_position(piece.x, piece.y, piece.rotation, self.grid):
+                break
+            piece.y -= 1
+        if not piece.is_valid_position(piece.x, piece.y, piece.rotation, self.grid):
+            self.game_over = True
+
+    def hard_drop(self):
+        """Drop the current piece to the bottom and lock it, returning the points scored"""
+        while self.move(0, 1):
+            pass
+        return self.lock_piece()
+
+    def fall(self):
+        """Apply one gravity tick, returning the points scored if the piece locks"""
+        if self.move(0, 1):
+            return 0
+        # The piece can't move down anymore
+        return self.lock_piece()
+
+    def handle(self, action):
+        """Apply a player action, returning the points scored"""
+        if self.game_over:
+            return 0
+        if action == 'left':
+            self.move(-1, 0)
+        elif action == 'right':
+            self.move(1, 0)
+        elif action == 'down':
+            self.move(0, 1)
+        elif action == 'rotate':
+            self.rotate()
+        elif action == 'drop':
+            return self.hard_drop()
+        return 0
+
+    def step(self, action):
+        """Apply an action followed by one gravity tick and return (state, reward, done)"""
+        if isinstance(action, int):
+            action = ACTIONS[action]
+        reward = self.handle(action)
+        if action != 'drop' and not self.game_over:
+            reward += self.fall()
+        return self, reward, self.game_over
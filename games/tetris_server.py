@@ -0,0 +1,549 @@
+import argparse
+import asyncio
+import random
+import socket
+import struct
+import time
+from collections import deque
+
+from tetris_logic import ACTIONS, GRID_WIDTH, GRID_HEIGHT, TetrisLogic, BitGrid, Tetromino, pack_colors, unpack_colors
+
+# Head-to-head Tetris over the network.
+# One asyncio process hosts any number of rooms, each running its players'
+# games on the server, which has the final say on every piece. Clients only
+# send their inputs; the server applies them on the next tick along with
+# gravity, and lines cleared together send garbage rows to the opponents,
+# which rise under their stack when their current piece locks. After every
+# tick each room sends one binary frame, shared by everyone in the room,
+# holding just the pieces and grid rows that changed since the last one.
+#
+#   python tetris_server.py --port 7777
+#   python tetris.py --connect localhost:7777 --room 1
+#
+# Messages are framed by a little-endian byte count (<H) and start with a
+# type byte:
+#
+#   JOIN     client -> server  <BI    room id
+#   INPUT    client -> server  <BB    index into ACTIONS
+#   WELCOME  server -> client  <BBBHH slot in the room, room size, grid width and height
+#   FULL     server -> client  <B     the room has no free slot
+#   LEFT     server -> client  <BB    slot of a player who left the room
+#   FRAME    server -> client  <BIB   tick and the number of player blocks, then per player
+#            <BBBBhhIHBBH slot, flags (1 = game over, 2 = waiting for the match),
+#            shape, rotation, x, y, score, lines, next shape, pending garbage
+#            lines and the number of changed rows, then each changed row as
+#            <H row index and its colors packed by pack_colors
+#
+# Grids are compared to what the last frame sent by the identity of their
+# row lists: the room takes a snapshot of each grid after sending it, so
+# a grid still holding the snapshot's lists has not changed at all, and in
+# one that has, only rows that are different objects need comparing.
+
+TICK_RATE = 30  # Server ticks per second
+ROOM_SIZE = 2  # Players per match
+RESTART_TICKS = 3 * TICK_RATE  # Pause between the end of a match and the next
+MAX_INPUTS = 8  # Inputs queued per player per tick, the rest are dropped
+MAX_BUFFER = 1 << 16  # Unsent bytes after which a client is dropped
+LATENCY_SAMPLES = 1024  # Recent tick latencies kept for percentiles
+
+# Garbage lines sent by clearing 1, 2, 3 or 4 lines at once
+ATTACK = {1: 0, 2: 1, 3: 2, 4: 4}
+
+JOIN, INPUT, WELCOME, FULL, FRAME, LEFT = range(1, 7)
+
+GAME_OVER = 1
+WAITING = 2
+
+LENGTH = struct.Struct('<H')
+JOIN_MESSAGE = struct.Struct('<BI')
+INPUT_MESSAGE = struct.Struct('<BB')
+WELCOME_MESSAGE = struct.Struct('<BBBHH')
+LEFT_MESSAGE = struct.Struct('<BB')
+FRAME_HEADER = struct.Struct('<BIB')
+PLAYER_HEADER = struct.Struct('<BBBBhhIHBBH')
+ROW_INDEX = struct.Struct('<H')
+
+
+class Player:
+    def __init__(self, room, slot, connection):
+        self.room = room
+        self.slot = slot
+        self.connection = connection
+        self.game = TetrisLogic(None, room.width, room.height, generator='bag')
+        self.inputs = []
+        self.gravity = 0  # Ticks since the piece last fell
+        self.garbage = 0  # Lines waiting to rise when the piece locks
+        self.sent_rows = [None] * room.height  # Color rows as of the last frame
+        self.sent_piece = None  # Player header values as of the last frame
+
+    def queue_input(self, action):
+        if len(self.inputs) < MAX_INPUTS:
+            self.inputs.append(action)
+
+
+class Room:
+    # One match. Games start together from a shared seed, so both players
+    # get the same pieces, once the room is full.
+
+    def __init__(self, room_id, width=GRID_WIDTH, height=GRID_HEIGHT, size=ROOM_SIZE, seed=None):
+        self.room_id = room_id
+        self.width = width
+        self.height = height
+        self.size = size
+        self.rng = random.Random(seed)
+        self.players = []
+        self.playing = False
+        self.restart_tick = None
+        self.tick_count = 0
+
+    def join(self, connection):
+        """Add a player on the first free slot, returning it, or None if the room is full"""
+        slots = {player.slot for player in self.players}
+        free = [slot for slot in range(self.size) if slot not in slots]
+        if not free:
+            return None
+        player = Player(self, free[0], connection)
+        self.players.append(player)
+        self.players.sort(key=lambda p: p.slot)
+        connection.send(WELCOME_MESSAGE.pack(WELCOME, player.slot, self.size, self.width, self.height))
+        # Everyone gets the whole room in the next frame, so the new player starts in sync
+        self.resend()
+        self.playing = False
+        if len(self.players) == self.size:
+            self.restart_tick = self.tick_count
+        return player
+
+    def leave(self, player):
+        self.players.remove(player)
+        self.playing = False
+        self.restart_tick = None
+        message = LEFT_MESSAGE.pack(LEFT, player.slot)
+        for other in self.players:
+            other.connection.send(message)
+
+    def resend(self):
+        for player in self.players:
+            player.sent_rows = [None] * self.height
+            player.sent_piece = None
+
+    def start(self):
+        seed = self.rng.getrandbits(64)
+        for player in self.players:
+            player.game.reset(seed)
+            player.inputs.clear()
+            player.gravity = 0
+            player.garbage = 0
+        self.playing = True
+        self.restart_tick = None
+
+    def tick(self):
+        """Advance the match by one tick and send the frame, returning its size in bytes"""
+        self.tick_count += 1
+        if self.playing:
+            self.step()
+        elif self.restart_tick is not None and self.tick_count >= self.restart_tick:
+            self.start()
+        frame = self.encode()
+        if frame is not None:
+            for player in self.players:
+                player.connection.send(frame)
+            return len(frame)
+        return 0
+
+    def step(self):
+        players = self.players
+        for player in players:
+            game = player.game
+            if game.game_over:
+                player.inputs.clear()
+                continue
+            for action in player.inputs:
+                self.play(player, game.handle, action)
+            player.inputs.clear()
+            player.gravity += 1
+            if not game.game_over and player.gravity >= game.fall_speed * TICK_RATE:
+                player.gravity = 0
+                self.play(player, game.fall)
+
+        alive = sum(not player.game.game_over for player in players)
+        if alive <= (1 if len(players) > 1 else 0):
+            self.playing = False
+            self.restart_tick = self.tick_count + RESTART_TICKS
+
+    def play(self, player, move, *args):
+        """Make a move in a player's game, then settle the garbage of any piece it locked"""
+        game = player.game
+        if game.game_over:
+            return
+        piece = game.current_piece
+        lines = game.lines_cleared_total
+        move(*args)
+        if game.current_piece is piece:
+            return
+        # Each lock's clears first cancel the player's own pending garbage,
+        # the rest is sent on
+        attack = ATTACK.get(game.lines_cleared_total - lines, 0)
+        cancelled = min(attack, player.garbage)
+        player.garbage -= cancelled
+        attack -= cancelled
+        if attack:
+            for other in self.players:
+                if other is not player and not other.game.game_over:
+                    other.garbage += attack
+        if player.garbage and not game.game_over:
+            game.add_garbage(player.garbage, self.rng.randrange(self.width))
+            player.garbage = 0
+
+    def encode(self):
+        """Encode the changes since the last frame, or return None if there are none"""
+        blocks = []
+        count = 0
+        waiting = 0 if self.playing else WAITING
+        for player in self.players:
+            game = player.game
+            grid = game.grid
+            piece = game.current_piece
+            header = (piece.shape_idx, piece.rotation, piece.x, piece.y, game.score,
+                      game.lines_cleared_total, game.queue[0], min(player.garbage, 255),
+                      (GAME_OVER if game.game_over else 0) | waiting)
+            sent = player.sent_rows
+            colors = grid.colors
+            if colors is sent:
+                changed = ()
+            else:
+                changed = [i for i, row in enumerate(colors) if row is not sent[i] and row != sent[i]]
+                player.sent_rows = grid.snapshot()[1]
+            if not changed and header == player.sent_piece:
+                continue
+            player.sent_piece = header
+            count += 1
+            shape_idx, rotation, x, y, score, lines, next_idx, garbage, flags = header
+            blocks.append(PLAYER_HEADER.pack(player.slot, flags, shape_idx, rotation, x, y, score,
+                                             lines, next_idx, garbage, len(changed)))
+            for i in changed:
+                blocks.append(ROW_INDEX.pack(i))
+                blocks.append(pack_colors((colors[i],)))
+        if not blocks:
+            return None
+        return FRAME_HEADER.pack(FRAME, self.tick_count, count) + b''.join(blocks)
+
+
+class RemoteBoard:
+    # A player's game as seen by a client, rebuilt from frames. It has the
+    # attributes TetrisRenderer draws from, like a TetrisLogic.
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.grid = BitGrid(width, height)
+        self.current_piece = Tetromino(width // 2 - 1, 0, 0)
+        self.score = 0
+        self.lines_cleared_total = 0
+        self.level = 1
+        self.queue = (0,)
+        self.garbage = 0
+        self.game_over = False
+        self.waiting = True
+
+    @property
+    def next_piece_idx(self):
+        return self.queue[0]
+
+
+class MatchClient:
+    """Decodes the server's messages into a RemoteBoard per slot of the room"""
+
+    def __init__(self):
+        self.slot = None
+        self.boards = []
+        self.full = False
+        self.tick = 0
+
+    @property
+    def board(self):
+        """The board of this client's own player"""
+        return self.boards[self.slot]
+
+    def feed(self, message):
+        kind = message[0]
+        if kind == FRAME:
+            self.apply_frame(message)
+        elif kind == WELCOME:
+            _, self.slot, size, width, height = WELCOME_MESSAGE.unpack(message)
+            self.width = width
+            self.height = height
+            self.boards = [RemoteBoard(width, height) for _ in range(size)]
+        elif kind == FULL:
+            self.full = True
+        elif kind == LEFT:
+            # The slot is empty until someone else joins, whose frames fill it again
+            _, slot = LEFT_MESSAGE.unpack(message)
+            self.boards[slot] = RemoteBoard(self.width, self.height)
+
+    def apply_frame(self, data):
+        _, self.tick, count = FRAME_HEADER.unpack_from(data)
+        offset = FRAME_HEADER.size
+        row_size = (self.width + 1) // 2
+        for _ in range(count):
+            (slot, flags, shape_idx, rotation, x, y, score, lines, next_idx, garbage,
+             changed) = PLAYER_HEADER.unpack_from(data, offset)
+            offset += PLAYER_HEADER.size
+            board = self.boards[slot]
+            grid = board.grid
+            for _ in range(changed):
+                i = ROW_INDEX.unpack_from(data, offset)[0]
+                offset += ROW_INDEX.size
+                row = unpack_colors(data[offset:offset + row_size], self.width, 1)[0]
+                offset += row_size
+                grid.colors[i] = row
+                grid.rows[i] = sum(1 << j for j, color in enumerate(row) if color)
+            if changed:
+                grid.forget_columns()
+            # A new piece object for a new shape, so the renderer repaints it
+            piece = board.current_piece
+            if piece.shape_idx != shape_idx:
+                piece = board.current_piece = Tetromino(x, y, shape_idx)
+            piece.x = x
+            piece.y = y
+            piece.rotation = rotation
+            board.score = score
+            board.lines_cleared_total = lines
+            board.level = lines // 10 + 1
+            board.queue = (next_idx,)
+            board.garbage = garbage
+            board.game_over = bool(flags & GAME_OVER)
+            board.waiting = bool(flags & WAITING)
+
+
+def join_message(room_id):
+    return JOIN_MESSAGE.pack(JOIN, room_id)
+
+
+def input_message(action):
+    """Encode an action, by name or index into ACTIONS"""
+    if isinstance(action, str):
+        action = ACTIONS.index(action)
+    return INPUT_MESSAGE.pack(INPUT, action)
+
+
+class LoopbackConnection:
+    # Stands in for a socket: messages sent to the client are decoded
+    # straight away by a MatchClient (unless decode is False), with their
+    # sizes kept for stats
+
+    def __init__(self, decode=True):
+        self.client = MatchClient() if decode else None
+        self.sent = 0
+        self.closed = False
+
+    def send(self, message):
+        self.sent += len(message)
+        if self.client is not None:
+            self.client.feed(message)
+
+    def close(self):
+        self.closed = True
+
+
+class StreamConnection:
+    # A client connected over asyncio streams
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.closed = False
+
+    def send(self, message):
+        if self.closed:
+            return
+        # A client that stops reading is dropped instead of buffering without bound
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.close()
+            return
+        self.writer.write(LENGTH.pack(len(message)) + message)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+
+class TetrisServer:
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT, room_size=ROOM_SIZE, seed=None):
+        self.width = width
+        self.height = height
+        self.room_size = room_size
+        self.rng = random.Random(seed)
+        self.rooms = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.ticks = 0
+
+    def join(self, room_id, connection):
+        """Put a connection in a room, creating it if needed; returns the Player or None if the room is full"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room(room_id, self.width, self.height, self.room_size,
+                                              self.rng.getrandbits(64))
+        player = room.join(connection)
+        if player is None:
+            connection.send(bytes((FULL,)))
+        return player
+
+    def leave(self, player):
+        room = player.room
+        room.leave(player)
+        if not room.players:
+            del self.rooms[room.room_id]
+
+    def tick(self):
+        """Advance every room by one tick"""
+        self.ticks += 1
+        for room in list(self.rooms.values()):
+            room.tick()
+
+    def latency_percentiles(self, percentiles=(50, 90, 99, 100)):
+        """Recent tick latencies in seconds, from the scheduled start of a tick to its end, by percentile"""
+        samples = sorted(self.latencies)
+        if not samples:
+            return {}
+        return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] for p in percentiles}
+
+    async def run(self, host='127.0.0.1', port=7777):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await self.run_ticks()
+
+    async def run_ticks(self):
+        """Tick at TICK_RATE, catching up on the schedule when a tick runs late"""
+        clock = asyncio.get_running_loop().time
+        interval = 1 / TICK_RATE
+        scheduled = clock()
+        while True:
+            self.tick()
+            now = clock()
+            self.latencies.append(now - scheduled)
+            scheduled += interval
+            if scheduled < now:
+                scheduled = now
+            await asyncio.sleep(scheduled - now)
+
+    async def handle(self, reader, writer):
+        connection = StreamConnection(writer)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        player = None
+        try:
+            while not connection.closed:
+                size = LENGTH.unpack(await reader.readexactly(LENGTH.size))[0]
+                message = await reader.readexactly(size)
+                kind = message[0] if message else 0
+                if kind == INPUT and player is not None and len(message) == INPUT_MESSAGE.size:
+                    action = message[1]
+                    if action < len(ACTIONS):
+                        player.queue_input(ACTIONS[action])
+                elif kind == JOIN and player is None and len(message) == JOIN_MESSAGE.size:
+                    player = self.join(JOIN_MESSAGE.unpack(message)[1], connection)
+                    if player is None:
+                        break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if player is not None:
+                self.leave(player)
+            connection.close()
+
+
+class NetworkClient(MatchClient):
+    """A MatchClient on a non-blocking socket, polled from a game loop"""
+
+    def __init__(self, host, port, room_id):
+        super().__init__()
+        self.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.setblocking(False)
+        self.buffer = bytearray()
+        self.connected = True
+        self.send(join_message(room_id))
+
+    def send(self, message):
+        try:
+            self.socket.sendall(LENGTH.pack(len(message)) + message)
+        except BlockingIOError:
+            pass
+
+    def send_input(self, action):
+        self.send(input_message(action))
+
+    def poll(self):
+        """Apply every message received so far"""
+        while True:
+            try:
+                data = self.socket.recv(1 << 16)
+            except BlockingIOError:
+                break
+            if not data:
+                self.connected = False
+                break
+            self.buffer += data
+        buffer = self.buffer
+        offset = 0
+        while len(buffer) - offset >= LENGTH.size:
+            size = LENGTH.unpack_from(buffer, offset)[0]
+            if len(buffer) - offset - LENGTH.size < size:
+                break
+            self.feed(bytes(buffer[offset + LENGTH.size:offset + LENGTH.size + size]))
+            offset += LENGTH.size + size
+        del buffer[:offset]
+
+    def close(self):
+        self.socket.close()
+
+
+def simulate(rooms, ticks, seed=0, decode=False):
+    """Run rooms of loopback players pressing random keys for some ticks, returning
+    (the server, seconds per tick as a sorted list)"""
+    rng = random.Random(seed)
+    server = TetrisServer(seed=seed)
+    players = [server.join(room_id, LoopbackConnection(decode))
+               for room_id in range(rooms) for _ in range(server.room_size)]
+    times = []
+    for _ in range(ticks):
+        for player in players:
+            if rng.random() < 0.3:
+                player.queue_input(rng.choice(ACTIONS))
+        start = time.perf_counter()
+        server.tick()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return server, times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host head-to-head Tetris matches")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--simulate', type=int, metavar='ROOMS',
+                        help="time ticks of this many loopback rooms instead of serving")
+    parser.add_argument('--ticks', type=int, default=10 * TICK_RATE)
+    args = parser.parse_args(argv)
+
+    if args.simulate:
+        server, times = simulate(args.simulate, args.ticks)
+        budget = 1 / TICK_RATE
+        print(f"{args.simulate} rooms, {args.ticks} ticks")
+        for p in (50, 90, 99, 100):
+            latency = times[min(len(times) - 1, len(times) * p // 100)]
+            print(f"  p{p}: {latency * 1000:.2f} ms ({latency / budget:.0%} of the tick)")
+        return
+
+    server = TetrisServer()
+    print(f"Serving Tetris on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.run(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    latencies = server.latency_percentiles()
+    if latencies:
+        print("Tick latency: " + ", ".join(f"p{p} {latency * 1000:.2f} ms" for p, latency in latencies.items()))
+
+
+if __name__ == "__main__":
+    main()
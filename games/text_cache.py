@@ -0,0 +1,64 @@
+import pygame
+from collections import OrderedDict
+
+# Shared cache of fonts and rendered text surfaces for all the games.
+# Looking up a SysFont and rendering text both cost far more than a blit, so
+# fonts are created once per (name, size) and labels are rendered once per
+# (name, size, text, color) and kept in a bounded LRU.
+
+
+class TextCache:
+    def __init__(self, max_labels=512):
+        self.max_labels = max_labels
+        self.fonts = {}
+        self.labels = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, name, size):
+        """Return the font for a name and size (None is pygame's default font)"""
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            if name is None:
+                font = pygame.font.Font(None, size)
+            else:
+                font = pygame.font.SysFont(name, size)
+            self.fonts[key] = font
+        return font
+
+    def render(self, name, size, text, color):
+        """Return an antialiased surface of the text, rendering it only on a cache miss"""
+        key = (name, size, text, color)
+        labels = self.labels
+        surface = labels.get(key)
+        if surface is not None:
+            labels.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.font(name, size).render(text, True, color)
+        labels[key] = surface
+        if len(labels) > self.max_labels:
+            labels.popitem(last=False)
+        return surface
+
+    def clear(self):
+        """Drop all cached fonts and labels"""
+        self.fonts.clear()
+        self.labels.clear()
+
+
+# The cache used by all the games
+TEXT_CACHE = TextCache()
+
+
+def get_font(name, size):
+    """Return a cached font from the shared cache"""
+    return TEXT_CACHE.font(name, size)
+
+
+def render_text(name, size, text, color):
+    """Render text through the shared cache"""
+    return TEXT_CACHE.render(name, size, text, color)
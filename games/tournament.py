@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from scores import game_stats
+
+# Tournament runner for the game-playing agents.
+# Every (agent, seed) pair is one game, played headless on the logic classes
+# in a pool of worker processes. Seeds are handed out in chunks so workers
+# stay busy without a round trip per game, and each finished game is
+# appended to a JSON lines results file as soon as its chunk comes back.
+# Games already in the file are skipped, so an interrupted run picks up
+# where it stopped when started again with the same file.
+#
+#   python tournament.py --agents 2048-expectimax tetris-greedy --seeds 0:10000 --output results.jsonl
+
+MAX_MOVES = 100000  # Games still going after this many moves are stopped
+CHUNK_SIZE = 16  # Games per job sent to a worker
+AGENT_SEED = 0x5EED  # Mixed into the game seed for the agent's own randomness
+
+
+def random_2048(seed):
+    from game2048_logic import ACTIONS
+    rng = random.Random(seed ^ AGENT_SEED)
+
+    def play(game):
+        game.make_move(rng.choice(ACTIONS))
+    return play
+
+
+def expectimax_2048(depth):
+    def agent(seed):
+        from ai2048 import Expectimax
+        # A depth limit instead of a time budget keeps results reproducible
+        solver = Expectimax(max_depth=depth)
+
+        def play(game):
+            move = solver.best_move(game.bits, time_budget_ms=float('inf'))
+            if move is None:
+                game.game_over = True
+            else:
+                game.make_move(move)
+        return play
+    return agent
+
+
+def random_tetris(seed):
+    from tetris_ai import play_move
+    rng = random.Random(seed ^ AGENT_SEED)
+
+    def play(game):
+        play_move(game, rng.randrange(4), rng.randint(-1, game.grid.width - 1))
+    return play
+
+
+def bot_tetris(lookahead, preview=1):
+    def agent(seed):
+        from tetris_ai import TetrisBot
+        bot = TetrisBot(lookahead=lookahead, seed=seed, preview=preview)
+
+        def play(game):
+            bot.play(game)
+        return play
+    return agent
+
+
+def random_snake(seed):
+    from snake_logic import ACTIONS
+    rng = random.Random(seed ^ AGENT_SEED)
+
+    def play(game):
+        game.step(rng.choice(ACTIONS))
+    return play
+
+
+def greedy_snake(seed):
+    from snake_logic import UP, DOWN, LEFT, RIGHT, OPPOSITE
+
+    def play(game):
+        # Head for the food along the shortest wrapped distance, avoiding the body
+        snake = game.snake
+        head_x, head_y = snake.positions[0]
+        food_x, food_y = game.food.position
+        best = None
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            if direction == OPPOSITE[snake.direction]:
+                continue
+            x = (head_x + direction[0]) % snake.width
+            y = (head_y + direction[1]) % snake.height
+            dx = abs(x - food_x)
+            dy = abs(y - food_y)
+            distance = min(dx, snake.width - dx) + min(dy, snake.height - dy)
+            blocked = snake.occupancy[y * snake.width + x] and (x, y) != snake.positions[-1]
+            key = (blocked, distance)
+            if best is None or key < best[0]:
+                best = (key, direction)
+        game.step(best[1])
+    return play
+
+
+# Agent name -> (game, factory taking a seed and returning a function that makes one move)
+AGENTS = {
+    '2048-random': ('2048', random_2048),
+    '2048-expectimax': ('2048', expectimax_2048(2)),
+    '2048-expectimax-3': ('2048', expectimax_2048(3)),
+    'tetris-random': ('tetris', random_tetris),
+    'tetris-greedy': ('tetris', bot_tetris(False)),
+    'tetris-lookahead': ('tetris', bot_tetris(True)),
+    'tetris-plan-2': ('tetris', bot_tetris(True, preview=2)),
+    'snake-random': ('snake', random_snake),
+    'snake-greedy': ('snake', greedy_snake),
+}
+
+
+def new_game(name, seed):
+    if name == '2048':
+        from game2048_logic import Game2048Logic
+        return Game2048Logic(seed)
+    if name == 'tetris':
+        from tetris_logic import TetrisLogic
+        return TetrisLogic(seed)
+    from snake_logic import SnakeLogic
+    return SnakeLogic(seed)
+
+
+def play_game(agent, seed, max_moves=MAX_MOVES):
+    """Play one seeded game with an agent and return its result"""
+    name, factory = AGENTS[agent]
+    start = time.perf_counter()
+    game = new_game(name, seed)
+    play = factory(seed)
+    moves = 0
+    while not game.game_over and moves < max_moves:
+        play(game)
+        moves += 1
+    result = {'agent': agent, 'game': name, 'seed': seed, 'score': game.score}
+    result.update(game_stats(name, game))
+    result['moves'] = moves
+    result['finished'] = game.game_over
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def play_chunk(agent, seeds, max_moves):
+    """Worker job: play a run of seeds with one agent"""
+    return [play_game(agent, seed, max_moves) for seed in seeds]
+
+
+def load_results(path):
+    """Read the results recorded so far, skipping a line cut off by an interruption"""
+    results = []
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                continue
+    return results
+
+
+def run_tournament(agents, seeds, path, workers=None, chunk_size=CHUNK_SIZE,
+                   max_moves=MAX_MOVES, progress=None):
+    """Play every agent on every seed, appending results to path, and return how many games were played"""
+    done = {(result['agent'], result['seed']) for result in load_results(path)}
+    jobs = []
+    for agent in agents:
+        todo = [seed for seed in seeds if (agent, seed) not in done]
+        for i in range(0, len(todo), chunk_size):
+            jobs.append((agent, todo[i:i + chunk_size]))
+    if not jobs:
+        return 0
+
+    # Start on a fresh line if the last run was cut off mid-write
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            partial = f.read(1) != b'\n'
+    else:
+        partial = False
+
+    played = 0
+    total = sum(len(seeds) for _, seeds in jobs)
+    workers = workers or os.cpu_count()
+    with open(path, 'a') as out, ProcessPoolExecutor(workers) as pool:
+        if partial:
+            out.write('\n')
+        jobs.reverse()
+        pending = set()
+        while jobs or pending:
+            # Keep a few jobs queued per worker, not all of them at once
+            while jobs and len(pending) < workers * 4:
+                agent, chunk = jobs.pop()
+                pending.add(pool.submit(play_chunk, agent, chunk, max_moves))
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for result in future.result():
+                    out.write(json.dumps(result) + '\n')
+                    played += 1
+                out.flush()
+            if progress is not None:
+                progress(played, total)
+    return played
+
+
+def summarize(results):
+    """Per-agent statistics of a list of results"""
+    by_agent = {}
+    for result in results:
+        by_agent.setdefault(result['agent'], []).append(result)
+    summary = {}
+    for agent, games in sorted(by_agent.items()):
+        scores = [game['score'] for game in games]
+        summary[agent] = {
+            'games': len(games),
+            'mean_score': statistics.fmean(scores),
+            'median_score': statistics.median(scores),
+            'max_score': max(scores),
+            'mean_moves': statistics.fmean(game['moves'] for game in games),
+            'games_per_sec': len(games) / max(sum(game['seconds'] for game in games), 1e-9),
+        }
+    return summary
+
+
+def parse_seeds(text):
+    """Seeds as 'start:stop' or a comma separated list"""
+    if ':' in text:
+        start, stop = text.split(':')
+        return list(range(int(start), int(stop)))
+    return [int(seed) for seed in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play seeded games with AI agents across a process pool")
+    parser.add_argument('--agents', nargs='+', choices=sorted(AGENTS), required=True)
+    parser.add_argument('--seeds', type=parse_seeds, default=parse_seeds('0:100'),
+                        help="start:stop or a comma separated list (default 0:100)")
+    parser.add_argument('--output', default='results.jsonl', help="append-only JSON lines results file")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--max-moves', type=int, default=MAX_MOVES)
+    args = parser.parse_args(argv)
+
+    def progress(played, total):
+        print(f"\r{played}/{total} games", end='', file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    played = run_tournament(args.agents, args.seeds, args.output, args.workers,
+                            args.chunk_size, args.max_moves, progress)
+    elapsed = time.perf_counter() - start
+    print(f"\nPlayed {played} games in {elapsed:.1f}s", file=sys.stderr)
+
+    results = [result for result in load_results(args.output) if result['agent'] in args.agents]
+    json.dump(summarize(results), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()